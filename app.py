@@ -1,13 +1,19 @@
-import streamlit as st
-import pandas as pd
-import os	
-from components.navbar import create_navbar
-from components.general_overview import render_overview
-from components.criteria_functions_overview import render_criteria_functions
-from components.trend_detection_overview import render_trend_detection
-from components.ngram_input import render_ngram_input
-from utils.data_loader import load_data
-from settings import NGRAM_DATASET_PATH
+from utils.startup_timing import timed, log_startup_report, startup_report
+
+with timed("import streamlit, pandas"):
+    import streamlit as st
+    import pandas as pd
+    import os	
+
+# Heavy analysis libraries (statsmodels, scikit-learn, umap, scipy.stats) are
+# imported lazily by the methods that use them, not here
+with timed("import components"):
+    from components.navbar import create_navbar
+    from components.criteria_functions_overview import render_criteria_functions
+    from components.trend_detection_overview import render_trend_detection
+    from components.ngram_input import render_ngram_input
+    from utils.data_loader import load_data
+    from settings import NGRAM_DATASET_PATH, NGRAM_PICKLE_PATH
 
 def main():
     # Set page config
@@ -62,10 +68,13 @@ def main():
     # Load data
     try:
         with st.spinner("Loading data..."):
-            df = load_data(path=NGRAM_DATASET_PATH)
+            # Prefer the memory-mapped store, fall back to the original pickle
+            dataset_path = NGRAM_DATASET_PATH if os.path.isdir(NGRAM_DATASET_PATH) else NGRAM_PICKLE_PATH
+            with timed("load dataset"):
+                dataset = load_data(path=dataset_path)
             
             # Validate that we have data
-            if df is None or df.empty:
+            if dataset is None or dataset.empty:
                 st.error("Failed to load data. Please check your data source.")
                 st.stop()
     except Exception as e:
@@ -76,15 +85,24 @@ def main():
     selected_page = create_navbar()
     
     # Render the consistent n-gram input component
-    validated_ngram = render_ngram_input(df)
+    validated_ngram = render_ngram_input(dataset)
     
-    # Render the selected page
+    # Render the selected page, only the overview materializes the full matrix
     # if selected_page == "General Overview":
-    #     render_overview(df)
+    #     from components.general_overview import render_overview
+    #     render_overview(dataset)
     if selected_page == "Criteria Functions":
-        render_criteria_functions(df)
+        render_criteria_functions(dataset)
     elif selected_page == "Trend Detection":
-        render_trend_detection(df)
+        render_trend_detection(dataset)
+
+    # Report the cold-start cost of this process
+    log_startup_report()
+    with st.sidebar.expander("Startup timing", expanded=False):
+        st.table(pd.DataFrame(
+            [(phase, round(seconds * 1000, 1)) for phase, seconds in startup_report()],
+            columns=["Phase", "ms"]
+        ))
     
 if __name__ == "__main__":
     # Create required directories
@@ -8,17 +8,18 @@ from methods.criteria_functions.exponential_smoothing import plot_exponential_sm
 from methods.criteria_functions.seasonal_decomposition import plot_seasonal_decomposition
 from methods.criteria_functions.macd import plot_macd
 from utils.helper_functions import plot_original_series
+from settings import EXP_SMOOTHING_ENGINE
 
-def render_criteria_functions(df):
+def render_criteria_functions(dataset):
     """
     Render the N-gram Analysis page
     
     Args:
-        df (pd.DataFrame): DataFrame with n-grams as index and quarters as columns
+        dataset (NgramDataset): Dataset handle with n-grams as index and quarters as columns
     """
     st.header("Criteria Functions")
     
-    if df is None or df.empty:
+    if dataset is None or dataset.empty:
         st.error("No data available for analysis.")
         return
     
@@ -50,6 +51,8 @@ def render_criteria_functions(df):
     if st.session_state.show_analysis:
         original_index = st.session_state.original_ngram_index
         ngram_series = st.session_state.ngram_series
+        # Fits are cached under the version of the store the series came from
+        ngram_version = st.session_state.get('ngram_version')
         
         # Plot original series first
         with st.spinner("Rendering original series..."):
@@ -99,7 +102,9 @@ def render_criteria_functions(df):
                         ngram_series,
                         trend=selected_criteria.get('exp_trend', 'add'),
                         seasonal=selected_criteria.get('exp_seasonal', 'add'),
-                        seasonal_periods=selected_criteria.get('exp_seasonal_period', 4)
+                        seasonal_periods=selected_criteria.get('exp_seasonal_period', 4),
+                        engine=selected_criteria.get('exp_engine', EXP_SMOOTHING_ENGINE),
+                        dataset_version=ngram_version
                     ) 
                     
                     st.plotly_chart(exp_smoothing_fig, use_container_width=True)
@@ -115,7 +120,8 @@ def render_criteria_functions(df):
                         original_index, 
                         ngram_series,
                         model=selected_criteria.get('seasonal_model', 'additive'),
-                        period=selected_criteria.get('seasonal_period', 4)
+                        period=selected_criteria.get('seasonal_period', 4),
+                        dataset_version=ngram_version
                     )
                     
                     st.plotly_chart(seasonal_fig, use_container_width=True)
@@ -4,21 +4,25 @@ import numpy as np
 import plotly.express as px
 from methods.dimensionality import (
     compute_pca, 
+    compute_pca_out_of_core,
+    fits_in_memory,
+    sample_embedding,
     compute_tsne, 
     compute_umap, 
     plot_dimensionality_reduction,
     plot_explained_variance
 )
 from methods.reconstruction import reconstruct_from_pca, plot_original_vs_reconstructed
+from settings import PCA_PLOT_MAX_POINTS
 
-def render_overview(df):
+def render_overview(dataset):
     """
     Render the General Overview page
     
     Args:
-        df (pd.DataFrame): DataFrame with n-grams as index and quarters as columns
+        dataset (NgramDataset): Lazy handle over the n-gram frequency matrix
     """
-    if df is None or df.empty:
+    if dataset is None or dataset.empty:
         st.error("No data available for analysis.")
         return
         
@@ -26,26 +30,38 @@ def render_overview(df):
     
     # Use the shared n-gram from session state
     ngram_input = st.session_state.shared_ngram
+    ngram_row = dataset.row_offset(ngram_input) if ngram_input else None
+    
+    # Placeholders (empty plots), kept where a reduction is not computed
+    pca_df = pd.DataFrame(columns=["PC1", "PC2"], index=pd.Index([], name="n-gram"))
+    pca_model = None
+    pca_embedding = None
+    explained_variance = np.array([])
+    tsne_df = pd.DataFrame(columns=["TSNE1", "TSNE2"], index=pd.Index([], name="n-gram"))
+    umap_df = pd.DataFrame(columns=["UMAP1", "UMAP2"], index=pd.Index([], name="n-gram"))
     
     # Compute dimensionality reductions with loading indicators
     try:
-        with st.spinner("Computing PCA..."):
-            pca_df, pca_model, explained_variance = compute_pca(df)
-            
-        with st.spinner("Computing t-SNE..."):
-            tsne_df = compute_tsne(df)
-            
-        with st.spinner("Computing UMAP..."):
-            umap_df = compute_umap(df)
+        if fits_in_memory(dataset):
+            df = dataset.to_frame()
+            with st.spinner("Computing PCA..."):
+                pca_df, pca_model, explained_variance = compute_pca(df, dataset.version)
+                
+            with st.spinner("Computing t-SNE..."):
+                tsne_df = compute_tsne(df, dataset.version)
+                
+            with st.spinner("Computing UMAP..."):
+                umap_df = compute_umap(df, dataset.version)
+        else:
+            # Larger than memory: PCA streams row chunks from disk, t-SNE and UMAP need the full matrix
+            with st.spinner("Computing PCA out of core..."):
+                pca_embedding, pca_model, explained_variance = compute_pca_out_of_core(dataset, dataset.version)
+                pca_df = sample_embedding(dataset, pca_embedding, PCA_PLOT_MAX_POINTS, ngram_input)
+            st.info(f"The dataset does not fit in memory: the PCA plot shows {len(pca_df):,} of "
+                    f"{len(dataset):,} n-grams, t-SNE and UMAP are not computed.")
     except Exception as e:
         st.error(f"Error in dimensionality reduction: {e}")
         st.warning("Using placeholder visualizations instead.")
-        # Create empty DataFrames for placeholders
-        pca_df = pd.DataFrame(columns=["PC1", "PC2"])
-        pca_model = None
-        explained_variance = np.array([])
-        tsne_df = pd.DataFrame(columns=["TSNE1", "TSNE2"])
-        umap_df = pd.DataFrame(columns=["UMAP1", "UMAP2"])
     
     # Create three columns for the visualizations
     col1, col2, col3 = st.columns(3)
@@ -57,7 +73,7 @@ def render_overview(df):
         pca_fig = plot_dimensionality_reduction(
             pca_df, 
             "PCA of N-gram Time Series",
-            highlight_ngram=ngram_input if ngram_input in df.index else None
+            highlight_ngram=ngram_input if ngram_row is not None else None
         )
         st.plotly_chart(pca_fig, use_container_width=True)
         
@@ -72,7 +88,7 @@ def render_overview(df):
         tsne_fig = plot_dimensionality_reduction(
             tsne_df, 
             "t-SNE of N-gram Time Series",
-            highlight_ngram=ngram_input if ngram_input in df.index else None
+            highlight_ngram=ngram_input if ngram_row is not None else None
         )
         st.plotly_chart(tsne_fig, use_container_width=True)
     
@@ -83,29 +99,31 @@ def render_overview(df):
         umap_fig = plot_dimensionality_reduction(
             umap_df, 
             "UMAP of N-gram Time Series",
-            highlight_ngram=ngram_input if ngram_input in df.index else None
+            highlight_ngram=ngram_input if ngram_row is not None else None
         )
         st.plotly_chart(umap_fig, use_container_width=True)
     
     # Show reconstruction if an n-gram is selected and PCA model exists
-    if ngram_input and ngram_input in df.index and pca_model is not None:
+    if ngram_row is not None and pca_model is not None:
         st.header(f"Time Series Reconstruction for '{ngram_input}'")
         
         try:
             with st.spinner("Computing reconstruction..."):
                 # Get the original time series
-                original_series = df.loc[ngram_input].values
+                original_series = dataset.get_row(ngram_row)
                 
-                # Get the reconstructed time series from PCA
-                ngram_idx = df.index.get_loc(ngram_input)
-                reconstructed_series = reconstruct_from_pca(pca_model, ngram_idx, df)
+                # Get the reconstructed time series from PCA, out of core from the saved embedding
+                if pca_embedding is not None:
+                    reconstructed_series = pca_model.inverse_transform(pca_embedding[ngram_row:ngram_row + 1])[0]
+                else:
+                    reconstructed_series = reconstruct_from_pca(pca_model, ngram_row, df)
                 
                 # Plot original vs. reconstructed
                 reconstruction_fig = plot_original_vs_reconstructed(
                     original_series, 
                     reconstructed_series, 
                     ngram_input,
-                    df.columns.tolist()
+                    dataset.columns.tolist()
                 )
                 
                 st.plotly_chart(reconstruction_fig, use_container_width=True)
@@ -1,4 +1,14 @@
 import streamlit as st
+from utils.data_loader import (
+    find_sharded_ngram,
+    load_exact_index,
+    load_substring_index,
+    load_fuzzy_index,
+    load_prefix_index,
+)
+from utils.ngram_index import lookup_exact, search_substring, search_fuzzy, complete_prefix
+from settings import PARTIAL_MATCH_LIMIT, FUZZY_MATCH_LIMIT, EXP_SMOOTHING_ENGINE
+from utils.ngram_shards import ngram_order, ngram_key
 
 def init_analysis_params():
     defaults = {
@@ -11,6 +21,7 @@ def init_analysis_params():
         'signal_period': 3,
         'macd_threshold': 2.0,
         'exp_smoothing': True,
+        'exp_engine': EXP_SMOOTHING_ENGINE,
         'exp_trend': 'add',
         'exp_seasonal': 'add',
         'exp_seasonal_period': 4,
@@ -27,29 +38,35 @@ def init_analysis_params():
         if k not in st.session_state.selected_criteria:
             st.session_state.selected_criteria[k] = v
 
-def validate_ngram_input(df, ngram_input):
+def validate_ngram_input(dataset, ngram_input):
     if not ngram_input:
         return False, None, []
     
-    exact_match_found = False
-    original_index = None
+    # Constant-time lookup in the case-folded index of this dataset version
+    original_index, _ = lookup_exact(load_exact_index(dataset, dataset.version), dataset.vocab, ngram_input)
     
-    for idx in df.index:
-        if str(idx).lower() == ngram_input.lower():
-            exact_match_found = True
-            original_index = idx
-            break
-    
-    if not exact_match_found:
-        partial_matches = [
-            str(idx) for idx in df.index 
-            if ngram_input.lower() in str(idx).lower() and str(idx).lower() != ngram_input.lower()
-        ]
+    if original_index is None:
+        # Autocomplete first, then the most frequent n-grams containing the input
+        # (inputs shorter than a trigram are served by the prefix index alone)
+        rows = complete_prefix(load_prefix_index(dataset, dataset.version), ngram_input, k=PARTIAL_MATCH_LIMIT)
+        if len(rows) < PARTIAL_MATCH_LIMIT and len(ngram_key(ngram_input)) >= 3:
+            contained = search_substring(load_substring_index(dataset, dataset.version), ngram_input, k=PARTIAL_MATCH_LIMIT)
+            rows += [row for row in contained if row not in rows][:PARTIAL_MATCH_LIMIT - len(rows)]
+        partial_matches = [str(dataset.vocab[row]) for row in rows]
         return False, None, partial_matches
     
     return True, original_index, []
 
-def render_ngram_input(df):
+def suggest_corrections(dataset, ngram_input):
+    # "Did you mean" candidates within two edits, from the deletion index
+    if not ngram_input or ngram_order(ngram_input) > 1:
+        return []
+    # Two edits turn almost any short word into another one
+    max_distance = 1 if len(ngram_input) <= 4 else 2
+    rows = search_fuzzy(load_fuzzy_index(dataset, dataset.version), ngram_input, k=FUZZY_MATCH_LIMIT, max_distance=max_distance)
+    return [str(dataset.vocab[row]) for row in rows]
+
+def render_ngram_input(dataset):
     # Initialize session state variables
     if 'shared_ngram' not in st.session_state:
         st.session_state.shared_ngram = ""
@@ -57,6 +74,15 @@ def render_ngram_input(df):
         st.session_state.ngram_series = None
     if 'original_ngram_index' not in st.session_state:
         st.session_state.original_ngram_index = None
+    # Version of the store the series was read from (the dataset or a shard), caches are keyed by it
+    if 'ngram_version' not in st.session_state:
+        st.session_state.ngram_version = None
+
+    # A new dataset version invalidates the series read from the previous one
+    if dataset is not None and st.session_state.get('dataset_version') != dataset.version:
+        st.session_state.dataset_version = dataset.version
+        st.session_state.ngram_series = None
+        st.session_state.original_ngram_index = None
 
     # Initialize analysis parameters
     init_analysis_params()
@@ -83,7 +109,13 @@ def render_ngram_input(df):
             st.session_state.original_ngram_index = None
             st.rerun()
 
-        is_valid, original_index, partial_matches = validate_ngram_input(df, ngram_input)
+        # Longer n-grams are looked up in their shard only
+        sharded_series = None
+        if ngram_order(ngram_input) > 1:
+            original_index, sharded_series, shard_version = find_sharded_ngram(ngram_input)
+            is_valid, partial_matches = original_index is not None, []
+        else:
+            is_valid, original_index, partial_matches = validate_ngram_input(dataset, ngram_input)
 
         if ngram_input:
             if is_valid:
@@ -91,7 +123,12 @@ def render_ngram_input(df):
 
                 if st.session_state.original_ngram_index != original_index:
                     st.session_state.original_ngram_index = original_index
-                    st.session_state.ngram_series = df.loc[original_index]
+                    if sharded_series is not None:
+                        st.session_state.ngram_series = sharded_series
+                        st.session_state.ngram_version = shard_version
+                    else:
+                        st.session_state.ngram_series = dataset.get_series(original_index)
+                        st.session_state.ngram_version = dataset.version
 
                 if st.session_state.original_ngram_index:
 
@@ -218,6 +255,20 @@ def render_ngram_input(df):
                             )
                             
                             if show_exp_smoothing:
+                                engine_options = ["statsmodels", "native"]
+                                
+                                # Set initial widget value
+                                if "widget_exp_engine" not in st.session_state:
+                                    st.session_state["widget_exp_engine"] = st.session_state.selected_criteria['exp_engine']
+                                    
+                                st.selectbox(
+                                    "Engine",
+                                    options=engine_options,
+                                    format_func=lambda engine: "Statsmodels" if engine == "statsmodels" else "Native (vectorized)",
+                                    key="widget_exp_engine",
+                                    on_change=update_param("exp_engine")
+                                )
+
                                 col1, col2 = st.columns(2)
                                 with col1:
                                     trend_options = [None, "add", "mul"]
@@ -362,18 +413,25 @@ def render_ngram_input(df):
                 st.session_state.ngram_series = None
                 st.session_state.original_ngram_index = None
 
+                corrections = [ngram for ngram in suggest_corrections(dataset, ngram_input) if ngram not in partial_matches]
+                if corrections:
+                    st.write("Did you mean:")
+                    cols = st.columns(len(corrections))
+                    for i, ngram in enumerate(corrections):
+                        with cols[i]:
+                            if st.button(ngram, key=f"btn_fuzzy_{ngram}_{i}"):
+                                st.session_state.shared_ngram = ngram
+                                st.rerun()
+
                 if partial_matches:
-                    if len(partial_matches) < 20:
-                        st.write("Similar matches:")
-                        cols = st.columns(min(5, len(partial_matches)))
-                        for i, ngram in enumerate(partial_matches[:20]):
-                            with cols[i % len(cols)]:
-                                if st.button(ngram, key=f"btn_{ngram}_{i}"):
-                                    st.session_state.shared_ngram = ngram
-                                    st.rerun()
-                    else:
-                        st.info(f"Found {len(partial_matches)} similar matches. Please refine your search.")
-                else:
+                    st.write("Similar matches:")
+                    cols = st.columns(min(5, len(partial_matches)))
+                    for i, ngram in enumerate(partial_matches):
+                        with cols[i % len(cols)]:
+                            if st.button(ngram, key=f"btn_{ngram}_{i}"):
+                                st.session_state.shared_ngram = ngram
+                                st.rerun()
+                elif not corrections:
                     st.warning(f"No n-grams found matching '{ngram_input}'")
 
     return None
\ No newline at end of file
@@ -2,91 +2,96 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import math
+import json
+import time
 import plotly.graph_objects as go
 from methods.criteria_functions.percent_change import calculate_pct
 from methods.criteria_functions.macd import calculate_macd
 from methods.criteria_functions.exponential_smoothing import calculate_exponential_smoothing
 from methods.criteria_functions.seasonal_decomposition import calculate_seasonal_decomposition
+from methods.signal_cube import cube_config, native_config, model_config, cube_trends
+from methods.leaderboard import leaderboard_config, top_k
+from methods.trend_zones import z_trend_line as compute_z_trend_line, trend_zones
 from utils.helper_functions import zs
+from utils.data_loader import find_signal_cube, find_leaderboard, leaderboard_job, start_leaderboard_job
 
-def analyze_trends(series, selected_criteria):
-    results = {}
-    signals = pd.DataFrame(index=series.index)
-    active_criteria = 0
-    
-    ## DODAJ PODALJSEVANJE S PROHPET ALI EXP SMOOTHING ##
-    
-    # 1. Percent Change Analysis
-    if selected_criteria.get('pct_change', False):
-        active_criteria += 1
-        try:
-            # Calculate percent change
-            period = selected_criteria.get('pct_change_period', 4)
-            threshold = selected_criteria.get('pct_change_threshold', 2)
-            
-            pct_change = zs(series.pct_change(periods=period).dropna())
-            signals['pct_change'] = (pct_change > threshold) & (~pd.isna(pct_change))
-        except Exception as e:
-            results['percent_change'] = {'error': str(e)}
-    
-    # 2. MACD Analysis
-    if selected_criteria.get('macd', False):
-        active_criteria += 1
-        try:
-            fast_period = selected_criteria.get('short_period', 4)
-            slow_period = selected_criteria.get('long_period', 8)
-            signal_period = selected_criteria.get('signal_period', 3)
-            threshold = selected_criteria.get('macd_threshold', 2)
-            
-            macd_line, signal_line, histogram = calculate_macd(series, fast_period, slow_period, signal_period)
-            
-            histogram_z = zs(histogram)
-            signals['macd_hist'] = (histogram_z > threshold) & (~pd.isna(histogram_z))
-        except Exception as e:
-            results['macd'] = {'error': str(e)}
-    
-    # 3. Exponential Smoothing Analysis (focus on forecasts and residuals)
-    if selected_criteria.get('exp_smoothing', False):
-        active_criteria += 1
-        try:
-            trend = selected_criteria.get('exp_trend', 'add')
-            seasonal = selected_criteria.get('exp_seasonal', 'add')
-            seasonal_periods = selected_criteria.get('exp_seasonal_period', 4)
-            threshold = selected_criteria.get('exp_smoothing_threshold', 2)
-            
+# Error keys of analyze_trends results, per criterion
+RESULT_KEYS = {'pct_change': 'percent_change', 'macd_hist': 'macd', 'exp_smooth': 'exp_smoothing', 'seasonal': 'seasonal'}
+
+def criterion_zscores(series, criterion, params, dataset_version=None):
+    """
+    Expensive stage of a criterion: fit the model and z-score its output.
+
+    Args:
+        series (pd.Series): Time series of the n-gram
+        criterion (str): 'pct_change', 'macd_hist', 'exp_smooth' or 'seasonal'
+        params (dict): Model parameters from cube_config, without the threshold
+        dataset_version (str): Fingerprint of the store the series was read from, enables the persistent fit cache when given
+
+    Returns:
+        dict: 'z' (pd.Series of z-scores, None if the model has no output) and 'error'
+    """
+    try:
+        # 1. Percent Change Analysis
+        if criterion == 'pct_change':
+            return {'z': zs(series.pct_change(periods=params['periods']).dropna()), 'error': None}
+
+        # 2. MACD Analysis
+        if criterion == 'macd_hist':
+            macd_line, signal_line, histogram = calculate_macd(series, params['fast_period'], params['slow_period'], params['signal_period'])
+            return {'z': zs(histogram), 'error': None}
+
+        # 3. Exponential Smoothing Analysis (focus on forecasts and residuals)
+        if criterion == 'exp_smooth':
             exp_result = calculate_exponential_smoothing(
-                series, trend, seasonal, seasonal_periods
+                series, params['trend_type'], params['seasonal_type'], params['seasonal_periods'], params['engine'], dataset_version
             )
-            
-            if exp_result['success']:
-                if 'components' in exp_result and 'residuals' in exp_result['components']:
-                    residuals = zs(exp_result['components']['residuals'])
-                    signals['exp_smooth'] = residuals > threshold
-            else:
-                results['exp_smoothing'] = {'error': exp_result['error']}
-        except Exception as e:
-            results['exp_smoothing'] = {'error': str(e)}
-    
-    # 4. Seasonal Decomposition Analysis (focus on residuals)
-    if selected_criteria.get('seasonal', False):
-        active_criteria += 1
-        try:
-            model = selected_criteria.get('seasonal_model', 'additive')
-            period = selected_criteria.get('seasonal_period', 4)
-            threshold = selected_criteria.get('seasonal_threshold', 2)
-            
-            seasonal_result = calculate_seasonal_decomposition(series, model, period)
-            
-            if seasonal_result['success']:
-                if 'components' in seasonal_result and 'residual' in seasonal_result['components']:
-                    residual = zs(seasonal_result['components']['residual'])
-                    signals['seasonal'] = residual > threshold
-            else:
-                results['seasonal'] = {'error': seasonal_result['error']}
-        except Exception as e:
-            results['seasonal'] = {'error': str(e)}
-    
+            if not exp_result['success']:
+                return {'z': None, 'error': exp_result['error']}
+            residuals = exp_result.get('components', {}).get('residuals')
+            return {'z': zs(residuals) if residuals is not None else None, 'error': None}
+
+        # 4. Seasonal Decomposition Analysis (focus on residuals)
+        seasonal_result = calculate_seasonal_decomposition(series, params['model'], params['period'], dataset_version)
+        if not seasonal_result['success']:
+            return {'z': None, 'error': seasonal_result['error']}
+        residual = seasonal_result.get('components', {}).get('residual')
+        return {'z': zs(residual) if residual is not None else None, 'error': None}
+    except Exception as e:
+        return {'z': None, 'error': str(e)}
+
+# Z-scores only depend on the n-gram and the model parameters, so moving a
+# threshold slider re-runs the comparisons below and not the models
+@st.cache_data(max_entries=1024)
+def cached_criterion_zscores(_series, ngram, dataset_version, criterion, params_json):
+    return criterion_zscores(_series, criterion, json.loads(params_json), dataset_version)
+
+def threshold_trends(index, zscores, config):
+    """
+    Cheap stage of the analysis: flag the quarters above each threshold and
+    find the quarters where more than half of the active criteria agree.
+
+    Args:
+        index (pd.Index): Quarters of the series
+        zscores (dict): Criterion -> result of criterion_zscores
+        config (dict): Criterion -> parameters with the threshold, from cube_config
+
+    Returns:
+        dict: Results in the format of analyze_trends
+    """
+    results = {}
+    signals = pd.DataFrame(index=index)
+
+    for criterion, params in config.items():
+        z = zscores[criterion]
+        if z['error'] is not None:
+            results[RESULT_KEYS[criterion]] = {'error': z['error']}
+        elif z['z'] is not None:
+            # NaN z-scores compare as False, missing quarters are filled below
+            signals[criterion] = z['z'] > params['threshold']
+
     # Calculate consensus (more than half of active criteria agree)
+    active_criteria = len(config)
     if active_criteria > 0:
         signals = signals.fillna(False)
         signal_count = signals.sum(axis=1)
@@ -102,7 +107,29 @@ def analyze_trends(series, selected_criteria):
         }
     return results
 
-def localize_trend_zones(series, consensus_points, threshold):
+def analyze_trends(series, selected_criteria, dataset_version=None, cube=None, row=None):
+    config = cube_config(selected_criteria)
+
+    # A signal cube built with the same model settings answers with a slice of its row,
+    # thresholded from its z-scores (exponential smoothing comes from the native engine)
+    if cube is not None and row is not None and model_config(cube['config']) == model_config(native_config(config)):
+        return cube_trends(cube, row, config)
+
+    zscores = {}
+    for criterion, model_params in model_config(config).items():
+        if dataset_version is not None and series.name is not None:
+            zscores[criterion] = cached_criterion_zscores(
+                series, series.name, dataset_version, criterion, json.dumps(model_params, sort_keys=True)
+            )
+        else:
+            zscores[criterion] = criterion_zscores(series, criterion, model_params)
+    return threshold_trends(series.index, zscores, config)
+
+@st.cache_data(max_entries=1024)
+def cached_z_trend_line(_series, ngram, dataset_version):
+    return compute_z_trend_line(_series)
+
+def localize_trend_zones(series, consensus_points, threshold, z_trend_line=None):
     """
     Identify localized trend zones starting from consensus points using adaptive thresholding.
 
@@ -110,6 +137,7 @@ def localize_trend_zones(series, consensus_points, threshold):
         series (pd.Series): Original time series.
         consensus_points (list): List of timestamps (indices) indicating signal agreement.
         threshold (float): Scaling factor for adaptive threshold.
+        z_trend_line (pd.Series): Precomputed z-scored trend line (default: computed from the series).
     
     Returns:
         (go.Figure, list): Tuple of Plotly figure and list of trendy quarter indices.
@@ -118,51 +146,13 @@ def localize_trend_zones(series, consensus_points, threshold):
         return go.Figure(), []
 
     # 1. Smoothed trend derivative and z-scoring
-    ma = series.rolling(window=4, min_periods=1).mean()
-    ma_diff = ma.diff()
-    trend_line = ma_diff.rolling(window=4, min_periods=1).mean().dropna()
-    z_trend_line = zs(trend_line)
-
-    # 2. Adaptive threshold
-    max_abs_derivative = z_trend_line.abs().max()
+    if z_trend_line is None:
+        z_trend_line = compute_z_trend_line(series)
 
-    # 3. Detect zones around consensus points
-    used_indices = set()
-    final_zones = []
+    # 2. Detect zones around consensus points
+    final_zones = trend_zones(z_trend_line, consensus_points, threshold)
 
-    for cp in consensus_points:
-        if cp not in z_trend_line.index or cp in used_indices:
-            continue
-        
-        zone = [cp]
-        idx_list = z_trend_line.index.tolist()
-        cp_idx = idx_list.index(cp)
-
-        # Expand left
-        left_idx = cp_idx - 1
-        while left_idx >= 0:
-            ts = idx_list[left_idx]
-            if z_trend_line[ts] >= threshold and ts not in used_indices:
-                zone.insert(0, ts)
-                left_idx -= 1
-            else:
-                break
-
-        # Expand right
-        right_idx = cp_idx + 1
-        while right_idx < len(idx_list):
-            ts = idx_list[right_idx]
-            if z_trend_line[ts] >= threshold and ts not in used_indices:
-                zone.append(ts)
-                right_idx += 1
-            else:
-                break
-
-        # Mark indices as used and save zone
-        final_zones.append(zone)
-        used_indices.update(zone)
-
-    # 4. Plotting
+    # 3. Plotting
     z_series = zs(series)
     fig = go.Figure()
 
@@ -200,10 +190,81 @@ def localize_trend_zones(series, consensus_points, threshold):
     return fig, trendy_quarters
 
 
-def render_trend_detection(df):
+def render_leaderboard(dataset, selected_criteria):
+    """
+    Hotness Leaderboard: the n-grams with the strongest trend zones over a
+    range of quarters, served from a precomputed table.
+
+    Args:
+        dataset (NgramDataset): Dataset handle
+        selected_criteria (dict): Criteria settings from the session state
+    """
+    config = leaderboard_config(selected_criteria)
+    if not config['cube']:
+        st.warning("Enable at least one criteria function to build the leaderboard.")
+        return
+
+    board = find_leaderboard(dataset, config)
+    if board is None:
+        job = leaderboard_job(dataset, config)
+        if job is not None and job['thread'].is_alive():
+            st.info("Scoring the vocabulary in the background, this can take a while for large datasets.")
+            st.button("Refresh", key="leaderboard_refresh")
+        else:
+            if job is not None and 'error' in job:
+                st.error(f"Error building the leaderboard: {job['error']}")
+            st.info("The leaderboard has not been computed for the current criteria settings yet.")
+            if st.button("Compute Leaderboard", type="primary", use_container_width=True):
+                start_leaderboard_job(dataset, config)
+                st.rerun()
+        return
+
+    if board.get('approximate_since'):
+        # Refreshed incrementally after an ingest, a full build replaces it in the background
+        job = leaderboard_job(dataset, config) or start_leaderboard_job(dataset, config)
+        if 'error' in job:
+            st.error(f"Error rebuilding the leaderboard: {job['error']}")
+        else:
+            st.info(f"Quarters from {board['approximate_since']} on were added incrementally, the scores are "
+                    "approximate until the leaderboard has been rebuilt in the background.")
+
+    quarters = board['quarters']
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        start_quarter, stop_quarter = st.select_slider(
+            "Quarter range",
+            options=quarters,
+            value=(quarters[0], quarters[-1]),
+            key="leaderboard_range"
+        )
+    with col2:
+        k = st.number_input("Top", min_value=5, max_value=500, value=20, step=5, key="leaderboard_k")
+    min_frequency = st.number_input(
+        "Minimum total frequency",
+        min_value=0.0,
+        value=0.0,
+        key="leaderboard_min_frequency",
+        help="Only n-grams with at least this total frequency over all quarters are ranked"
+    )
+
+    started = time.perf_counter()
+    top = top_k(board, dataset.vocab, int(k), start_quarter, stop_quarter, min_frequency)
+    elapsed = time.perf_counter() - started
+
+    if top.empty:
+        st.warning("No n-grams with trend zones in this range.")
+    else:
+        st.dataframe(top, use_container_width=True, hide_index=True)
+    st.caption(
+        f"{len(board['rows'])} n-grams with trend zones, query took {elapsed * 1000:.1f} ms. "
+        "Hotness sums the z-scored trend line over the trend zone quarters in the range; "
+        "exponential smoothing is scored with the native engine."
+    )
+
+def render_trend_detection(dataset):
     st.header("Trend Detection")
     
-    if df is None or df.empty:
+    if dataset is None or dataset.empty:
         st.error("No data available for analysis.")
         return
     
@@ -217,6 +278,8 @@ def render_trend_detection(df):
     # Get the n-gram and series from session state
     original_index = st.session_state.original_ngram_index
     series = st.session_state.ngram_series
+    # Version of the store the series was read from (the dataset or a shard), caches are keyed by it
+    ngram_version = st.session_state.get('ngram_version')
     
     # Get selected criteria from session state
     selected_criteria = st.session_state.selected_criteria
@@ -249,7 +312,10 @@ def render_trend_detection(df):
         ):            
             # Run the consolidated analysis
             with st.spinner("Analyzing trends across all selected criteria..."):
-                results = analyze_trends(series, selected_criteria)
+                # The signal cube only covers the n-grams of the dataset, not the shards
+                cube = find_signal_cube(dataset, selected_criteria) if ngram_version == dataset.version else None
+                row = dataset.row_offset(original_index) if cube is not None else None
+                results = analyze_trends(series, selected_criteria, ngram_version, cube, row)
                 
                 # Store results in session state
                 st.session_state.trend_analysis_results = results
@@ -293,7 +359,8 @@ def render_trend_detection(df):
                             trend_fig, trendy_quarters = localize_trend_zones(
                                 series, 
                                 consensus_points, 
-                                selected_criteria.get('zone_threshold', 0.5)
+                                selected_criteria.get('zone_threshold', 0.5),
+                                cached_z_trend_line(series, series.name, ngram_version) if series.name is not None else None
                             )
                             
                             # Display the visualization
@@ -323,5 +390,4 @@ def render_trend_detection(df):
                     st.error("No consensus analysis could be performed. Please ensure at least one analysis method is enabled.")
     
     with tab2:
-        # Placeholder for leaderboard (to be implemented later)
-        st.info("Hotness Leaderboard will be implemented in the future.")
\ No newline at end of file
+        render_leaderboard(dataset, selected_criteria)
\ No newline at end of file
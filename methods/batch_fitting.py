@@ -0,0 +1,205 @@
+import os
+import json
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from utils.ngram_dataset import NgramDataset
+from utils.startup_timing import lazy_import
+from methods.criteria_functions.holt_winters import fit_holt_winters_matrix
+from settings import NGRAM_DATASET_PATH
+
+# Parameter vector of one fit, unused entries are NaN:
+# smoothing level, trend and seasonal, initial level and trend, then the initial seasonals
+FIXED_PARAMS = 5
+
+# Dataset opened once per worker process, its arrays are memory-mapped so
+# every worker shares the same read-only pages of the store
+_worker_dataset = None
+
+def param_vector(trend, seasonal, seasonal_periods, alpha, beta=None, gamma=None, level=None, slope=None, seasonals=None):
+    m = seasonal_periods if seasonal else 0
+    vector = np.full(FIXED_PARAMS + m, np.nan)
+    vector[0] = alpha
+    if trend:
+        vector[1] = beta
+        vector[4] = slope
+    if seasonal:
+        vector[2] = gamma
+        vector[FIXED_PARAMS:] = seasonals
+    vector[3] = level
+    return vector
+
+def start_params(vector):
+    # statsmodels orders its free parameters as alpha, beta, gamma, level, trend, seasonals
+    return vector[~np.isnan(vector)]
+
+def native_start_vectors(values, trend, seasonal, seasonal_periods):
+    """
+    Warm starts from the vectorized native engine, one grid search for the
+    whole chunk instead of statsmodels' brute-force start per series.
+    """
+    fit = fit_holt_winters_matrix(values, trend, seasonal, seasonal_periods)
+    m = seasonal_periods if seasonal else 0
+    vectors = np.full((len(values), FIXED_PARAMS + m), np.nan)
+    for i in np.flatnonzero(fit['valid']):
+        alpha, beta, gamma = fit['params'][i]
+        vectors[i] = param_vector(
+            trend, seasonal, seasonal_periods, alpha, beta, gamma,
+            level=fit['initial_level'][i],
+            slope=fit['initial_trend'][i],
+            seasonals=fit['initial_seasonals'][i],
+        )
+    return vectors
+
+def init_worker(path):
+    global _worker_dataset
+    _worker_dataset = NgramDataset.open(path)
+
+def fit_chunk(rows, trend, seasonal, seasonal_periods, warm_starts=None):
+    """
+    Fit statsmodels ExponentialSmoothing to a chunk of rows in a worker.
+
+    Every optimizer starts from the previous run's parameters of the same
+    n-gram when given, otherwise from the native engine's estimate.
+
+    Returns:
+        tuple: (rows, parameter vectors, SSE per row, dict of row -> error message)
+    """
+    holtwinters = lazy_import("statsmodels.tsa.holtwinters")
+    values = _worker_dataset.get_rows(rows)
+
+    m = seasonal_periods if seasonal else 0
+    vectors = np.full((len(rows), FIXED_PARAMS + m), np.nan)
+    sse = np.full(len(rows), np.nan)
+    failures = {}
+
+    native = None
+    for i, row in enumerate(rows):
+        start = warm_starts[i] if warm_starts is not None else None
+        if start is None or np.isnan(start[0]):
+            if native is None:
+                with np.errstate(all="ignore"):
+                    native = native_start_vectors(values, trend, seasonal, seasonal_periods)
+            start = native[i]
+
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                model = holtwinters.ExponentialSmoothing(
+                    values[i],
+                    trend=trend,
+                    seasonal=seasonal,
+                    seasonal_periods=seasonal_periods if seasonal else None
+                )
+                fitted = model.fit(start_params=None if np.isnan(start[0]) else start_params(start))
+            params = fitted.params
+            vectors[i] = param_vector(
+                trend, seasonal, seasonal_periods,
+                params['smoothing_level'], params['smoothing_trend'], params['smoothing_seasonal'],
+                level=params['initial_level'], slope=params['initial_trend'], seasonals=params['initial_seasons'],
+            )
+            sse[i] = fitted.sse
+        except Exception as e:
+            failures[int(row)] = str(e)
+
+    return rows, vectors, sse, failures
+
+def fit_exponential_smoothing_corpus(path, trend="add", seasonal="add", seasonal_periods=4, rows=None, previous=None,
+                                     processes=None, chunk_size=256):
+    """
+    Fit statsmodels Holt-Winters models to many n-grams of a store in a process pool.
+
+    Workers open the store themselves, so the matrix is shared through the
+    page cache instead of being pickled to every process. Failing series
+    are collected and reported, the rest of the batch continues.
+
+    Args:
+        path (str): Store directory
+        trend (str): Trend component type ('add', 'mul', or None)
+        seasonal (str): Seasonal component type ('add', 'mul', or None)
+        seasonal_periods (int): Number of periods in a seasonal cycle
+        rows (np.ndarray): Row offsets to fit (default: all)
+        previous (dict): Result of an earlier run, used for warm starts
+        processes (int): Number of worker processes (default: CPU count)
+        chunk_size (int): Rows per worker task
+
+    Returns:
+        dict: 'params' (rows, 5 + seasonal_periods) parameter vectors and 'sse',
+            NaN for failed rows, and 'failures' mapping n-gram -> error message
+    """
+    dataset = NgramDataset.open(path)
+    n_rows = len(dataset)
+    rows = np.arange(n_rows) if rows is None else np.asarray(rows)
+    m = seasonal_periods if seasonal else 0
+
+    params = np.full((n_rows, FIXED_PARAMS + m), np.nan)
+    sse = np.full(n_rows, np.nan)
+    failures = {}
+
+    # Warm starts only apply when the previous run used the same model
+    warm = None
+    if previous is not None and previous['params'].shape == params.shape:
+        warm = previous['params']
+
+    processes = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker, initargs=(path,)) as pool:
+        futures = [
+            pool.submit(
+                fit_chunk, rows[start:start + chunk_size], trend, seasonal, seasonal_periods,
+                None if warm is None else warm[rows[start:start + chunk_size]],
+            )
+            for start in range(0, len(rows), chunk_size)
+        ]
+        for future in as_completed(futures):
+            chunk_rows, chunk_params, chunk_sse, chunk_failures = future.result()
+            params[chunk_rows] = chunk_params
+            sse[chunk_rows] = chunk_sse
+            for row, error in chunk_failures.items():
+                failures[str(dataset.vocab[row])] = error
+
+    return {
+        'model': {'trend': trend, 'seasonal': seasonal, 'seasonal_periods': seasonal_periods},
+        'params': params,
+        'sse': sse,
+        'failures': failures,
+    }
+
+def fits_file(trend, seasonal, seasonal_periods):
+    return f"holt_winters_{trend}_{seasonal}_{seasonal_periods}.npz"
+
+def save_fits(path, result):
+    # Stored next to the store matrix, the next run warm-starts from it
+    model = result['model']
+    tmp_file = os.path.join(path, f"{fits_file(**model)}.tmp")
+    with open(tmp_file, "wb") as f:
+        np.savez(f, header=np.array(json.dumps({'model': model, 'failures': result['failures']})),
+                 params=result['params'], sse=result['sse'])
+    os.replace(tmp_file, os.path.join(path, fits_file(**model)))
+
+def load_fits(path, trend, seasonal, seasonal_periods):
+    fits_path = os.path.join(path, fits_file(trend, seasonal, seasonal_periods))
+    if not os.path.exists(fits_path):
+        return None
+    with np.load(fits_path) as data:
+        header = json.loads(str(data['header']))
+        return {'model': header['model'], 'failures': header['failures'], 'params': data['params'], 'sse': data['sse']}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit Holt-Winters models to every n-gram of the store in parallel.")
+    parser.add_argument("--target", default=NGRAM_DATASET_PATH, help="Store directory")
+    parser.add_argument("--trend", default="add", help="Trend component: add, mul or none")
+    parser.add_argument("--seasonal", default="add", help="Seasonal component: add, mul or none")
+    parser.add_argument("--seasonal-periods", type=int, default=4, help="Number of periods in a seasonal cycle")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    trend = None if args.trend == "none" else args.trend
+    seasonal = None if args.seasonal == "none" else args.seasonal
+    previous = load_fits(args.target, trend, seasonal, args.seasonal_periods)
+    result = fit_exponential_smoothing_corpus(
+        args.target, trend, seasonal, args.seasonal_periods, previous=previous, processes=args.processes
+    )
+    save_fits(args.target, result)
+    print(f"Fitted {int(np.isfinite(result['sse']).sum())} n-grams, {len(result['failures'])} failed"
+          f"{' (warm start)' if previous is not None else ''}")
@@ -3,9 +3,26 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import streamlit as st
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from methods.criteria_functions.holt_winters import fit_holt_winters_matrix
+from utils.startup_timing import lazy_import
+from utils.cache_utils import cached_fit
+from settings import EXP_SMOOTHING_ENGINE
 
-def calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods):
+def forecast_quarters(last_quarter, periods):
+    # Quarter labels following the last observed quarter, e.g. "2024Q4" -> "2025Q1", ...
+    year = int(last_quarter.split('Q')[0])
+    quarter = int(last_quarter.split('Q')[1])
+    
+    forecast_index = []
+    for i in range(periods):
+        quarter += 1
+        if quarter > 4:
+            quarter = 1
+            year += 1
+        forecast_index.append(f"{year}Q{quarter}")
+    return forecast_index
+
+def calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods, engine=EXP_SMOOTHING_ENGINE, dataset_version=None):
     """
     Calculate exponential smoothing components for a time series.
     
@@ -14,12 +31,28 @@ def calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods):
         trend (str): Trend component type ('add', 'mul', or None)
         seasonal (str): Seasonal component type ('add', 'mul', or None)
         seasonal_periods (int): Number of periods in a seasonal cycle
+        engine (str): "statsmodels" (ExponentialSmoothing with a numerical optimizer)
+            or "native" (vectorized Holt-Winters with a grid search)
+        dataset_version (str): Fingerprint of the store the series was read from, enables the persistent fit cache when given
         
     Returns:
         dict: Dictionary containing all calculated components
     """
+    if dataset_version is not None:
+        params = {'trend': trend, 'seasonal': seasonal, 'seasonal_periods': seasonal_periods, 'engine': engine}
+        return cached_fit(
+            dataset_version, series, "exp_smoothing", params,
+            lambda: calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods, engine)
+        )
+
+    if engine == "native":
+        return calculate_native_exponential_smoothing(series, trend, seasonal, seasonal_periods)
+
+    # statsmodels is imported on first use to keep app startup fast
+    holtwinters = lazy_import("statsmodels.tsa.holtwinters")
+    
     # Create and fit model on original data
-    model = ExponentialSmoothing(
+    model = holtwinters.ExponentialSmoothing(
         series,
         trend=trend,
         seasonal=seasonal,
@@ -60,19 +93,7 @@ def calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods):
         try:
             # Generate forecast
             forecast_values = fitted_model.forecast(forecast_periods)
-            
-            # Create forecast quarter labels
-            last_quarter = series.index[-1]
-            year = int(last_quarter.split('Q')[0])
-            quarter = int(last_quarter.split('Q')[1])
-            
-            forecast_index = []
-            for i in range(forecast_periods):
-                quarter += 1
-                if quarter > 4:
-                    quarter = 1
-                    year += 1
-                forecast_index.append(f"{year}Q{quarter}")
+            forecast_index = forecast_quarters(series.index[-1], forecast_periods)
             
             # Create a Series for the forecast
             forecast_series = pd.Series(forecast_values, index=forecast_index)
@@ -92,7 +113,78 @@ def calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods):
     
     return result
 
-def plot_exponential_smoothing(ngram, series, trend, seasonal, seasonal_periods):
+def calculate_native_exponential_smoothing(series, trend, seasonal, seasonal_periods, forecast_periods=4):
+    """
+    Exponential smoothing with the native Holt-Winters engine, returning the
+    same result dict as calculate_exponential_smoothing.
+    """
+    result = {
+        'success': False,
+        'error': None,
+        'components': {},
+        'forecast': None
+    }
+    
+    try:
+        fit = fit_holt_winters_matrix(series.to_numpy(dtype=np.float64)[None, :], trend, seasonal, seasonal_periods, forecast_periods)
+        if not fit['valid'][0]:
+            raise ValueError("The series contains missing values, or zero and negative values for a multiplicative model")
+        
+        result['components']['fitted'] = pd.Series(fit['fitted'][0], index=series.index)
+        result['components']['level'] = pd.Series(fit['level'][0], index=series.index)
+        if trend:
+            result['components']['trend'] = pd.Series(fit['trend'][0], index=series.index)
+        if seasonal:
+            result['components']['seasonal'] = pd.Series(fit['seasonal'][0], index=series.index)
+        result['components']['residuals'] = pd.Series(fit['residuals'][0], index=series.index)
+        
+        forecast_index = forecast_quarters(series.index[-1], forecast_periods)
+        result['forecast'] = {
+            'values': pd.Series(fit['forecast'][0], index=forecast_index),
+            'index': forecast_index
+        }
+        result['success'] = True
+        
+    except Exception as e:
+        result['error'] = str(e)
+    
+    return result
+
+def compare_engines(series, trend, seasonal, seasonal_periods, rtol=0.1):
+    """
+    Check the native engine against statsmodels on one series. The optimizers
+    differ, so the fits are compared by their in-sample SSE and the largest
+    difference of the fitted values relative to the range of the series.
+    
+    Args:
+        series (pd.Series): Time series data
+        trend (str): Trend component type ('add', 'mul', or None)
+        seasonal (str): Seasonal component type ('add', 'mul', or None)
+        seasonal_periods (int): Number of periods in a seasonal cycle
+        rtol (float): Allowed relative SSE excess of the native fit
+        
+    Returns:
+        dict: SSE of both engines, their ratio, the relative fitted difference and whether the check passed
+    """
+    reference = calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods, engine="statsmodels")
+    native = calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods, engine="native")
+    if not (reference['success'] and native['success']):
+        return {'passed': False, 'error': reference['error'] or native['error']}
+    
+    reference_sse = float((reference['components']['residuals'] ** 2).sum())
+    native_sse = float((native['components']['residuals'] ** 2).sum())
+    scale = float(series.max() - series.min()) or 1.0
+    fitted_diff = (native['components']['fitted'] - reference['components']['fitted']).abs().max() / scale
+    
+    return {
+        'statsmodels_sse': reference_sse,
+        'native_sse': native_sse,
+        'sse_ratio': native_sse / reference_sse if reference_sse else np.nan,
+        'max_fitted_diff': float(fitted_diff),
+        'passed': native_sse <= reference_sse * (1 + rtol) + 1e-12,
+    }
+
+def plot_exponential_smoothing(ngram, series, trend, seasonal, seasonal_periods, engine=EXP_SMOOTHING_ENGINE, dataset_version=None):
     """
     Plot exponential smoothing for an n-gram with each component on its own graph,
     with statistical thresholds for residuals similar to other plots.
@@ -103,12 +195,14 @@ def plot_exponential_smoothing(ngram, series, trend, seasonal, seasonal_periods)
         trend (str): Trend component type ('add', 'mul', or None)
         seasonal (str): Seasonal component type ('add', 'mul', or None)
         seasonal_periods (int): Number of periods in a seasonal cycle
+        engine (str): "statsmodels" or "native"
+        dataset_version (str): Fingerprint of the store the series was read from, enables the persistent fit cache when given
         
     Returns:
         plotly.graph_objects.Figure: Plotly figure
     """
     # Calculate metrics
-    result = calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods)
+    result = calculate_exponential_smoothing(series, trend, seasonal, seasonal_periods, engine, dataset_version)
     
     if not result['success']:
         st.error(f"Error in exponential smoothing: {result['error']}")
@@ -0,0 +1,460 @@
+import numpy as np
+from utils.helper_functions import zscore_rows, row_chunks, budget_chunk_size
+from settings import NATIVE_FIT_MAX_BYTES
+
+# Coarse grid for every smoothing parameter, refined around the best point per row
+COARSE_GRID = np.array([0.1, 0.3, 0.5, 0.7, 0.9])
+REFINE_STEPS = (0.1, 0.05, 0.025)
+
+# Levenberg-Marquardt rounds of the joint refinement of non-linear models, started
+# from the grid search optimum and from these fixed (alpha, beta, gamma) points
+LM_ITERATIONS = 150
+LM_TOLERANCE = 1e-6
+LM_STARTS = np.array([[0.05, 0.05, 0.05], [0.95, 0.05, 0.05]])
+
+# Float64 (rows, candidates, quarters) arrays alive at the peak of the coarse grid
+# (the filtered components, the residuals and their temporaries)
+GRID_ARRAYS = 8
+
+# Float64 (rows, quarters) arrays per chunk of exponential_smoothing_signals: the block,
+# the fitted components and residuals, and the z-score temporaries
+SIGNAL_ARRAYS = 10
+
+def combine(level, trend, trend_type, steps=1):
+    # Level moved `steps` periods ahead by the trend
+    if trend_type == "add":
+        return level + steps * trend
+    if trend_type == "mul":
+        return level * trend ** steps
+    return level
+
+def initial_state(values, trend_type, seasonal_type, seasonal_periods):
+    """
+    Heuristic initial level, trend and seasonal factors from the first two
+    cycles (or the first two observations without a seasonal component).
+
+    Args:
+        values (np.ndarray): 2D float array, one series per row
+
+    Returns:
+        tuple: (level, trend, seasonals) with shapes (rows,), (rows,), (rows, seasonal_periods)
+    """
+    m = seasonal_periods if seasonal_type else 1
+    first = values[:, :m].mean(axis=1)
+    second = values[:, m:2 * m].mean(axis=1)
+
+    if trend_type == "add":
+        trend = (second - first) / m
+    elif trend_type == "mul":
+        trend = (second / first) ** (1.0 / m)
+    else:
+        trend = np.zeros(len(values))
+
+    if seasonal_type == "add":
+        seasonals = values[:, :m] - first[:, None]
+    elif seasonal_type == "mul":
+        seasonals = values[:, :m] / first[:, None]
+    else:
+        seasonals = np.zeros((len(values), 0))
+    return first, trend, seasonals
+
+def holt_winters_filter(values, alpha, beta, gamma, trend_type, seasonal_type, seasonal_periods, initial=None, keep_components=False):
+    """
+    Run the Holt-Winters recursions (statsmodels formulation, no damping) for
+    many series and many parameter sets at once.
+
+    Smoothing parameters broadcast against a (rows, candidates) grid, every
+    candidate of every row is filtered in the same vectorized pass over the
+    quarters.
+
+    Args:
+        values (np.ndarray): 2D float array, one series per row
+        alpha, beta, gamma (np.ndarray): Smoothing parameters, shape (rows, candidates)
+        trend_type (str): Trend component type ('add', 'mul', or None)
+        seasonal_type (str): Seasonal component type ('add', 'mul', or None)
+        seasonal_periods (int): Number of periods in a seasonal cycle
+        initial (tuple): Initial (level, trend, seasonals), broadcastable to (rows, candidates)
+            and (rows, candidates, seasonal_periods); heuristic if not given
+        keep_components (bool): Also return the fitted values and the states of every step
+
+    Returns:
+        dict: 'sse' of shape (rows, candidates), with keep_components also
+            'fitted', 'level', 'trend', 'seasonal' of shape (rows, candidates, quarters)
+            and the final 'state'
+    """
+    n_rows, nobs = values.shape
+    m = seasonal_periods if seasonal_type else 1
+    shape = np.broadcast_shapes(np.shape(alpha), np.shape(beta), np.shape(gamma), (n_rows, 1))
+
+    if initial is None:
+        level0, trend0, seasonals0 = initial_state(values, trend_type, seasonal_type, seasonal_periods)
+        initial = (level0[:, None], trend0[:, None], seasonals0[:, None, :])
+    level = np.broadcast_to(initial[0], shape).copy()
+    trend = np.broadcast_to(initial[1], shape).copy()
+    # Ring buffer of the last m seasonal factors
+    seasonals = np.broadcast_to(initial[2], shape + (m if seasonal_type else 0,)).copy()
+
+    sse = np.zeros(shape)
+    if keep_components:
+        components = {key: np.empty(shape + (nobs,)) for key in ("fitted", "level", "trend", "seasonal")}
+
+    for t in range(nobs):
+        y = values[:, t][:, None]
+        base = combine(level, trend, trend_type)
+        if seasonal_type:
+            season = seasonals[..., t % m]
+            fitted = base + season if seasonal_type == "add" else base * season
+            deseasonalized = y - season if seasonal_type == "add" else y / season
+        else:
+            fitted = base
+            deseasonalized = y
+
+        new_level = alpha * deseasonalized + (1 - alpha) * base
+        if trend_type == "add":
+            trend = beta * (new_level - level) + (1 - beta) * trend
+        elif trend_type == "mul":
+            trend = beta * (new_level / level) + (1 - beta) * trend
+        if seasonal_type == "add":
+            seasonals[..., t % m] = gamma * (y - base) + (1 - gamma) * season
+        elif seasonal_type == "mul":
+            seasonals[..., t % m] = gamma * (y / base) + (1 - gamma) * season
+        level = new_level
+
+        sse += (y - fitted) ** 2
+        if keep_components:
+            components["fitted"][..., t] = fitted
+            components["level"][..., t] = level
+            components["trend"][..., t] = trend
+            components["seasonal"][..., t] = seasonals[..., t % m] if seasonal_type else 0.0
+
+    result = {'sse': sse}
+    if keep_components:
+        result.update(components)
+        result['state'] = {'level': level, 'trend': trend, 'seasonals': seasonals, 'nobs': nobs}
+    return result
+
+def is_linear(trend_type, seasonal_type):
+    # Fully additive models are linear in the data and in the initial state
+    return trend_type in (None, "add") and seasonal_type in (None, "add")
+
+def split_initial(x, trend_type, seasonal_type, seasonal_periods):
+    # Initial (level, trend, seasonals) from stacked state vectors (..., k)
+    m = seasonal_periods if seasonal_type else 0
+    trend = x[..., 1] if trend_type else np.zeros(x.shape[:-1])
+    return x[..., 0], trend, x[..., x.shape[-1] - m:]
+
+def fit_initial_state(values, alpha, beta, gamma, trend_type, seasonal_type, seasonal_periods):
+    """
+    Least-squares initial state of a linear (fully additive) model for every
+    row and parameter candidate, the counterpart of statsmodels' estimated
+    initialization.
+
+    The fitted values are the response to the data from a zero state plus a
+    linear combination of the responses to unit initial states, which do not
+    depend on the data, so the best initial state solves a small normal
+    equation per candidate.
+
+    Returns:
+        tuple: (initial state vectors of shape (rows, candidates, k), their SSE of shape (rows, candidates))
+    """
+    n_rows, nobs = values.shape
+    m = seasonal_periods if seasonal_type else 0
+    k = 1 + (trend_type is not None) + m
+    shape = np.broadcast_shapes(np.shape(alpha), np.shape(beta), np.shape(gamma))
+
+    zero = (np.zeros((1, 1)), np.zeros((1, 1)), np.zeros((1, 1, m)))
+    base = holt_winters_filter(values, alpha, beta, gamma, trend_type, seasonal_type, seasonal_periods, initial=zero, keep_components=True)
+    residual = values[:, None, :] - base['fitted']
+
+    # Response to every unit initial state, rows only differ when the parameters do
+    response_rows = shape[0]
+    responses = []
+    for j in range(k):
+        unit = np.zeros((1, 1, k))
+        unit[..., j] = 1.0
+        responses.append(holt_winters_filter(
+            np.zeros((response_rows, nobs)), alpha, beta, gamma, trend_type, seasonal_type, seasonal_periods,
+            initial=split_initial(unit, trend_type, seasonal_type, seasonal_periods), keep_components=True,
+        )['fitted'])
+    A = np.stack(responses, axis=-1)
+
+    AtA = np.swapaxes(A, -1, -2) @ A
+    Atr = (np.swapaxes(A, -1, -2) @ residual[..., None])[..., 0]
+    # The level and a constant seasonal shift are interchangeable, so AtA is singular
+    x = (np.linalg.pinv(AtA, rcond=1e-10) @ Atr[..., None])[..., 0]
+    sse = (residual ** 2).sum(axis=-1) - (x * Atr).sum(axis=-1)
+    return x, sse
+
+def refine_nonlinear(values, params, initial, trend_type, seasonal_type, seasonal_periods, iterations=LM_ITERATIONS):
+    """
+    Jointly refine the smoothing parameters and the initial state of a
+    non-linear (multiplicative) model for every row, the counterpart of
+    statsmodels' estimated initialization for the models fit_initial_state
+    cannot solve in closed form.
+
+    Batched Levenberg-Marquardt: the Jacobian of the fitted values comes from
+    forward differences, evaluated as extra candidates of a single filter
+    pass, and every row keeps its own damping factor. A step is only taken
+    where it lowers the SSE, so the result is never worse than the start.
+    Rows are scaled to a unit mean first, the models are scale-equivariant.
+
+    Args:
+        values (np.ndarray): 2D float array of positive series, one per row
+        params (np.ndarray): Starting (alpha, beta, gamma) per row, shape (rows, 3)
+        initial (tuple): Starting (level, trend, seasonals), broadcastable to
+            (rows, 1) and (rows, 1, seasonal_periods)
+        iterations (int): Maximum number of Levenberg-Marquardt rounds
+
+    Returns:
+        tuple: (refined parameters of shape (rows, 3), initial state for holt_winters_filter)
+    """
+    n_rows, nobs = values.shape
+    m = seasonal_periods if seasonal_type else 0
+    use = np.array([True, trend_type is not None, seasonal_type is not None])
+    n_params = int(use.sum())
+
+    # Components measured in the units of the series are scaled with it
+    scale = values.mean(axis=1)
+    y = values / scale[:, None]
+    level0 = np.broadcast_to(initial[0], (n_rows, 1))[:, 0] / scale
+    trend0 = np.broadcast_to(initial[1], (n_rows, 1))[:, 0]
+    seasonals0 = np.broadcast_to(initial[2], (n_rows, 1, m))[:, 0]
+    if trend_type == "add":
+        trend0 = trend0 / scale
+    if seasonal_type == "add":
+        seasonals0 = seasonals0 / scale[:, None]
+    theta = np.column_stack([params[:, use], level0] + ([trend0] if trend_type else []) + [seasonals0])
+
+    # Smoothing parameters in [0, 1], multiplicative components and the level positive
+    lower = np.full(theta.shape[1], -np.inf)
+    upper = np.full(theta.shape[1], np.inf)
+    lower[:n_params], upper[:n_params] = 0.0, 1.0
+    tiny = 1e-8
+    lower[n_params] = tiny
+    if trend_type == "mul":
+        lower[n_params + 1] = tiny
+    if seasonal_type == "mul":
+        lower[theta.shape[1] - m:] = tiny
+
+    def filter_sse(candidates, rows, keep_components=False):
+        # Filter the (rows, candidates, k) parameter vectors of the given rows
+        smoothing = np.zeros(candidates.shape[:-1] + (3,))
+        smoothing[..., use] = candidates[..., :n_params]
+        state = split_initial(candidates[..., n_params:], trend_type, seasonal_type, seasonal_periods)
+        return holt_winters_filter(y[rows], *np.moveaxis(smoothing, -1, 0), trend_type, seasonal_type, seasonal_periods,
+                                   initial=state, keep_components=keep_components)
+
+    with np.errstate(all="ignore"):
+        sse = np.nan_to_num(filter_sse(theta[:, None], slice(None))['sse'][:, 0], nan=np.inf)
+        damping = np.full(n_rows, 1e-3)
+        for _ in range(iterations):
+            rows = np.flatnonzero(damping < 1e8)
+            if not len(rows):
+                break
+            current = theta[rows]
+            h = 1e-6 * np.maximum(np.abs(current), 1.0)
+            candidates = np.concatenate([current[:, None], current[:, None] + h[:, :, None] * np.eye(len(lower))], axis=1)
+            fitted = filter_sse(candidates, rows, keep_components=True)['fitted']
+
+            J = (fitted[:, 1:] - fitted[:, :1]) / h[:, :, None]
+            r = y[rows] - fitted[:, 0]
+            H = J @ np.swapaxes(J, -1, -2)
+            g = (J @ r[..., None])[..., 0]
+            # Parameters on a bound that the descent direction pushes outward stay fixed
+            frozen = ((current <= lower) & (g < 0)) | ((current >= upper) & (g > 0))
+            H = np.where(frozen[:, :, None] | frozen[:, None, :], 0.0, H)
+            g = np.where(frozen, 0.0, g)
+            diagonal = np.diagonal(H, axis1=-2, axis2=-1) + frozen
+            ridge = 1e-12 * diagonal.sum(axis=-1, keepdims=True) + 1e-300
+            A = H + np.eye(len(lower)) * (damping[rows, None] * diagonal + ridge)[..., None]
+            delta = np.linalg.solve(A, g[..., None])[..., 0]
+            delta[~np.isfinite(delta).all(axis=1)] = 0.0
+
+            trial = np.clip(current + delta, lower, upper)
+            trial_sse = np.nan_to_num(filter_sse(trial[:, None], rows)['sse'][:, 0], nan=np.inf)
+            improved = trial_sse < sse[rows]
+            # A row has converged once an accepted step no longer lowers its SSE measurably
+            converged = improved & (sse[rows] - trial_sse <= LM_TOLERANCE * sse[rows])
+            theta[rows[improved]] = trial[improved]
+            sse[rows[improved]] = trial_sse[improved]
+            damping[rows] = np.where(improved, damping[rows] / 3, damping[rows] * 10)
+            damping[rows[converged]] = np.inf
+
+    best = np.zeros((n_rows, 3))
+    best[:, use] = theta[:, :n_params]
+    level, trend, seasonals = split_initial(theta[:, n_params:], trend_type, seasonal_type, seasonal_periods)
+    level = level * scale
+    if trend_type == "add":
+        trend = trend * scale
+    if seasonal_type == "add":
+        seasonals = seasonals * scale[:, None]
+    return best, (level[:, None], trend[:, None], seasonals[:, None, :])
+
+def grid_search(values, trend_type, seasonal_type, seasonal_periods, coarse_grid=COARSE_GRID, refine_steps=REFINE_STEPS):
+    """
+    Choose the smoothing parameters of every row by minimizing the in-sample
+    SSE: a coarse grid shared by all rows, then a few rounds of a 3-point
+    grid per parameter centered on each row's current best.
+
+    Linear models also get a least-squares initial state, re-estimated after
+    every round. The others start from the heuristic initial state, which is
+    then refined together with the parameters by refine_nonlinear.
+
+    Returns:
+        tuple: (best (alpha, beta, gamma) per row of shape (rows, 3), initial state for holt_winters_filter)
+    """
+    n_rows = len(values)
+    use = [True, trend_type is not None, seasonal_type is not None]
+    linear = is_linear(trend_type, seasonal_type)
+
+    def pick(params, sse):
+        choice = np.argmin(np.nan_to_num(sse, nan=np.inf), axis=1)
+        return choice, np.take_along_axis(params, choice[None, :, None], axis=2)[..., 0]
+
+    # Unused parameters are pinned, so they do not multiply the grid
+    axes = [coarse_grid if used else np.array([0.0]) for used in use]
+    grid = np.array(np.meshgrid(*axes, indexing="ij")).reshape(3, 1, -1)
+    with np.errstate(all="ignore"):
+        if linear:
+            x, sse = fit_initial_state(values, *grid, trend_type, seasonal_type, seasonal_periods)
+        else:
+            sse = holt_winters_filter(values, *grid, trend_type, seasonal_type, seasonal_periods)['sse']
+    choice, best = pick(np.broadcast_to(grid, (3, n_rows, grid.shape[2])), sse)
+
+    if linear:
+        x = np.take_along_axis(x, choice[:, None, None], axis=1)
+        initial = split_initial(x, trend_type, seasonal_type, seasonal_periods)
+    else:
+        level0, trend0, seasonals0 = initial_state(values, trend_type, seasonal_type, seasonal_periods)
+        initial = (level0[:, None], trend0[:, None], seasonals0[:, None, :])
+
+    for step in refine_steps:
+        offsets = [np.array([-step, 0.0, step]) if used else np.array([0.0]) for used in use]
+        offsets = np.array(np.meshgrid(*offsets, indexing="ij")).reshape(3, -1)
+        params = np.clip(best[:, :, None] + offsets[:, None, :], 0.0, 1.0)
+        with np.errstate(all="ignore"):
+            sse = holt_winters_filter(values, *params, trend_type, seasonal_type, seasonal_periods, initial=initial)['sse']
+            _, best = pick(params, sse)
+            if linear:
+                x, _ = fit_initial_state(values, *best[:, :, None], trend_type, seasonal_type, seasonal_periods)
+                initial = split_initial(x, trend_type, seasonal_type, seasonal_periods)
+    if not linear:
+        return refine_multistart(values, best.T, initial, trend_type, seasonal_type, seasonal_periods)
+    return best.T, initial
+
+def refine_multistart(values, params, initial, trend_type, seasonal_type, seasonal_periods):
+    # The SSE of non-linear models has several basins, every row is refined from each start
+    n_rows = len(values)
+    starts = np.concatenate([params[None], np.broadcast_to(LM_STARTS[:, None, :], (len(LM_STARTS), n_rows, 3))])
+    n_starts = len(starts)
+    m = seasonal_periods if seasonal_type else 0
+    tiled = (
+        np.tile(np.broadcast_to(initial[0], (n_rows, 1)), (n_starts, 1)),
+        np.tile(np.broadcast_to(initial[1], (n_rows, 1)), (n_starts, 1)),
+        np.tile(np.broadcast_to(initial[2], (n_rows, 1, m)), (n_starts, 1, 1)),
+    )
+    values = np.tile(values, (n_starts, 1))
+    best, state = refine_nonlinear(values, starts.reshape(-1, 3), tiled, trend_type, seasonal_type, seasonal_periods)
+    with np.errstate(all="ignore"):
+        sse = holt_winters_filter(values, *best.T[:, :, None], trend_type, seasonal_type, seasonal_periods, initial=state)['sse'][:, 0]
+    choice = np.argmin(np.nan_to_num(sse, nan=np.inf).reshape(n_starts, n_rows), axis=0)
+    picked = choice * n_rows + np.arange(n_rows)
+    return best[picked], tuple(component[picked] for component in state)
+
+def check_inputs(values, trend_type, seasonal_type, seasonal_periods):
+    # Rows the model cannot be fitted to, with the reason statsmodels would give
+    valid = np.isfinite(values).all(axis=1)
+    if "mul" in (trend_type, seasonal_type):
+        valid &= (values > 0).all(axis=1)
+    if seasonal_type and values.shape[1] < 2 * seasonal_periods:
+        raise ValueError("Cannot compute initial seasonals using heuristic method with less than two full seasonal cycles in the data.")
+    return valid
+
+def fit_group_rows(nobs, trend_type, seasonal_type, max_bytes=NATIVE_FIT_MAX_BYTES):
+    # Rows grid-searched together so that every coarse grid candidate of them fits the budget
+    candidates = len(COARSE_GRID) ** (1 + (trend_type is not None) + (seasonal_type is not None))
+    return max(1, int(max_bytes // (GRID_ARRAYS * candidates * nobs * 8)))
+
+def fit_holt_winters_matrix(values, trend_type, seasonal_type, seasonal_periods, forecast_periods=4):
+    """
+    Fit Holt-Winters models to every row of a matrix at once.
+
+    The rows are grid-searched in groups of fit_group_rows, so the memory of
+    a call grows with the rows only through its (rows, quarters) results.
+
+    Args:
+        values (np.ndarray): 2D float array, one series per row
+        trend_type (str): Trend component type ('add', 'mul', or None)
+        seasonal_type (str): Seasonal component type ('add', 'mul', or None)
+        seasonal_periods (int): Number of periods in a seasonal cycle
+        forecast_periods (int): Number of quarters to forecast
+
+    Returns:
+        dict: 'params' (rows, 3), the initial state ('initial_level', 'initial_trend',
+            'initial_seasonals'), 'fitted', 'level', 'trend', 'seasonal', 'residuals'
+            (rows, quarters), 'forecast' (rows, forecast_periods) and the boolean
+            'valid' row mask; invalid rows are all NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = check_inputs(values, trend_type, seasonal_type, seasonal_periods)
+    n_rows, nobs = values.shape
+
+    result = {key: np.full((n_rows, nobs), np.nan) for key in ("fitted", "level", "trend", "seasonal", "residuals")}
+    result['params'] = np.full((n_rows, 3), np.nan)
+    result['initial_level'] = np.full(n_rows, np.nan)
+    result['initial_trend'] = np.full(n_rows, np.nan)
+    result['initial_seasonals'] = np.full((n_rows, seasonal_periods if seasonal_type else 0), np.nan)
+    result['forecast'] = np.full((n_rows, forecast_periods), np.nan)
+    result['valid'] = valid
+
+    valid_rows = np.flatnonzero(valid)
+    group_size = fit_group_rows(nobs, trend_type, seasonal_type)
+    m = seasonal_periods if seasonal_type else 1
+    for start in range(0, len(valid_rows), group_size):
+        group = valid_rows[start:start + group_size]
+        rows = values[group]
+        params, initial = grid_search(rows, trend_type, seasonal_type, seasonal_periods)
+        with np.errstate(all="ignore"):
+            fit = holt_winters_filter(rows, *params.T[:, :, None], trend_type, seasonal_type, seasonal_periods, initial=initial, keep_components=True)
+
+        for key in ("fitted", "level", "trend", "seasonal"):
+            result[key][group] = fit[key][:, 0]
+        result['residuals'][group] = rows - fit['fitted'][:, 0]
+        result['params'][group] = params
+        result['initial_level'][group] = np.broadcast_to(initial[0], (len(rows), 1))[:, 0]
+        result['initial_trend'][group] = np.broadcast_to(initial[1], (len(rows), 1))[:, 0]
+        result['initial_seasonals'][group] = np.broadcast_to(initial[2], (len(rows), 1, result['initial_seasonals'].shape[1]))[:, 0]
+
+        # Forecast from the final state
+        state = fit['state']
+        for h in range(1, forecast_periods + 1):
+            base = combine(state['level'][:, 0], state['trend'][:, 0], trend_type, h)
+            if seasonal_type:
+                season = state['seasonals'][:, 0, (nobs + h - 1) % m]
+                base = base + season if seasonal_type == "add" else base * season
+            result['forecast'][group, h - 1] = base
+    return result
+
+def exponential_smoothing_signals(matrix, trend_type="add", seasonal_type="add", seasonal_periods=4, threshold=2.0, chunk_size=None):
+    """
+    Exponential smoothing criterion for the whole vocabulary: z-score the
+    residuals of the native fit of every row and flag the quarters above the
+    threshold, as analyze_trends does for a single n-gram.
+
+    Args:
+        matrix (np.ndarray or scipy.sparse.csr_matrix): Frequency matrix, row per n-gram
+        trend_type (str): Trend component type ('add', 'mul', or None)
+        seasonal_type (str): Seasonal component type ('add', 'mul', or None)
+        seasonal_periods (int): Number of periods in a seasonal cycle
+        threshold (float): Z-score threshold
+        chunk_size (int): Number of rows fitted at a time, derived from CHUNK_MAX_BYTES if not given
+
+    Returns:
+        tuple: (boolean signal matrix, residual z-scores)
+    """
+    residual_z = np.empty(matrix.shape, dtype=np.float64)
+    chunk_size = chunk_size or budget_chunk_size(matrix.shape[1], SIGNAL_ARRAYS)
+    for start, stop, block in row_chunks(matrix, chunk_size):
+        fit = fit_holt_winters_matrix(block, trend_type, seasonal_type, seasonal_periods)
+        residual_z[start:stop] = zscore_rows(fit['residuals'])
+    return residual_z > threshold, residual_z
@@ -3,6 +3,8 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import streamlit as st
+from utils.helper_functions import zscore_rows, row_chunks
+from utils.startup_timing import lazy_import
 
 def calculate_macd(series, fast_period=4, slow_period=8, signal_period=3):
     """
@@ -176,4 +178,61 @@ def plot_macd(ngram, series, fast_period=3, slow_period=6, signal_period=2, thre
     # Only show x-axis title on bottom subplot
     fig.update_xaxes(title_text="Quarter", row=2, col=1)
     
-    return fig
\ No newline at end of file
+    return fig
+
+def ema_matrix(values, span):
+    """
+    Exponential moving average of every row, identical to
+    Series.ewm(span=span, adjust=False).mean() on series without NaNs.
+
+    The recursion y[t] = (1 - alpha) * y[t-1] + alpha * x[t] runs as one
+    linear filter along the quarter axis, started at y[0] = x[0].
+
+    Args:
+        values (np.ndarray): 2D float array, one series per row
+        span (int): EMA span
+
+    Returns:
+        np.ndarray: EMAs with the same shape
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[1] == 0:
+        return values.copy()
+    alpha = 2.0 / (span + 1.0)
+    initial = (1 - alpha) * values[:, :1]
+    ema, _ = lazy_import("scipy.signal").lfilter([alpha], [1.0, alpha - 1.0], values, axis=1, zi=initial)
+    return ema
+
+def calculate_macd_matrix(values, fast_period=4, slow_period=8, signal_period=3):
+    """
+    MACD for every row of a matrix at once, see calculate_macd.
+
+    Returns:
+        tuple: (macd_line, signal_line, histogram) as 2D arrays
+    """
+    macd_line = ema_matrix(values, fast_period) - ema_matrix(values, slow_period)
+    signal_line = ema_matrix(macd_line, signal_period)
+    return macd_line, signal_line, macd_line - signal_line
+
+def macd_signals(matrix, fast_period=4, slow_period=8, signal_period=3, threshold=2.0, chunk_size=65536):
+    """
+    MACD criterion for the whole vocabulary: z-score the histogram of every
+    row and flag the quarters above the threshold, as analyze_trends does for
+    a single n-gram.
+
+    Args:
+        matrix (np.ndarray or scipy.sparse.csr_matrix): Frequency matrix, row per n-gram
+        fast_period (int): Period for fast EMA
+        slow_period (int): Period for slow EMA
+        signal_period (int): Period for signal line EMA
+        threshold (float): Z-score threshold
+        chunk_size (int): Number of rows densified at a time
+
+    Returns:
+        tuple: (boolean signal matrix, histogram z-scores)
+    """
+    histogram_z = np.empty(matrix.shape, dtype=np.float64)
+    for start, stop, block in row_chunks(matrix, chunk_size):
+        _, _, histogram = calculate_macd_matrix(block, fast_period, slow_period, signal_period)
+        histogram_z[start:stop] = zscore_rows(histogram)
+    return histogram_z > threshold, histogram_z
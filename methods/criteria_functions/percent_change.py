@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import streamlit as st
+from utils.helper_functions import zscore_rows, row_chunks
 
 def calculate_pct(series, periods):
     return series.pct_change(periods=periods)
@@ -80,4 +81,45 @@ def plot_percent_change(ngram, series, periods=4, threshold=2.0):
         tickangle=270
     )
     
-    return fig
\ No newline at end of file
+    return fig
+
+def calculate_pct_matrix(values, periods):
+    """
+    Percent change over `periods` quarters for every row of a matrix at once,
+    with the same semantics as Series.pct_change: the first `periods` columns
+    are NaN, 0 -> 0 is NaN and x -> 0 growth is infinite.
+
+    Args:
+        values (np.ndarray): 2D float array, one series per row
+        periods (int): Number of periods to calculate change over
+
+    Returns:
+        np.ndarray: Percent changes with the same shape
+    """
+    values = np.asarray(values, dtype=np.float64)
+    pct = np.full(values.shape, np.nan)
+    if periods < values.shape[1]:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pct[:, periods:] = values[:, periods:] / values[:, :-periods] - 1
+    return pct
+
+def pct_change_signals(matrix, periods=4, threshold=2.0, chunk_size=65536):
+    """
+    Percent-change criterion for the whole vocabulary: z-score the percent
+    change of every row and flag the quarters above the threshold, as
+    analyze_trends does for a single n-gram.
+
+    Args:
+        matrix (np.ndarray or scipy.sparse.csr_matrix): Frequency matrix, row per n-gram
+        periods (int): Number of periods to calculate change over
+        threshold (float): Z-score threshold
+        chunk_size (int): Number of rows densified at a time
+
+    Returns:
+        tuple: (boolean signal matrix, percent change z-scores)
+    """
+    pct_z = np.empty(matrix.shape, dtype=np.float64)
+    for start, stop, block in row_chunks(matrix, chunk_size):
+        pct_z[start:stop] = zscore_rows(calculate_pct_matrix(block, periods))
+    # NaN compares as False, so undefined changes never signal
+    return pct_z > threshold, pct_z
@@ -3,9 +3,11 @@ import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import streamlit as st
-from statsmodels.tsa.seasonal import seasonal_decompose
+from utils.helper_functions import zscore_rows, row_chunks
+from utils.startup_timing import lazy_import
+from utils.cache_utils import cached_fit
 
-def calculate_seasonal_decomposition(series, model="additive", period=4):
+def calculate_seasonal_decomposition(series, model="additive", period=4, dataset_version=None):
     """
     Calculate seasonal decomposition for a time series.
     
@@ -13,10 +15,17 @@ def calculate_seasonal_decomposition(series, model="additive", period=4):
         series (pd.Series): Time series data
         model (str): Type of seasonal component ('additive' or 'multiplicative')
         period (int): Number of periods in a seasonal cycle
+        dataset_version (str): Fingerprint of the store the series was read from, enables the persistent fit cache when given
         
     Returns:
         dict: Dictionary containing all calculated components
     """
+    if dataset_version is not None:
+        return cached_fit(
+            dataset_version, series, "seasonal", {'model': model, 'period': period},
+            lambda: calculate_seasonal_decomposition(series, model, period)
+        )
+
     result = {
         'success': False,
         'error': None,
@@ -24,8 +33,8 @@ def calculate_seasonal_decomposition(series, model="additive", period=4):
     }
     
     try:
-        # Perform seasonal decomposition
-        decomposition = seasonal_decompose(
+        # Perform seasonal decomposition, statsmodels is imported on first use
+        decomposition = lazy_import("statsmodels.tsa.seasonal").seasonal_decompose(
             series,
             model=model,
             period=period
@@ -43,7 +52,86 @@ def calculate_seasonal_decomposition(series, model="additive", period=4):
     
     return result
 
-def plot_seasonal_decomposition(ngram, series, model="additive", period=4):
+def decompose_matrix(values, model="additive", period=4):
+    """
+    Classical seasonal decomposition of every row of a matrix at once, with
+    the same results as statsmodels.seasonal_decompose (two-sided centered
+    moving average, per-phase seasonal means, no trend extrapolation), so the
+    NaN edges of the trend and residual match exactly.
+
+    Rows statsmodels would reject (missing values, or zero and negative
+    values for the multiplicative model) are all NaN and marked invalid.
+
+    Args:
+        values (np.ndarray): 2D float array, one series per row
+        model (str): Type of seasonal component ('additive' or 'multiplicative')
+        period (int): Number of periods in a seasonal cycle
+
+    Returns:
+        dict: 'trend', 'seasonal' and 'residual' 2D arrays and the boolean 'valid' row mask
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_rows, nobs = values.shape
+    if nobs < 2 * period:
+        raise ValueError(f"x must have 2 complete cycles requires {2 * period} observations. x only has {nobs} observation(s)")
+    multiplicative = model in ("multiplicative", "mul")
+
+    valid = np.isfinite(values).all(axis=1)
+    if multiplicative:
+        valid &= (values > 0).all(axis=1)
+
+    # Centered moving average, the ends of an even window get half weight
+    if period % 2 == 0:
+        filt = np.array([0.5] + [1] * (period - 1) + [0.5]) / period
+    else:
+        filt = np.repeat(1.0 / period, period)
+    head = int(np.ceil(len(filt) / 2.0) - 1)
+    tail = int(np.ceil(len(filt) / 2.0) - len(filt) % 2)
+    trend = np.full(values.shape, np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(values, len(filt), axis=1)
+    trend[:, head:nobs - tail] = windows @ filt[::-1]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        detrended = values / trend if multiplicative else values - trend
+
+        # Mean of every phase of the cycle, normalized over the cycle
+        period_averages = np.stack(
+            [np.nanmean(detrended[:, i::period], axis=1) for i in range(period)], axis=1
+        )
+        if multiplicative:
+            period_averages /= period_averages.mean(axis=1, keepdims=True)
+        else:
+            period_averages -= period_averages.mean(axis=1, keepdims=True)
+
+        seasonal = np.tile(period_averages, nobs // period + 1)[:, :nobs]
+        residual = detrended / seasonal if multiplicative else detrended - seasonal
+
+    for component in (trend, seasonal, residual):
+        component[~valid] = np.nan
+    return {'trend': trend, 'seasonal': seasonal, 'residual': residual, 'valid': valid}
+
+def seasonal_signals(matrix, model="additive", period=4, threshold=2.0, chunk_size=65536):
+    """
+    Seasonal decomposition criterion for the whole vocabulary: z-score the
+    residual of every row and flag the quarters above the threshold, as
+    analyze_trends does for a single n-gram.
+
+    Args:
+        matrix (np.ndarray or scipy.sparse.csr_matrix): Frequency matrix, row per n-gram
+        model (str): Type of seasonal component ('additive' or 'multiplicative')
+        period (int): Number of periods in a seasonal cycle
+        threshold (float): Z-score threshold
+        chunk_size (int): Number of rows densified at a time
+
+    Returns:
+        tuple: (boolean signal matrix, residual z-scores)
+    """
+    residual_z = np.empty(matrix.shape, dtype=np.float64)
+    for start, stop, block in row_chunks(matrix, chunk_size):
+        residual_z[start:stop] = zscore_rows(decompose_matrix(block, model, period)['residual'])
+    return residual_z > threshold, residual_z
+
+def plot_seasonal_decomposition(ngram, series, model="additive", period=4, dataset_version=None):
     """
     Plots seasonal decomposition (trend, seasonal, residual) for an n-gram time series
     with statistical thresholds for residuals.
@@ -53,11 +141,12 @@ def plot_seasonal_decomposition(ngram, series, model="additive", period=4):
         series (pd.Series): Time series data for the n-gram
         model (str): Decomposition model ("additive" or "multiplicative")
         period (int): Number of periods in a seasonal cycle
+        dataset_version (str): Fingerprint of the store the series was read from, enables the persistent fit cache when given
         
     Returns:
         plotly.graph_objects.Figure: Plotly figure
     """
-    decomposition_result = calculate_seasonal_decomposition(series, model=model, period=period)
+    decomposition_result = calculate_seasonal_decomposition(series, model=model, period=period, dataset_version=dataset_version)
 
     if not decomposition_result["success"]:
         raise ValueError(f"Decomposition failed: {decomposition_result['error']}")
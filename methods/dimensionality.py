@@ -1,17 +1,26 @@
+import os
+import pickle
+import shutil
+import argparse
 import numpy as np
 import pandas as pd
 import streamlit as st
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-import umap
 import plotly.express as px
 import plotly.graph_objects as go
 from utils.cache_utils import get_cached_result, save_cached_result
+from utils.startup_timing import lazy_import
+from settings import NGRAM_DATASET_PATH, PCA_DIR, PCA_CHUNK_SIZE, PCA_IN_MEMORY_MAX_BYTES
 
+EMBEDDING_FILE = "embedding.npy"
+MODEL_FILE = "model.pkl"
+
+# The DataFrame is not hashed by st.cache_data (leading underscore), the results
+# are keyed by the content fingerprint of the dataset instead
 @st.cache_data
-def compute_pca(df, n_components=2):
+def compute_pca(_df, dataset_version, n_components=2):
+    df = _df
     # Check if result is cached
-    cache_key = f"pca_{n_components}_{df.shape[0]}_{df.shape[1]}"
+    cache_key = f"pca_{n_components}_{dataset_version}"
     cached = get_cached_result(cache_key)
     if cached is not None:
         return cached
@@ -21,7 +30,7 @@ def compute_pca(df, n_components=2):
     X = df.values
     
     # Compute PCA
-    pca = PCA(n_components=n_components)
+    pca = lazy_import("sklearn.decomposition").PCA(n_components=n_components)
     pca_result = pca.fit_transform(X)
     
     # Create a DataFrame for the result
@@ -36,10 +45,128 @@ def compute_pca(df, n_components=2):
     
     return result_df, pca, pca.explained_variance_ratio_
 
+def fits_in_memory(dataset):
+    # PCA materializes the matrix as dense float64
+    n_rows, n_quarters = dataset.shape
+    return n_rows * n_quarters * 8 <= PCA_IN_MEMORY_MAX_BYTES
+
+def fit_incremental_pca(dataset, n_components=2, chunk_size=PCA_CHUNK_SIZE):
+    """
+    Fit PCA one block of rows at a time with IncrementalPCA, so only a chunk
+    of the matrix is ever densified.
+
+    Every component is tracked while fitting and the model is truncated at
+    the end: truncating after every chunk drops what the earlier chunks
+    contribute to the weaker components. There is one component per quarter,
+    so this stays cheap and the result matches PCA on the full matrix.
+
+    Args:
+        dataset (NgramDataset): Dataset handle, its matrix may be memory-mapped
+        n_components (int): Number of components
+        chunk_size (int): Number of rows per partial fit
+
+    Returns:
+        IncrementalPCA: Fitted model with n_components components
+    """
+    pca = lazy_import("sklearn.decomposition").IncrementalPCA(n_components=min(dataset.shape))
+    for _, _, block in dataset.row_chunks(chunk_size):
+        pca.partial_fit(block)
+
+    # Variance left out by the truncation, as PCA estimates the noise variance
+    pca.noise_variance_ = pca.explained_variance_[n_components:].mean() if n_components < pca.n_components_ else 0.0
+    for attr in ("components_", "explained_variance_", "explained_variance_ratio_", "singular_values_"):
+        setattr(pca, attr, getattr(pca, attr)[:n_components])
+    pca.n_components = pca.n_components_ = n_components
+    return pca
+
+def build_pca(dataset, path, n_components=2, chunk_size=PCA_CHUNK_SIZE):
+    """
+    Out-of-core PCA of the dataset: one pass over the row chunks fits the
+    components, a second pass projects every chunk into an embedding that is
+    written straight to a memory-mapped .npy file.
+
+    Args:
+        dataset (NgramDataset): Dataset handle
+        path (str): Output directory
+        n_components (int): Number of components
+        chunk_size (int): Number of rows held in memory at a time
+    """
+    pca = fit_incremental_pca(dataset, n_components, chunk_size)
+
+    # Written to a temporary directory first, readers never see a partial embedding
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    embedding = np.lib.format.open_memmap(os.path.join(tmp_path, EMBEDDING_FILE), mode="w+",
+                                          dtype=np.float64, shape=(len(dataset), n_components))
+    for start, stop, block in dataset.row_chunks(chunk_size):
+        embedding[start:stop] = pca.transform(block)
+    embedding.flush()
+    del embedding
+    with open(os.path.join(tmp_path, MODEL_FILE), "wb") as f:
+        pickle.dump(pca, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+def open_pca(path):
+    """
+    Open a saved out-of-core PCA, the embedding stays memory-mapped.
+
+    Returns:
+        tuple: (embedding (rows, components), fitted model), or None if it does not exist
+    """
+    if not os.path.exists(os.path.join(path, MODEL_FILE)):
+        return None
+    with open(os.path.join(path, MODEL_FILE), "rb") as f:
+        pca = pickle.load(f)
+    return np.load(os.path.join(path, EMBEDDING_FILE), mmap_mode="r"), pca
+
+def pca_path(dataset_version, n_components=2):
+    return os.path.join(PCA_DIR, f"{dataset_version}_{n_components}")
+
+# Cached as a resource, the memory-mapped embedding is shared instead of copied
+@st.cache_resource
+def compute_pca_out_of_core(_dataset, dataset_version, n_components=2):
+    """
+    PCA for datasets larger than memory, built once per dataset version and
+    reopened from disk afterwards.
+
+    Returns:
+        tuple: (memory-mapped embedding (rows, components), fitted model,
+            explained variance ratio)
+    """
+    path = pca_path(dataset_version, n_components)
+    saved = open_pca(path)
+    if saved is None:
+        build_pca(_dataset, path, n_components)
+        saved = open_pca(path)
+    embedding, pca = saved
+    return embedding, pca, pca.explained_variance_ratio_
+
+def sample_embedding(dataset, embedding, max_points, ngram=None):
+    """
+    Evenly spaced rows of an embedding as a DataFrame for plotting, always
+    including the given n-gram.
+
+    Returns:
+        pd.DataFrame: Coordinates of the sampled n-grams, n-grams as index
+    """
+    n_rows = len(embedding)
+    rows = np.linspace(0, n_rows - 1, min(max_points, n_rows)).astype(np.int64)
+    row = dataset.row_offset(ngram) if ngram else None
+    if row is not None:
+        rows = np.union1d(rows, [row])
+    return pd.DataFrame(
+        np.asarray(embedding[rows]),
+        columns=[f"PC{i+1}" for i in range(embedding.shape[1])],
+        index=pd.Index(dataset.vocab[rows].astype(object), name=dataset.index_name)
+    )
+
 @st.cache_data
-def compute_tsne(df, n_components=2, perplexity=30, max_iter=1000):
-     # Check if result is cached
-    cache_key = f"tsne_{n_components}_{perplexity}_{max_iter}_{df.shape[0]}_{df.shape[1]}"
+def compute_tsne(_df, dataset_version, n_components=2, perplexity=30, max_iter=1000):
+    df = _df
+    # Check if result is cached
+    cache_key = f"tsne_{n_components}_{perplexity}_{max_iter}_{dataset_version}"
     cached = get_cached_result(cache_key)
     if cached is not None:
         return cached
@@ -48,7 +175,7 @@ def compute_tsne(df, n_components=2, perplexity=30, max_iter=1000):
     X = df.values
     
     # Compute t-SNE
-    tsne = TSNE(n_components=n_components, perplexity=perplexity, max_iter=max_iter, random_state=42)
+    tsne = lazy_import("sklearn.manifold").TSNE(n_components=n_components, perplexity=perplexity, max_iter=max_iter, random_state=42)
     tsne_result = tsne.fit_transform(X)
     
     # Create a DataFrame for the result
@@ -64,10 +191,10 @@ def compute_tsne(df, n_components=2, perplexity=30, max_iter=1000):
     return result_df
 
 @st.cache_data
-def compute_umap(df, n_neighbors=15, min_dist=0.1):
-
+def compute_umap(_df, dataset_version, n_neighbors=15, min_dist=0.1):
+    df = _df
     # Check if result is cached
-    cache_key = f"umap_{n_neighbors}_{min_dist}_{df.shape[0]}_{df.shape[1]}"
+    cache_key = f"umap_{n_neighbors}_{min_dist}_{dataset_version}"
     cached = get_cached_result(cache_key)
     if cached is not None:
         return cached
@@ -76,7 +203,7 @@ def compute_umap(df, n_neighbors=15, min_dist=0.1):
     X = df.values
     
     # Compute UMAP
-    reducer = umap.UMAP(n_neighbors=n_neighbors, min_dist=min_dist)
+    reducer = lazy_import("umap").UMAP(n_neighbors=n_neighbors, min_dist=min_dist)
     umap_result = reducer.fit_transform(X)
     
     # Create a DataFrame for the result
@@ -141,4 +268,17 @@ def plot_explained_variance(explained_variance_ratio):
         showlegend=False
     )
     
-    return fig
\ No newline at end of file
+    return fig
+
+if __name__ == "__main__":
+    from utils.ngram_dataset import NgramDataset
+
+    parser = argparse.ArgumentParser(description="Build the out-of-core PCA of a store.")
+    parser.add_argument("--target", default=NGRAM_DATASET_PATH, help="Store directory")
+    parser.add_argument("--components", type=int, default=2, help="Number of components")
+    parser.add_argument("--chunk-size", type=int, default=PCA_CHUNK_SIZE, help="Rows held in memory at a time")
+    args = parser.parse_args()
+
+    dataset = NgramDataset.open(args.target)
+    build_pca(dataset, pca_path(dataset.version, args.components), args.components, args.chunk_size)
+    print(f"Built the PCA of {len(dataset)} n-grams")
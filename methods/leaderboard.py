@@ -0,0 +1,344 @@
+import os
+import json
+import math
+import time
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from methods.signal_cube import CRITERIA, cube_config, native_config, cube_path, build_signal_cube, open_signal_cube, same_thresholds, cube_consensus
+from methods.signal_state import build_signal_state, advance_signal_state, save_signal_state, load_signal_state
+from methods.trend_zones import trend_line_matrix, trend_zone_matrix
+from utils.helper_functions import zscore_rows, budget_chunk_size
+from settings import NGRAM_DATASET_PATH, LEADERBOARD_DIR
+
+ROWS_FILE = "rows.npy"
+TOTALS_FILE = "totals.npy"
+SCORE_FILE = "score_cumsum.npy"
+QUARTERS_FILE = "quarters_cumsum.npy"
+META_FILE = "meta.json"
+
+# Float64 (rows, quarters) arrays per scoring chunk: the block, the consensus,
+# the trend line and its z-scores, the zone mask and the scores
+CHUNK_ARRAYS = 8
+
+def leaderboard_config(selected_criteria):
+    """
+    Criteria settings of the leaderboard: the signal cube settings plus the
+    trend zone threshold. Exponential smoothing is always scored with the
+    native engine, the only one that runs over the whole vocabulary.
+
+    Args:
+        selected_criteria (dict): Criteria settings from the session state
+
+    Returns:
+        dict: Cube config and zone threshold
+    """
+    config = native_config(cube_config(selected_criteria))
+    return {
+        'cube': config,
+        'zone_threshold': float(selected_criteria.get('zone_threshold', 0.5)),
+    }
+
+def leaderboard_path(dataset_version, config):
+    payload = json.dumps([dataset_version, config], sort_keys=True)
+    return os.path.join(LEADERBOARD_DIR, hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest())
+
+def score_vocabulary(dataset, cube, config, chunk_size=None):
+    """
+    Run the trend zone detection of the Trend Detection page on every n-gram
+    with at least one consensus quarter, a chunk of rows at a time. At the
+    thresholds the cube was built with, only the n-grams with a consensus
+    count are read, otherwise the consensus is thresholded from the z-scores
+    of every row.
+
+    A quarter inside a trend zone scores the z-score of the trend line there
+    (negative values count as zero), the hotness of an n-gram over a range of
+    quarters is the sum of its scores in that range.
+
+    Args:
+        dataset (NgramDataset): Dataset the cube was built from
+        cube (dict): Signal cube from build_signal_cube or open_signal_cube
+        config (dict): Settings from leaderboard_config
+        chunk_size (int): Number of rows evaluated at a time, derived from CHUNK_MAX_BYTES if not given
+
+    Returns:
+        tuple: (row offsets, quarter scores (rows, quarters) and trend zone
+            mask (rows, quarters)) of the n-grams with at least one trend zone
+    """
+    n_quarters = len(dataset.columns)
+    chunk_size = chunk_size or budget_chunk_size(n_quarters, CHUNK_ARRAYS)
+    if same_thresholds(cube, config['cube']):
+        candidates = np.flatnonzero(np.asarray(cube['consensus_count']) > 0)
+    else:
+        candidates = np.arange(len(dataset))
+    rows, scores, masks = [], [], []
+
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        values = dataset.get_rows(chunk)
+        consensus = cube_consensus(cube, chunk, config['cube'])
+        with np.errstate(all="ignore"):
+            z_trend = zscore_rows(trend_line_matrix(values))
+        mask = trend_zone_matrix(z_trend, consensus, config['zone_threshold'])
+
+        keep = mask.any(axis=1)
+        rows.append(chunk[keep])
+        masks.append(mask[keep])
+        scores.append(np.where(mask[keep], np.nan_to_num(np.maximum(z_trend[keep], 0.0)), 0.0).astype(np.float32))
+
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, n_quarters), dtype=np.float32), np.zeros((0, n_quarters), dtype=bool)
+    return np.concatenate(rows).astype(np.int64), np.vstack(scores), np.vstack(masks)
+
+def build_leaderboard(dataset, config, chunk_size=None):
+    """
+    Score the whole vocabulary and build the leaderboard table.
+
+    The signal cube of the model settings is reused when it has been saved,
+    otherwise it is built and saved first. The table only holds n-grams with
+    at least one trend zone, sorted by total frequency (descending), so a
+    minimum frequency filter is a prefix of the table. Scores and trend
+    quarters are stored as cumulative sums over the quarters, one contiguous
+    array per quarter, so any quarter range is two array reads. The signal
+    state of every n-gram is kept with the table for refresh_leaderboard.
+
+    Args:
+        dataset (NgramDataset): Dataset handle
+        config (dict): Settings from leaderboard_config
+        chunk_size (int): Number of rows evaluated at a time, by default every step
+            derives its own from CHUNK_MAX_BYTES
+
+    Returns:
+        dict: Leaderboard table
+    """
+    path = cube_path(dataset.version, config['cube'])
+    cube = open_signal_cube(path)
+    if cube is None:
+        cube = build_signal_cube(dataset, config['cube'], path, chunk_size)
+
+    rows, scores, masks = score_vocabulary(dataset, cube, config, chunk_size)
+    totals = dataset.row_totals()[rows]
+    order = np.argsort(-totals, kind="stable")
+
+    n_quarters = len(dataset.columns)
+    score_cumsum = np.zeros((n_quarters + 1, len(rows)), dtype=np.float32)
+    quarters_cumsum = np.zeros((n_quarters + 1, len(rows)), dtype=np.int16)
+    np.cumsum(scores[order].T, axis=0, out=score_cumsum[1:])
+    np.cumsum(masks[order].T, axis=0, out=quarters_cumsum[1:])
+
+    return {
+        'config': config,
+        'dataset_version': dataset.version,
+        'quarters': dataset.columns.tolist(),
+        'rows': rows[order],
+        'totals': totals[order],
+        'score_cumsum': score_cumsum,
+        'quarters_cumsum': quarters_cumsum,
+        'state': build_signal_state(dataset, config['cube'], chunk_size),
+    }
+
+def save_leaderboard(path, board):
+    # Written to a temporary directory first, readers never see a partial table
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, ROWS_FILE), board['rows'])
+    np.save(os.path.join(tmp_path, TOTALS_FILE), board['totals'])
+    np.save(os.path.join(tmp_path, SCORE_FILE), board['score_cumsum'])
+    np.save(os.path.join(tmp_path, QUARTERS_FILE), board['quarters_cumsum'])
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump({key: board[key] for key in ('config', 'dataset_version', 'quarters', 'approximate_since') if key in board}, f)
+    if board.get('state') is not None:
+        save_signal_state(tmp_path, board['state'])
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+def open_leaderboard(path):
+    """
+    Open a saved leaderboard, the arrays stay memory-mapped.
+
+    Returns:
+        dict: Leaderboard table, or None if it does not exist
+    """
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        return None
+    with open(os.path.join(path, META_FILE)) as f:
+        board = json.load(f)
+    board['rows'] = np.load(os.path.join(path, ROWS_FILE), mmap_mode="r")
+    board['totals'] = np.load(os.path.join(path, TOTALS_FILE), mmap_mode="r")
+    board['score_cumsum'] = np.load(os.path.join(path, SCORE_FILE), mmap_mode="r")
+    board['quarters_cumsum'] = np.load(os.path.join(path, QUARTERS_FILE), mmap_mode="r")
+    return board
+
+def top_k(board, vocab, k=20, start_quarter=None, stop_quarter=None, min_frequency=0):
+    """
+    Hottest n-grams over a range of quarters, without reading the frequency matrix.
+
+    Args:
+        board (dict): Leaderboard from build_leaderboard or open_leaderboard
+        vocab (np.ndarray): N-gram vocabulary of the dataset
+        k (int): Number of n-grams
+        start_quarter (str): First quarter of the range (default: first quarter)
+        stop_quarter (str): Last quarter of the range, inclusive (default: last quarter)
+        min_frequency (float): Minimum total frequency of an n-gram
+
+    Returns:
+        pd.DataFrame: N-gram, hotness, trend quarters in the range and total
+            frequency, hottest first
+    """
+    quarters = board['quarters']
+    start = quarters.index(start_quarter) if start_quarter is not None else 0
+    stop = quarters.index(stop_quarter) + 1 if stop_quarter is not None else len(quarters)
+
+    # Totals are sorted descending, the n-grams above the minimum are a prefix
+    n = int(np.searchsorted(-board['totals'], -min_frequency, side="right"))
+    score = board['score_cumsum'][stop, :n] - board['score_cumsum'][start, :n]
+    trend_quarters = board['quarters_cumsum'][stop, :n] - board['quarters_cumsum'][start, :n]
+
+    candidates = np.flatnonzero(trend_quarters > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-score[candidates], k - 1)[:k]]
+    # Ties are broken by total frequency, i.e. by position in the table
+    candidates = candidates[np.lexsort((candidates, -score[candidates]))]
+
+    return pd.DataFrame({
+        'N-gram': vocab[board['rows'][candidates]],
+        'Hotness': score[candidates],
+        'Trend quarters': trend_quarters[candidates],
+        'Total frequency': board['totals'][candidates],
+    })
+
+def refresh_leaderboard(path, quarter, column, dataset_version):
+    """
+    Extend a saved leaderboard by one quarter from its signal state, without
+    reading the frequency matrix.
+
+    The state is advanced by one O(vocabulary) step, which gives the
+    criteria signals and the trend line z-score of the new quarter. The new
+    quarter joins a trend zone when it is a consensus point, or when the
+    previous quarter is in a zone and the trend line stays above the
+    threshold. Earlier quarters keep their scores, they are not re-scored
+    against the longer history, and the seasonal decomposition (centered,
+    not causal) never signals on the new quarter, so the table is marked
+    as approximate since the first refreshed quarter until a full build
+    replaces it.
+
+    Args:
+        path (str): Directory of the saved leaderboard
+        quarter (str): Label of the new quarter
+        column (np.ndarray): Frequencies of the new quarter, one per n-gram
+        dataset_version (str): Version of the dataset with the new quarter
+
+    Returns:
+        str: Directory of the refreshed leaderboard
+    """
+    board = open_leaderboard(path)
+    state = load_signal_state(path)
+    if board is None or state is None or state['n_quarters'] != len(board['quarters']):
+        raise ValueError(f"No signal state for the leaderboard in {path}, rebuild it")
+    config = board['config']
+    criteria = [name for name in CRITERIA if name in config['cube']]
+
+    signals, z_trend = advance_signal_state(state, column, config['cube'])
+    signal_count = np.sum([signals[name] for name in criteria], axis=0)
+    consensus = signal_count > math.ceil(len(criteria) / 2.0)
+
+    old_rows = np.asarray(board['rows'])
+    previous = np.zeros(len(column), dtype=bool)
+    previous[old_rows] = (board['quarters_cumsum'][-1] - board['quarters_cumsum'][-2]) > 0
+    in_zone = consensus | (previous & (z_trend >= config['zone_threshold']))
+    score = np.where(in_zone, np.nan_to_num(np.maximum(z_trend, 0.0)), 0.0)
+
+    # Rows that already had a zone keep their history, new ones start at zero
+    rows = np.union1d(old_rows, np.flatnonzero(in_zone))
+    old_positions = np.searchsorted(rows, old_rows)
+    n_quarters = len(board['quarters'])
+    score_cumsum = np.zeros((n_quarters + 2, len(rows)), dtype=np.float32)
+    quarters_cumsum = np.zeros((n_quarters + 2, len(rows)), dtype=np.int16)
+    score_cumsum[:n_quarters + 1, old_positions] = board['score_cumsum']
+    quarters_cumsum[:n_quarters + 1, old_positions] = board['quarters_cumsum']
+    score_cumsum[-1] = score_cumsum[-2] + score[rows]
+    quarters_cumsum[-1] = quarters_cumsum[-2] + in_zone[rows]
+
+    # The running sums of the state are the new total frequencies
+    totals = state['sum'][rows]
+    order = np.argsort(-totals, kind="stable")
+    new_path = leaderboard_path(dataset_version, config)
+    save_leaderboard(new_path, {
+        'config': config,
+        'dataset_version': dataset_version,
+        'quarters': board['quarters'] + [quarter],
+        'approximate_since': board.get('approximate_since', quarter),
+        'rows': rows[order],
+        'totals': totals[order],
+        'score_cumsum': score_cumsum[:, order],
+        'quarters_cumsum': quarters_cumsum[:, order],
+        'state': state,
+    })
+    return new_path
+
+def refresh_leaderboards(previous_version, dataset_version, quarter, column):
+    """
+    Refresh every saved leaderboard of the previous dataset version after a
+    quarter has been appended. A leaderboard that cannot be refreshed is
+    reported and the others are still refreshed. The leaderboards of the
+    previous version are removed either way, nothing looks them up any more.
+
+    Returns:
+        tuple: (number of refreshed leaderboards, dict of leaderboard directory -> error message)
+    """
+    if not os.path.isdir(LEADERBOARD_DIR):
+        return 0, {}
+    refreshed, errors = 0, {}
+    for name in sorted(os.listdir(LEADERBOARD_DIR)):
+        path = os.path.join(LEADERBOARD_DIR, name)
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            continue
+        with open(meta_path) as f:
+            if json.load(f).get('dataset_version') != previous_version:
+                continue
+        try:
+            refresh_leaderboard(path, quarter, column, dataset_version)
+            refreshed += 1
+        except Exception as e:
+            errors[path] = str(e)
+        shutil.rmtree(path, ignore_errors=True)
+    return refreshed, errors
+
+def run_leaderboard_job(dataset, config, job):
+    """
+    Build and save a leaderboard, meant to run in a background thread.
+
+    Args:
+        dataset (NgramDataset): Dataset handle
+        config (dict): Settings from leaderboard_config
+        job (dict): Status shared with the app, 'error' and 'seconds' are set when done
+    """
+    started = time.perf_counter()
+    try:
+        save_leaderboard(leaderboard_path(dataset.version, config), build_leaderboard(dataset, config))
+    except Exception as e:
+        job['error'] = str(e)
+    job['seconds'] = time.perf_counter() - started
+
+if __name__ == "__main__":
+    from utils.ngram_dataset import NgramDataset
+
+    parser = argparse.ArgumentParser(description="Score the vocabulary of a store and save the hotness leaderboard.")
+    parser.add_argument("--target", default=NGRAM_DATASET_PATH, help="Store directory")
+    parser.add_argument("--zone-threshold", type=float, default=0.1, help="Trend zone threshold")
+    args = parser.parse_args()
+
+    dataset = NgramDataset.open(args.target)
+    config = leaderboard_config({
+        'pct_change': True, 'macd': True, 'exp_smoothing': True, 'seasonal': True,
+        'zone_threshold': args.zone_threshold,
+    })
+    job = {}
+    run_leaderboard_job(dataset, config, job)
+    if 'error' in job:
+        raise SystemExit(f"Leaderboard failed: {job['error']}")
+    print(f"Scored {len(dataset)} n-grams in {job['seconds']:.1f} s")
@@ -0,0 +1,232 @@
+import os
+import json
+import math
+import numpy as np
+from methods.recursive_state import ema_alpha
+from methods.criteria_functions.holt_winters import initial_state, holt_winters_filter
+
+# Online criteria, in the order of the signal cube
+ONLINE_CRITERIA = ['pct_change', 'macd_hist', 'exp_smooth']
+
+# Smoothing parameters of the online Holt-Winters detector when none are given
+DEFAULT_SMOOTHING = {'alpha': 0.5, 'beta': 0.1, 'gamma': 0.1}
+
+def init_moments(state, key, n_rows):
+    state[f"{key}_count"] = np.zeros(n_rows)
+    state[f"{key}_mean"] = np.zeros(n_rows)
+    state[f"{key}_m2"] = np.zeros(n_rows)
+
+def update_moments(state, key, x):
+    """
+    Fold one value per n-gram into running moments (Welford's update) and
+    return its z-score against them. Non-finite values are skipped and get a
+    NaN z-score, as do n-grams whose values have not varied yet.
+    """
+    finite = np.isfinite(x)
+    count = state[f"{key}_count"] + finite
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = np.where(finite, x - state[f"{key}_mean"], 0.0)
+        mean = state[f"{key}_mean"] + np.where(finite, delta / count, 0.0)
+        state[f"{key}_m2"] = state[f"{key}_m2"] + np.where(finite, delta * (x - mean), 0.0)
+        state[f"{key}_count"], state[f"{key}_mean"] = count, mean
+        std = np.sqrt(state[f"{key}_m2"] / count)
+        z = (x - mean) / std
+    z[~finite | ~(std > 0)] = np.nan
+    return z
+
+def init_detectors(n_rows, config):
+    """
+    Create the online detectors of the given criteria for n_rows n-grams.
+
+    Every detector keeps a constant amount of state per n-gram, independent
+    of the number of observations: a ring buffer of the last `periods`
+    values for percent change, three EMAs for MACD, the level, trend and
+    seasonal factors for Holt-Winters, and running moments of each output
+    for the z-scores. Periods count observations, so the detectors work for
+    weekly or daily feeds as well as for quarters.
+
+    Args:
+        n_rows (int): Number of n-grams
+        config (dict): Criteria settings in the format of cube_config; the
+            seasonal decomposition (centered, not causal) is ignored, and
+            'exp_smooth' may set 'alpha', 'beta' and 'gamma' (scalars or one per n-gram)
+
+    Returns:
+        dict: Detector state
+    """
+    config = {name: dict(config[name]) for name in ONLINE_CRITERIA if name in config}
+    state = {'config': config, 'n_obs': 0}
+
+    if 'pct_change' in config:
+        state['pct_ring'] = np.full((n_rows, config['pct_change']['periods']), np.nan)
+        init_moments(state, 'pct', n_rows)
+
+    if 'macd_hist' in config:
+        for key in ('ema_fast', 'ema_slow', 'ema_signal'):
+            state[key] = np.zeros(n_rows)
+        init_moments(state, 'macd', n_rows)
+
+    if 'exp_smooth' in config:
+        exp = config['exp_smooth']
+        m = exp['seasonal_periods'] if exp['seasonal_type'] else 0
+        for key, default in DEFAULT_SMOOTHING.items():
+            state[f"hw_{key}"] = np.broadcast_to(np.asarray(exp.pop(key, default), dtype=np.float64), (n_rows,)).copy()
+        state['hw_level'] = np.full(n_rows, np.nan)
+        state['hw_trend'] = np.zeros(n_rows)
+        state['hw_seasonals'] = np.full((n_rows, m), np.nan)
+        # First two cycles, buffered for the heuristic initial state
+        state['hw_warmup'] = np.full((n_rows, 2 * max(m, 1)), np.nan)
+        init_moments(state, 'exp', n_rows)
+
+    return state
+
+def update_pct_change(state, x):
+    # Percent change over `periods` observations, the ring buffer position is the oldest value
+    config = state['config']['pct_change']
+    position = state['n_obs'] % config['periods']
+    base = state['pct_ring'][:, position]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = x / base - 1
+    state['pct_ring'][:, position] = x
+    z = update_moments(state, 'pct', pct)
+    return z > config['threshold']
+
+def update_macd(state, x):
+    # EMAs start at the first value (adjust=False), the signal line at zero
+    config = state['config']['macd_hist']
+    if state['n_obs'] == 0:
+        state['ema_fast'] = x.copy()
+        state['ema_slow'] = x.copy()
+    else:
+        a_fast, a_slow, a_signal = (ema_alpha(config[key]) for key in ('fast_period', 'slow_period', 'signal_period'))
+        state['ema_fast'] = (1 - a_fast) * state['ema_fast'] + a_fast * x
+        state['ema_slow'] = (1 - a_slow) * state['ema_slow'] + a_slow * x
+        state['ema_signal'] = (1 - a_signal) * state['ema_signal'] + a_signal * (state['ema_fast'] - state['ema_slow'])
+    histogram = state['ema_fast'] - state['ema_slow'] - state['ema_signal']
+    z = update_moments(state, 'macd', histogram)
+    return z > config['threshold']
+
+def update_holt_winters(state, x):
+    """
+    One Holt-Winters step per n-gram with fixed smoothing parameters.
+
+    The first two cycles are buffered; once they are complete the heuristic
+    initial state is computed and the buffered observations are filtered, so
+    their residuals enter the moments but do not signal.
+    """
+    config = state['config']['exp_smooth']
+    trend_type, seasonal_type, m = config['trend_type'], config['seasonal_type'], config['seasonal_periods']
+    warmup = state['hw_warmup'].shape[1]
+    n_rows = len(x)
+    params = (state['hw_alpha'][:, None], state['hw_beta'][:, None], state['hw_gamma'][:, None])
+
+    with np.errstate(all="ignore"):
+        if state['n_obs'] < warmup:
+            state['hw_warmup'][:, state['n_obs']] = x
+            if state['n_obs'] + 1 < warmup:
+                return np.zeros(n_rows, dtype=bool)
+            values = state['hw_warmup']
+            level, trend, seasonals = initial_state(values, trend_type, seasonal_type, m)
+            step = holt_winters_filter(values, *params, trend_type, seasonal_type, m,
+                                       initial=(level[:, None], trend[:, None], seasonals[:, None, :]), keep_components=True)
+            for t in range(warmup):
+                update_moments(state, 'exp', values[:, t] - step['fitted'][:, 0, t])
+            # After an even number of cycles the first seasonal factor is the next one used
+            seasonals = step['state']['seasonals'][:, 0]
+            signals = np.zeros(n_rows, dtype=bool)
+        else:
+            step = holt_winters_filter(x[:, None], *params, trend_type, seasonal_type, m,
+                                       initial=(state['hw_level'][:, None], state['hw_trend'][:, None], state['hw_seasonals'][:, None, :]),
+                                       keep_components=True)
+            z = update_moments(state, 'exp', x - step['fitted'][:, 0, 0])
+            # The factor just used moves to the back of the cycle
+            seasonals = np.roll(step['state']['seasonals'][:, 0], -1, axis=-1)
+            signals = z > config['threshold']
+
+    state['hw_level'] = step['state']['level'][:, 0]
+    if trend_type:
+        state['hw_trend'] = step['state']['trend'][:, 0]
+    state['hw_seasonals'] = seasonals
+    return signals
+
+def update_detectors(state, values):
+    """
+    Consume one observation per n-gram in O(1) per n-gram and report which
+    n-grams signal on it.
+
+    Each criterion z-scores its latest output against the running moments of
+    all its outputs so far and signals above its threshold, as analyze_trends
+    does over a full history. The consensus requires more than half of the
+    active criteria, as in analyze_trends.
+
+    Args:
+        state (dict): Detector state from init_detectors, updated in place
+        values (np.ndarray): New observation, one value per n-gram
+
+    Returns:
+        dict: Criterion -> boolean signals, plus 'signal_count' and 'consensus'
+    """
+    x = np.asarray(values, dtype=np.float64)
+    config = state['config']
+    signals = {}
+    if 'pct_change' in config:
+        signals['pct_change'] = update_pct_change(state, x)
+    if 'macd_hist' in config:
+        signals['macd_hist'] = update_macd(state, x)
+    if 'exp_smooth' in config:
+        signals['exp_smooth'] = update_holt_winters(state, x)
+    state['n_obs'] += 1
+
+    signal_count = np.sum([signals[name] for name in signals], axis=0, dtype=np.int64) if signals else np.zeros(len(x), dtype=np.int64)
+    signals['signal_count'] = signal_count
+    signals['consensus'] = signal_count > math.ceil(len(config) / 2.0)
+    return signals
+
+def run_detectors(matrix, config):
+    """
+    Replay a matrix through fresh detectors, one column at a time.
+
+    Args:
+        matrix (np.ndarray): 2D float array, one series per row, observations in order
+        config (dict): Criteria settings, see init_detectors
+
+    Returns:
+        tuple: (detector state after the last observation, dict of criterion ->
+            boolean (rows, observations) signals including 'consensus')
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    state = init_detectors(len(matrix), config)
+    history = {}
+    for t in range(matrix.shape[1]):
+        for name, signal in update_detectors(state, matrix[:, t]).items():
+            history.setdefault(name, np.zeros(matrix.shape, dtype=signal.dtype))[:, t] = signal
+    return state, history
+
+def save_detectors(path, state):
+    """
+    Persist the detector state, e.g. between the batches of a feed.
+
+    Args:
+        path (str): File path (.npz)
+        state (dict): Detector state
+    """
+    header = json.dumps({'config': state['config'], 'n_obs': state['n_obs']})
+    arrays = {key: value for key, value in state.items() if key not in ('config', 'n_obs')}
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, header=np.array(header), **arrays)
+    os.replace(tmp_file, path)
+
+def load_detectors(path):
+    """
+    Load a persisted detector state.
+
+    Returns:
+        dict or None: Detector state, or None if the file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        state = {key: data[key] for key in data.files if key != 'header'}
+        state.update(json.loads(str(data['header'])))
+    return state
@@ -5,7 +5,7 @@ from plotly.subplots import make_subplots
 
 def reconstruct_from_pca(pca_model, ngram_idx, original_df):
     # Get the n-gram's PCA coordinates
-    ngram_coords = pca_model.transform([original_df.iloc[ngram_idx].values])[0]
+    ngram_coords = pca_model.transform([np.asarray(original_df.iloc[ngram_idx], dtype=np.float64)])[0]
     
     # Reconstruct the time series
     reconstructed = pca_model.inverse_transform([ngram_coords])[0]
@@ -0,0 +1,203 @@
+import os
+import json
+import numpy as np
+from scipy import sparse
+
+# File name of the persisted state inside a store directory
+STATE_FILE = "state.npz"
+
+# Periods match the defaults of the criteria functions, the history covers
+# percent change periods up to 8 quarters
+DEFAULT_STATE_PARAMS = {
+    'fast_period': 4,
+    'slow_period': 8,
+    'signal_period': 3,
+    'window': 4,
+    'history': 9,
+}
+
+# Arrays with one entry (or row) per n-gram
+ROW_KEYS = ['ema_fast', 'ema_slow', 'ema_signal', 'history', 'window_sum', 'sum', 'sum_sq']
+
+def ema_alpha(span):
+    # Same smoothing factor as pandas ewm(span=..., adjust=False)
+    return 2.0 / (span + 1.0)
+
+def init_state(n_rows, params=DEFAULT_STATE_PARAMS):
+    """
+    Create an empty per-n-gram state.
+
+    Args:
+        n_rows (int): Number of n-grams
+        params (dict): Periods for the EMAs, rolling window and history length
+
+    Returns:
+        dict: State with one entry per n-gram for every recursive statistic
+    """
+    return {
+        'params': dict(params),
+        'n_quarters': 0,
+        'ema_fast': np.zeros(n_rows),
+        'ema_slow': np.zeros(n_rows),
+        'ema_signal': np.zeros(n_rows),
+        'history': np.full((n_rows, params['history']), np.nan),
+        'window_sum': np.zeros(n_rows),
+        'sum': np.zeros(n_rows),
+        'sum_sq': np.zeros(n_rows),
+    }
+
+def update_state(state, column):
+    """
+    Fold one new quarter into the state in O(vocabulary).
+
+    The EMAs follow the adjust=False recursion used by calculate_macd, so after
+    the update they equal the last value of the full-history computation.
+
+    Args:
+        state (dict): State from init_state, updated in place
+        column (np.ndarray): Frequencies of the new quarter, one per n-gram
+
+    Returns:
+        dict: The updated state
+    """
+    x = np.asarray(column, dtype=np.float64)
+    params = state['params']
+    window = params['window']
+    history = state['history']
+
+    if state['n_quarters'] == 0:
+        state['ema_fast'] = x.copy()
+        state['ema_slow'] = x.copy()
+        state['ema_signal'] = np.zeros_like(x)
+    else:
+        a_fast = ema_alpha(params['fast_period'])
+        a_slow = ema_alpha(params['slow_period'])
+        a_signal = ema_alpha(params['signal_period'])
+
+        state['ema_fast'] = (1 - a_fast) * state['ema_fast'] + a_fast * x
+        state['ema_slow'] = (1 - a_slow) * state['ema_slow'] + a_slow * x
+        macd_line = state['ema_fast'] - state['ema_slow']
+        state['ema_signal'] = (1 - a_signal) * state['ema_signal'] + a_signal * macd_line
+
+    # Rolling window sum drops the value that leaves the window
+    state['window_sum'] = state['window_sum'] + x
+    if state['n_quarters'] >= window:
+        state['window_sum'] -= history[:, -window]
+
+    # Running moments for z-scoring the latest value
+    state['sum'] = state['sum'] + x
+    state['sum_sq'] = state['sum_sq'] + x * x
+
+    # Shift the history, newest value is the last column
+    history[:, :-1] = history[:, 1:]
+    history[:, -1] = x
+
+    state['n_quarters'] += 1
+    return state
+
+def build_state(matrix, params=DEFAULT_STATE_PARAMS, chunk_size=65536):
+    """
+    Build the state from the full history, processing rows in chunks.
+
+    Args:
+        matrix (np.ndarray or scipy.sparse matrix): Frequency matrix, row per n-gram
+        params (dict): Periods for the EMAs, rolling window and history length
+        chunk_size (int): Number of rows densified at a time
+
+    Returns:
+        dict: State after folding in every quarter of the matrix
+    """
+    n_rows, n_quarters = matrix.shape
+    state = init_state(n_rows, params)
+
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        block = matrix[start:stop]
+        block = block.toarray() if sparse.issparse(block) else np.asarray(block, dtype=np.float64)
+
+        chunk_state = init_state(stop - start, params)
+        for t in range(n_quarters):
+            update_state(chunk_state, block[:, t])
+
+        for key in ROW_KEYS:
+            state[key][start:stop] = chunk_state[key]
+
+    state['n_quarters'] = n_quarters
+    return state
+
+def state_macd(state):
+    """
+    MACD line, signal line and histogram at the latest quarter.
+
+    Returns:
+        tuple: (macd_line, signal_line, histogram) arrays, one value per n-gram
+    """
+    macd_line = state['ema_fast'] - state['ema_slow']
+    signal_line = state['ema_signal']
+    return macd_line, signal_line, macd_line - signal_line
+
+def state_pct_change(state, periods):
+    """
+    Percent change of the latest quarter over `periods` quarters back.
+
+    Returns:
+        np.ndarray: Percent change per n-gram (inf or NaN where the base is zero)
+    """
+    if periods >= state['params']['history']:
+        raise ValueError(f"State history only covers {state['params']['history'] - 1} periods")
+    history = state['history']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return history[:, -1] / history[:, -1 - periods] - 1
+
+def state_rolling_mean(state):
+    # Same as rolling(window, min_periods=1).mean() at the latest quarter
+    return state['window_sum'] / min(state['n_quarters'], state['params']['window'])
+
+def state_zscore(state):
+    """
+    Z-score of the latest quarter against the full history of each n-gram.
+
+    Returns:
+        np.ndarray: Z-score per n-gram (NaN for constant series)
+    """
+    n = state['n_quarters']
+    mean = state['sum'] / n
+    var = np.maximum(state['sum_sq'] / n - mean * mean, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (state['history'][:, -1] - mean) / np.sqrt(var)
+    z[var == 0] = np.nan
+    return z
+
+def save_state(path, state):
+    """
+    Persist the state next to the store matrix.
+
+    Args:
+        path (str): Store directory
+        state (dict): State to save
+    """
+    header = json.dumps({'params': state['params'], 'n_quarters': state['n_quarters']})
+    tmp_file = os.path.join(path, f"{STATE_FILE}.tmp")
+    with open(tmp_file, "wb") as f:
+        np.savez(f, header=np.array(header), **{key: state[key] for key in ROW_KEYS})
+    os.replace(tmp_file, os.path.join(path, STATE_FILE))
+
+def load_state(path):
+    """
+    Load the persisted state of a store.
+
+    Args:
+        path (str): Store directory
+
+    Returns:
+        dict or None: State, or None if no state has been saved yet
+    """
+    state_path = os.path.join(path, STATE_FILE)
+    if not os.path.exists(state_path):
+        return None
+
+    with np.load(state_path) as data:
+        header = json.loads(str(data['header']))
+        state = {key: data[key] for key in ROW_KEYS}
+    state.update(header)
+    return state
@@ -0,0 +1,292 @@
+import os
+import json
+import math
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from utils.helper_functions import budget_chunk_size
+from methods.criteria_functions.percent_change import pct_change_signals
+from methods.criteria_functions.macd import macd_signals
+from methods.criteria_functions.holt_winters import exponential_smoothing_signals
+from methods.criteria_functions.seasonal_decomposition import seasonal_signals
+from settings import NGRAM_DATASET_PATH, SIGNAL_CUBE_DIR, EXP_SMOOTHING_ENGINE
+
+# Criteria in cube order, named like the signal columns of analyze_trends
+CRITERIA = ['pct_change', 'macd_hist', 'exp_smooth', 'seasonal']
+
+# Number of set bits of every byte value
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+BITS_FILE = "bits.npy"
+ZSCORES_FILE = "zscores.npy"
+CONSENSUS_FILE = "consensus.npy"
+CONSENSUS_COUNT_FILE = "consensus_count.npy"
+META_FILE = "meta.json"
+
+# Float64 (rows, quarters) arrays per chunk: the block, the z-scores of a criterion
+# and the intermediates of its kernel (the Holt-Winters fit holds the most)
+CHUNK_ARRAYS = 12
+
+def cube_config(selected_criteria):
+    """
+    Parameters of the active criteria, with the defaults of analyze_trends.
+
+    Args:
+        selected_criteria (dict): Criteria settings from the session state
+
+    Returns:
+        dict: Criterion name -> parameters, active criteria only
+    """
+    config = {}
+    if selected_criteria.get('pct_change', False):
+        config['pct_change'] = {
+            'periods': int(selected_criteria.get('pct_change_period', 4)),
+            'threshold': float(selected_criteria.get('pct_change_threshold', 2)),
+        }
+    if selected_criteria.get('macd', False):
+        config['macd_hist'] = {
+            'fast_period': int(selected_criteria.get('short_period', 4)),
+            'slow_period': int(selected_criteria.get('long_period', 8)),
+            'signal_period': int(selected_criteria.get('signal_period', 3)),
+            'threshold': float(selected_criteria.get('macd_threshold', 2)),
+        }
+    if selected_criteria.get('exp_smoothing', False):
+        config['exp_smooth'] = {
+            'trend_type': selected_criteria.get('exp_trend', 'add'),
+            'seasonal_type': selected_criteria.get('exp_seasonal', 'add'),
+            'seasonal_periods': int(selected_criteria.get('exp_seasonal_period', 4)),
+            'threshold': float(selected_criteria.get('exp_smoothing_threshold', 2)),
+            'engine': selected_criteria.get('exp_engine', EXP_SMOOTHING_ENGINE),
+        }
+    if selected_criteria.get('seasonal', False):
+        config['seasonal'] = {
+            'model': selected_criteria.get('seasonal_model', 'additive'),
+            'period': int(selected_criteria.get('seasonal_period', 4)),
+            'threshold': float(selected_criteria.get('seasonal_threshold', 2)),
+        }
+    return config
+
+def native_config(config):
+    # The cube fits exponential smoothing with the native engine, the only one that runs
+    # over the whole vocabulary, whatever engine the session has selected
+    config = {name: dict(params) for name, params in config.items()}
+    if 'exp_smooth' in config:
+        config['exp_smooth']['engine'] = 'native'
+    return config
+
+def model_config(config):
+    # Criteria settings without the z-score thresholds, which are applied when the cube is read
+    return {name: {key: value for key, value in params.items() if key != 'threshold'} for name, params in config.items()}
+
+def cube_key(dataset_version, config):
+    # Thresholds are left out, moving a threshold slider reuses the same cube
+    payload = json.dumps([dataset_version, model_config(config)], sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+def criterion_zscores(block, name, params):
+    # Z-scored statistic of one criterion for a block of rows, a quarter signals above the threshold
+    params = {key: value for key, value in params.items() if key not in ('threshold', 'engine')}
+    if name == 'pct_change':
+        return pct_change_signals(block, **params)[1]
+    if name == 'macd_hist':
+        return macd_signals(block, **params)[1]
+    if name == 'exp_smooth':
+        return exponential_smoothing_signals(block, **params)[1]
+    return seasonal_signals(block, **params)[1]
+
+def count_planes(planes):
+    """
+    Add packed bit planes position by position with a bit-sliced ripple-carry
+    adder, so every byte counts eight quarters at once.
+
+    Args:
+        planes (list): Packed uint8 arrays of the same shape, one per criterion
+
+    Returns:
+        list: Packed bit planes of the counts, least significant bit first
+    """
+    counter = [np.zeros_like(planes[0]) for _ in range(len(planes).bit_length())]
+    for carry in planes:
+        for i in range(len(counter)):
+            counter[i], carry = counter[i] ^ carry, counter[i] & carry
+    return counter
+
+def greater_than(counter, threshold):
+    # Packed mask of the positions whose count exceeds the threshold, most significant bit first
+    greater = np.zeros_like(counter[0])
+    equal = np.full_like(counter[0], 0xFF)
+    for i in reversed(range(len(counter))):
+        if (threshold >> i) & 1:
+            equal &= counter[i]
+        else:
+            greater |= equal & counter[i]
+            equal &= ~counter[i]
+    return greater
+
+def build_signal_cube(dataset, config, path, chunk_size=None):
+    """
+    Evaluate the criteria for every n-gram and save them as a signal cube:
+    the z-scores of every criterion (criterion x n-gram x quarter, float32)
+    and the signals at the thresholds of the config packed into a bitset
+    (eight quarters per byte).
+
+    Rows are processed in chunks with the vectorized criteria kernels and
+    written straight to memory-mapped files, so memory stays bounded by one
+    chunk of float64 values, sized to CHUNK_MAX_BYTES. The consensus of analyze_trends (more than half
+    of the active criteria agree) is computed on the packed bytes, and its
+    popcount per row gives the number of consensus quarters of every n-gram.
+    The cube is written to a temporary directory first, readers never see a
+    partial cube.
+
+    Args:
+        dataset (NgramDataset): Dataset handle
+        config (dict): Active criteria and their parameters, from cube_config
+        path (str): Cube directory, from cube_path
+        chunk_size (int): Number of rows evaluated at a time, derived from CHUNK_MAX_BYTES if not given
+
+    Returns:
+        dict: Memory-mapped cube, as returned by open_signal_cube
+    """
+    if config.get('exp_smooth', {}).get('engine', 'native') != 'native':
+        raise ValueError("The signal cube fits exponential smoothing with the native engine")
+
+    criteria = [name for name in CRITERIA if name in config]
+    if not criteria:
+        raise ValueError("At least one criterion must be active")
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    n_rows, n_quarters = dataset.shape
+    chunk_size = chunk_size or budget_chunk_size(n_quarters, CHUNK_ARRAYS)
+    n_bytes = (n_quarters + 7) // 8
+    open_memmap = np.lib.format.open_memmap
+    zscores = open_memmap(os.path.join(tmp_path, ZSCORES_FILE), mode="w+", dtype=np.float32, shape=(len(criteria), n_rows, n_quarters))
+    bits = open_memmap(os.path.join(tmp_path, BITS_FILE), mode="w+", dtype=np.uint8, shape=(len(criteria), n_rows, n_bytes))
+    consensus = open_memmap(os.path.join(tmp_path, CONSENSUS_FILE), mode="w+", dtype=np.uint8, shape=(n_rows, n_bytes))
+    threshold = math.ceil(len(criteria) / 2.0)
+
+    with np.errstate(all="ignore"):
+        for start, stop, block in dataset.row_chunks(chunk_size):
+            planes = []
+            for c, name in enumerate(criteria):
+                z = criterion_zscores(block, name, config[name])
+                zscores[c, start:stop] = z
+                # NaN compares as False, so undefined statistics never signal
+                planes.append(np.packbits(z > config[name]['threshold'], axis=-1))
+                bits[c, start:stop] = planes[-1]
+            consensus[start:stop] = greater_than(count_planes(planes), threshold)
+
+    np.save(os.path.join(tmp_path, CONSENSUS_COUNT_FILE), POPCOUNT[consensus].sum(axis=1, dtype=np.int32))
+    for array in (zscores, bits, consensus):
+        array.flush()
+    del zscores, bits, consensus
+    with open(os.path.join(tmp_path, META_FILE), "w") as f:
+        json.dump({'config': config, 'criteria': criteria, 'quarters': dataset.columns.tolist()}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return open_signal_cube(path)
+
+def open_signal_cube(path):
+    """
+    Open a saved cube, the arrays stay memory-mapped.
+
+    Returns:
+        dict: 'zscores' (criteria, rows, quarters), 'bits' (criteria, rows, bytes),
+            'consensus' (rows, bytes) and 'consensus_count' (rows,) arrays, plus
+            the config, criteria and quarters, or None if the cube does not exist
+    """
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        return None
+    with open(os.path.join(path, META_FILE)) as f:
+        cube = json.load(f)
+    cube['zscores'] = np.load(os.path.join(path, ZSCORES_FILE), mmap_mode="r")
+    cube['bits'] = np.load(os.path.join(path, BITS_FILE), mmap_mode="r")
+    cube['consensus'] = np.load(os.path.join(path, CONSENSUS_FILE), mmap_mode="r")
+    cube['consensus_count'] = np.load(os.path.join(path, CONSENSUS_COUNT_FILE), mmap_mode="r")
+    return cube
+
+def cube_path(dataset_version, config):
+    return os.path.join(SIGNAL_CUBE_DIR, cube_key(dataset_version, config))
+
+def same_thresholds(cube, config):
+    # The packed bits hold the signals at the thresholds the cube was built with
+    return config is None or all(config[name]['threshold'] == cube['config'][name]['threshold'] for name in cube['criteria'])
+
+def cube_signals(cube, rows, config=None):
+    """
+    Signals of a row or an array of rows, read from the packed bits at the
+    build thresholds, or from the stored z-scores at the thresholds of config.
+
+    Args:
+        cube (dict): Cube from build_signal_cube or open_signal_cube
+        rows (int or np.ndarray): Row offsets
+        config (dict): Criteria settings with the same model parameters as the cube,
+            None for the build thresholds
+
+    Returns:
+        np.ndarray: Boolean signals, criteria first and quarters last
+    """
+    if same_thresholds(cube, config):
+        return np.unpackbits(cube['bits'][:, rows], axis=-1, count=len(cube['quarters'])).astype(bool)
+    zscores = np.asarray(cube['zscores'][:, rows])
+    thresholds = np.array([config[name]['threshold'] for name in cube['criteria']], dtype=np.float32)
+    return zscores > thresholds.reshape((-1,) + (1,) * (zscores.ndim - 1))
+
+def cube_consensus(cube, rows, config=None):
+    """
+    Consensus quarters of a row or an array of rows, see cube_signals.
+
+    Returns:
+        np.ndarray: Boolean consensus, quarters last
+    """
+    if same_thresholds(cube, config):
+        return np.unpackbits(cube['consensus'][rows], axis=-1, count=len(cube['quarters'])).astype(bool)
+    signals = cube_signals(cube, rows, config)
+    return signals.sum(axis=0) > math.ceil(len(cube['criteria']) / 2.0)
+
+def cube_trends(cube, row, config=None):
+    """
+    Trend analysis of one n-gram, sliced from the cube.
+
+    Args:
+        cube (dict): Cube from build_signal_cube or open_signal_cube
+        row (int): Row offset of the n-gram
+        config (dict): Criteria settings with the same model parameters as the cube,
+            None for the thresholds the cube was built with
+
+    Returns:
+        dict: Results in the format of analyze_trends
+    """
+    index = pd.Index(cube['quarters'])
+    signals = pd.DataFrame(
+        cube_signals(cube, row, config).T,
+        index=index,
+        columns=cube['criteria'],
+    )
+    consensus = cube_consensus(cube, row, config)
+    return {
+        'consensus': {
+            'points': index[consensus].tolist(),
+            'signals': signals,
+            'signal_count': signals.sum(axis=1),
+            'active_criteria': len(cube['criteria']),
+        }
+    }
+
+if __name__ == "__main__":
+    from utils.ngram_dataset import NgramDataset
+
+    parser = argparse.ArgumentParser(description="Build the signal cube of a store with the default criteria.")
+    parser.add_argument("--target", default=NGRAM_DATASET_PATH, help="Store directory")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Rows evaluated at a time (default: from CHUNK_MAX_BYTES)")
+    args = parser.parse_args()
+
+    dataset = NgramDataset.open(args.target)
+    config = native_config(cube_config({'pct_change': True, 'macd': True, 'exp_smoothing': True, 'seasonal': True}))
+    cube = build_signal_cube(dataset, config, cube_path(dataset.version, config), args.chunk_size)
+    print(f"Built the signal cube of {len(dataset)} n-grams, "
+          f"{int((cube['consensus_count'] > 0).sum())} with consensus quarters")
@@ -0,0 +1,225 @@
+import os
+import json
+import numpy as np
+from methods.recursive_state import init_state, update_state, state_macd, state_pct_change, state_rolling_mean, ROW_KEYS
+from methods.criteria_functions.percent_change import calculate_pct_matrix
+from methods.criteria_functions.macd import calculate_macd_matrix
+from methods.criteria_functions.holt_winters import fit_holt_winters_matrix, holt_winters_filter
+from methods.trend_zones import trend_line_matrix
+from utils.helper_functions import budget_chunk_size
+
+# File name of the persisted state inside a leaderboard directory
+SIGNAL_STATE_FILE = "signal_state.npz"
+
+# Statistics that are z-scored against their running moments
+MOMENT_KEYS = ['pct', 'macd', 'exp', 'trend']
+
+# Float64 (rows, quarters) arrays per chunk: the block, the percent change, the MACD lines,
+# the Holt-Winters components and the trend line
+CHUNK_ARRAYS = 12
+
+def recursive_params(config):
+    # EMAs follow the MACD settings of the cube, the history covers the percent change period
+    macd = config.get('macd_hist', {})
+    periods = config.get('pct_change', {}).get('periods', 4)
+    return {
+        'fast_period': macd.get('fast_period', 4),
+        'slow_period': macd.get('slow_period', 8),
+        'signal_period': macd.get('signal_period', 3),
+        'window': 4,
+        'history': periods + 1,
+    }
+
+def add_moments(state, key, values, rows=slice(None)):
+    # Fold the finite values of a (rows, quarters) block into the running moments
+    values = np.asarray(values, dtype=np.float64).reshape(len(values), -1)
+    finite = np.isfinite(values)
+    clean = np.where(finite, values, 0.0)
+    state[f"{key}_count"][rows] += finite.sum(axis=1)
+    state[f"{key}_sum"][rows] += clean.sum(axis=1)
+    state[f"{key}_sum_sq"][rows] += (clean * clean).sum(axis=1)
+
+def moments_zscore(state, key, values):
+    # Z-score of the latest values against the moments that already include them (ddof=0)
+    count = state[f"{key}_count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = state[f"{key}_sum"] / count
+        std = np.sqrt(np.maximum(state[f"{key}_sum_sq"] / count - mean * mean, 0))
+        return (values - mean) / std
+
+def build_signal_state(dataset, config, chunk_size=None):
+    """
+    Per-n-gram state of the criteria after the last quarter of the dataset:
+    the MACD EMAs, rolling sums and recent history of recursive_state, the
+    final Holt-Winters level, trend and seasonal factors with their fitted
+    smoothing parameters, the last moving average and differences of the
+    trend line, and running moments of every z-scored statistic.
+
+    Args:
+        dataset (NgramDataset): Dataset handle
+        config (dict): Cube config from cube_config
+        chunk_size (int): Number of rows evaluated at a time, derived from CHUNK_MAX_BYTES if not given
+
+    Returns:
+        dict: State with one entry (or row) per n-gram
+    """
+    n_rows, n_quarters = dataset.shape
+    chunk_size = chunk_size or budget_chunk_size(n_quarters, CHUNK_ARRAYS)
+    params = recursive_params(config)
+    exp = config.get('exp_smooth')
+    m = exp['seasonal_periods'] if exp and exp['seasonal_type'] else 0
+
+    state = init_state(n_rows, params)
+    state['ma'] = np.full(n_rows, np.nan)
+    state['ma_diffs'] = np.full((n_rows, 4), np.nan)
+    for key in MOMENT_KEYS:
+        state[f"{key}_count"] = np.zeros(n_rows)
+        state[f"{key}_sum"] = np.zeros(n_rows)
+        state[f"{key}_sum_sq"] = np.zeros(n_rows)
+    state['pct_inf'] = np.zeros(n_rows, dtype=bool)
+    state['hw_valid'] = np.zeros(n_rows, dtype=bool)
+    state['hw_params'] = np.full((n_rows, 3), np.nan)
+    state['hw_level'] = np.full(n_rows, np.nan)
+    state['hw_trend'] = np.full(n_rows, np.nan)
+    state['hw_seasonals'] = np.full((n_rows, m), np.nan)
+
+    with np.errstate(all="ignore"):
+        for start, stop, block in dataset.row_chunks(chunk_size):
+            rows = slice(start, stop)
+            chunk_state = init_state(stop - start, params)
+            for t in range(n_quarters):
+                update_state(chunk_state, block[:, t])
+            for key in ROW_KEYS:
+                state[key][rows] = chunk_state[key]
+
+            if 'pct_change' in config:
+                pct = calculate_pct_matrix(block, config['pct_change']['periods'])
+                state['pct_inf'][rows] = np.isinf(pct).any(axis=1)
+                add_moments(state, 'pct', pct, rows)
+            if 'macd_hist' in config:
+                macd = config['macd_hist']
+                add_moments(state, 'macd', calculate_macd_matrix(block, macd['fast_period'], macd['slow_period'], macd['signal_period'])[2], rows)
+            if exp:
+                fit = fit_holt_winters_matrix(block, exp['trend_type'], exp['seasonal_type'], exp['seasonal_periods'])
+                add_moments(state, 'exp', fit['residuals'], rows)
+                state['hw_valid'][rows] = fit['valid']
+                state['hw_params'][rows] = fit['params']
+                state['hw_level'][rows] = fit['level'][:, -1]
+                state['hw_trend'][rows] = fit['trend'][:, -1] if exp['trend_type'] else 0.0
+                # The last m seasonal factors in time order, the first one is used next
+                state['hw_seasonals'][rows] = fit['seasonal'][:, n_quarters - m:]
+
+            trend = trend_line_matrix(block)
+            add_moments(state, 'trend', trend, rows)
+            ma_diffs = np.full((stop - start, 4), np.nan)
+            tail = trend_ma_diffs(block)
+            ma_diffs[:, 4 - tail.shape[1]:] = tail
+            state['ma_diffs'][rows] = ma_diffs
+            state['ma'][rows] = block[:, -4:].mean(axis=1)
+
+    state['n_quarters'] = n_quarters
+    return state
+
+def trend_ma_diffs(values):
+    # Last (up to) 4 differences of the 4-quarter moving average, oldest first
+    n_quarters = values.shape[1]
+    ma = np.stack([values[:, max(t - 3, 0):t + 1].mean(axis=1) for t in range(max(n_quarters - 5, 0), n_quarters)], axis=1)
+    return np.diff(ma, axis=1)[:, -4:]
+
+def advance_signal_state(state, column, config):
+    """
+    Fold one new quarter into the state in a single O(vocabulary) pass and
+    evaluate the criteria for it.
+
+    Percent change, MACD and the trend line are causal, so their values for
+    the new quarter and the z-scores against the updated moments are the
+    same as a full recomputation gives for the last quarter. Holt-Winters is
+    advanced one step with the smoothing parameters of the last fit. The
+    centered moving average of the seasonal decomposition is not defined at
+    the last quarter, so that criterion never signals there.
+
+    Args:
+        state (dict): State from build_signal_state, updated in place
+        column (np.ndarray): Frequencies of the new quarter, one per n-gram
+        config (dict): Cube config the state was built with
+
+    Returns:
+        tuple: (dict of criterion -> boolean signals for the new quarter, trend line z-scores)
+    """
+    x = np.asarray(column, dtype=np.float64)
+    update_state(state, x)
+    signals = {}
+
+    with np.errstate(all="ignore"):
+        if 'pct_change' in config:
+            pct = state_pct_change(state, config['pct_change']['periods'])
+            state['pct_inf'] |= np.isinf(pct)
+            add_moments(state, 'pct', pct)
+            z = moments_zscore(state, 'pct', pct)
+            # An infinite change poisons the z-scores of the whole row, as in zs()
+            signals['pct_change'] = (z > config['pct_change']['threshold']) & ~state['pct_inf']
+
+        if 'macd_hist' in config:
+            histogram = state_macd(state)[2]
+            add_moments(state, 'macd', histogram)
+            signals['macd_hist'] = moments_zscore(state, 'macd', histogram) > config['macd_hist']['threshold']
+
+        if 'exp_smooth' in config:
+            exp = config['exp_smooth']
+            valid = state['hw_valid'] & np.isfinite(x)
+            if "mul" in (exp['trend_type'], exp['seasonal_type']):
+                valid &= x > 0
+            residual = np.full(len(x), np.nan)
+            if valid.any():
+                alpha, beta, gamma = state['hw_params'][valid].T[:, :, None]
+                step = holt_winters_filter(
+                    x[valid, None], alpha, beta, gamma, exp['trend_type'], exp['seasonal_type'], exp['seasonal_periods'],
+                    initial=(state['hw_level'][valid, None], state['hw_trend'][valid, None], state['hw_seasonals'][valid, None, :]),
+                    keep_components=True,
+                )
+                residual[valid] = x[valid] - step['fitted'][:, 0, 0]
+                state['hw_level'][valid] = step['state']['level'][:, 0]
+                if exp['trend_type']:
+                    state['hw_trend'][valid] = step['state']['trend'][:, 0]
+                # The factor just used moves to the back of the cycle
+                state['hw_seasonals'][valid] = np.roll(step['state']['seasonals'][:, 0], -1, axis=-1)
+            state['hw_valid'] = valid
+            add_moments(state, 'exp', residual)
+            signals['exp_smooth'] = moments_zscore(state, 'exp', residual) > exp['threshold']
+
+        if 'seasonal' in config:
+            signals['seasonal'] = np.zeros(len(x), dtype=bool)
+
+        # Trend line of the zone detection: difference of the moving average, averaged over 4 quarters
+        ma = state_rolling_mean(state)
+        state['ma_diffs'][:, :-1] = state['ma_diffs'][:, 1:]
+        state['ma_diffs'][:, -1] = ma - state['ma']
+        state['ma'] = ma
+        trend = np.nanmean(state['ma_diffs'], axis=1)
+        add_moments(state, 'trend', trend)
+        z_trend = moments_zscore(state, 'trend', trend)
+
+    return signals, z_trend
+
+def save_signal_state(path, state):
+    header = json.dumps({'params': state['params'], 'n_quarters': state['n_quarters']})
+    arrays = {key: value for key, value in state.items() if key not in ('params', 'n_quarters')}
+    tmp_file = os.path.join(path, f"{SIGNAL_STATE_FILE}.tmp")
+    with open(tmp_file, "wb") as f:
+        np.savez(f, header=np.array(header), **arrays)
+    os.replace(tmp_file, os.path.join(path, SIGNAL_STATE_FILE))
+
+def load_signal_state(path):
+    """
+    Load the signal state saved with a leaderboard.
+
+    Returns:
+        dict or None: State, or None if the leaderboard has none
+    """
+    state_path = os.path.join(path, SIGNAL_STATE_FILE)
+    if not os.path.exists(state_path):
+        return None
+    with np.load(state_path) as data:
+        state = {key: data[key] for key in data.files if key != 'header'}
+        state.update(json.loads(str(data['header'])))
+    return state
@@ -0,0 +1,145 @@
+import numpy as np
+from utils.helper_functions import zs
+
+def z_trend_line(series):
+    """
+    Z-scored smoothed derivative of a series: the 4-quarter moving average is
+    differenced and smoothed again over 4 quarters.
+
+    Args:
+        series (pd.Series): Original time series
+
+    Returns:
+        pd.Series: Z-scores of the trend line, from the second quarter on
+    """
+    ma = series.rolling(window=4, min_periods=1).mean()
+    ma_diff = ma.diff()
+    trend_line = ma_diff.rolling(window=4, min_periods=1).mean().dropna()
+    return zs(trend_line)
+
+def trend_line_matrix(values):
+    """
+    Smoothed derivative of every row of a matrix at once, the unscaled trend
+    line of z_trend_line: 4-quarter moving average, difference, 4-quarter
+    mean of the differences. The first quarter is NaN.
+
+    Args:
+        values (np.ndarray): 2D float array without NaNs, one series per row
+
+    Returns:
+        np.ndarray: Trend line values with the same shape
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_quarters = values.shape[1]
+    counts = np.minimum(np.arange(1, n_quarters + 1), 4)
+
+    cumsum = np.zeros((len(values), n_quarters + 1))
+    np.cumsum(values, axis=1, out=cumsum[:, 1:])
+    ma = (cumsum[:, 1:] - cumsum[:, np.maximum(np.arange(n_quarters) - 3, 0)]) / counts
+
+    trend = np.full(values.shape, np.nan)
+    if n_quarters > 1:
+        # Mean of the up to 4 defined differences ending at every quarter
+        diff_cumsum = np.zeros((len(values), n_quarters))
+        np.cumsum(np.diff(ma, axis=1), axis=1, out=diff_cumsum[:, 1:])
+        stop = np.arange(1, n_quarters)
+        start = np.maximum(stop - 4, 0)
+        trend[:, 1:] = (diff_cumsum[:, stop] - diff_cumsum[:, start]) / (stop - start)
+    return trend
+
+def zone_bounds(above, consensus):
+    """
+    Trend zones of many series at once, with the greedy semantics of
+    trend_zones: every consensus point grows left and right over the
+    contiguous run of quarters at or above the threshold, points inside an
+    earlier zone are skipped and a zone never grows into an earlier one.
+
+    The runs are found with cumulative maximum/minimum scans over the
+    positions that are below the threshold, and a consensus point starts a
+    zone if it lies beyond the right end of every earlier zone (the right
+    ends grow with the position, so one cumulative maximum decides this).
+
+    Args:
+        above (np.ndarray): Boolean (rows, quarters), trend line at or above the threshold
+        consensus (np.ndarray): Boolean (rows, quarters), consensus points
+
+    Returns:
+        tuple: Boolean (rows, quarters) mask of the quarters that start a zone,
+            and (rows, quarters) integer arrays with the first and last quarter
+            of the zone started there (-1 elsewhere)
+    """
+    n_rows, n_quarters = above.shape
+    positions = np.broadcast_to(np.arange(n_quarters), above.shape)
+
+    # Last quarter below the threshold before every position, first one after it
+    last_below = np.maximum.accumulate(np.where(above, -1, positions), axis=1)
+    next_below = np.minimum.accumulate(np.where(above, n_quarters, positions)[:, ::-1], axis=1)[:, ::-1]
+    left = np.empty_like(last_below)
+    left[:, 0] = 0
+    left[:, 1:] = last_below[:, :-1] + 1
+    right = np.full_like(next_below, n_quarters - 1)
+    right[:, :-1] = next_below[:, 1:] - 1
+
+    # Right end of the zones of all earlier consensus points
+    reach = np.maximum.accumulate(np.where(consensus, right, -1), axis=1)
+    previous_reach = np.full_like(reach, -1)
+    previous_reach[:, 1:] = reach[:, :-1]
+
+    starts = consensus & (positions > previous_reach)
+    first = np.where(starts, np.maximum(left, previous_reach + 1), -1)
+    last = np.where(starts, right, -1)
+    return starts, first, last
+
+def zone_mask(starts, first, last):
+    # Boolean (rows, quarters) mask of the quarters inside any zone
+    n_rows, n_quarters = starts.shape
+    rows, _ = np.nonzero(starts)
+    delta = np.zeros((n_rows, n_quarters + 1), dtype=np.int32)
+    np.add.at(delta, (rows, first[starts]), 1)
+    np.add.at(delta, (rows, last[starts] + 1), -1)
+    return np.cumsum(delta[:, :-1], axis=1) > 0
+
+def trend_zones(z_trend, consensus_points, threshold):
+    """
+    Grow a zone around every consensus point while the z-scored trend line
+    stays at or above the threshold. Points already inside an earlier zone
+    are skipped and zones never overlap.
+
+    Args:
+        z_trend (pd.Series): Z-scored trend line from z_trend_line
+        consensus_points (list): Quarters where the criteria agree, in quarter order
+        threshold (float): Minimum z-score of the trend line inside a zone
+
+    Returns:
+        list: Zones, each a list of consecutive quarters
+    """
+    index = z_trend.index
+    positions = index.get_indexer(consensus_points)
+    consensus = np.zeros((1, len(index)), dtype=bool)
+    consensus[0, positions[positions >= 0]] = True
+
+    with np.errstate(invalid="ignore"):
+        above = (z_trend.to_numpy() >= threshold)[None, :]
+    starts, first, last = zone_bounds(above, consensus)
+
+    labels = index.tolist()
+    return [labels[a:b + 1] for a, b in zip(first[starts], last[starts])]
+
+def trend_zone_matrix(z_trend, consensus, threshold):
+    """
+    Trend zone mask of every row of a matrix at once.
+
+    Args:
+        z_trend (np.ndarray): Z-scored trend lines (rows, quarters), from trend_line_matrix
+        consensus (np.ndarray): Boolean (rows, quarters) consensus points
+        threshold (float): Minimum z-score of the trend line inside a zone
+
+    Returns:
+        np.ndarray: Boolean (rows, quarters) mask of the quarters in a trend zone
+    """
+    with np.errstate(invalid="ignore"):
+        above = z_trend >= threshold
+    # The trend line starts at the second quarter, a consensus point before it is skipped
+    consensus = consensus.copy()
+    consensus[:, :1] = False
+    return zone_mask(*zone_bounds(above, consensus))
@@ -6,8 +6,78 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Path to the dataset directory
 DATA_DIR = os.path.join(BASE_DIR, "dataset")
 
-# Path to the n-gram dataset file
-NGRAM_DATASET_PATH = os.path.join(DATA_DIR, "1grams_time_cols.pkl")
+# Path to the raw timestamped corpus read by utils/preprocessing.py
+RAW_CORPUS_DIR = os.path.join(DATA_DIR, "raw")
+
+# Path to the pickled n-gram dataset (source for the converter in utils/ngram_store.py)
+NGRAM_PICKLE_PATH = os.path.join(DATA_DIR, "1grams_time_cols.pkl")
+
+# Path to the memory-mapped n-gram store (falls back to the pickle if missing)
+NGRAM_DATASET_PATH = os.path.join(DATA_DIR, "1grams_time_cols")
+
+# Path to the sharded stores of longer n-grams (one sub-directory per n, e.g. "n2")
+NGRAM_SHARDS_DIR = os.path.join(DATA_DIR, "ngrams")
+
+# Target number of n-grams per shard, keeps a cold shard lookup small
+SHARD_TARGET_ROWS = 50000
 
 # Path to the cache directory
-CACHE_DIR = os.path.join(BASE_DIR, "cache")
\ No newline at end of file
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+
+# Storage mode for the n-gram frequency matrix:
+#   "float64" - dense, full precision
+#   "float32" - dense, half the memory of float64
+#   "sparse"  - CSR rows, only non-zero values are stored
+#   "auto"    - "sparse" when the share of non-zero values is below SPARSE_DENSITY_THRESHOLD, else "float32"
+NGRAM_STORAGE_MODE = "auto"
+SPARSE_DENSITY_THRESHOLD = 0.3
+
+# Number of leading quarters in the dataset that are empty and trimmed on load
+LEADING_EMPTY_QUARTERS = 4
+
+# Spare quarter columns reserved in dense stores so new quarters can be appended in place
+QUARTER_CAPACITY_SLACK = 8
+
+# Number of partial matches suggested when the n-gram is not found, ranked by total frequency
+PARTIAL_MATCH_LIMIT = 20
+
+# Typo-tolerant lookups: number of "did you mean" suggestions and how many of the
+# most frequent n-grams the deletion index covers (None for the whole vocabulary)
+FUZZY_MATCH_LIMIT = 5
+FUZZY_INDEX_LIMIT = 250000
+
+# Default exponential smoothing engine of the per n-gram analysis (selectable on the criteria page):
+#   "statsmodels" - ExponentialSmoothing fitted with a numerical optimizer, one series at a time
+#   "native"      - vectorized Holt-Winters recursions with a grid search refined by Levenberg-Marquardt
+#                   (methods/criteria_functions/holt_winters.py)
+# The signal cube and the leaderboard always use the native engine
+EXP_SMOOTHING_ENGINE = "statsmodels"
+
+# Memory the native engine may take per grid search, every coarse grid candidate of a row is
+# filtered at once, so the rows of a block are fitted in groups that stay within this size
+NATIVE_FIT_MAX_BYTES = 128 * 1024 * 1024
+
+# Memory one chunk of a corpus-wide pass (criteria kernels, signal cube, signal state, leaderboard
+# scoring) may take; the rows per chunk are derived from it and the number of quarters
+CHUNK_MAX_BYTES = 128 * 1024 * 1024
+
+# Persistent cache of fitted criteria components (exponential smoothing, seasonal decomposition),
+# shared across sessions and restarts; least recently used fits are evicted above this size
+FIT_CACHE_DIR = os.path.join(CACHE_DIR, "fits")
+FIT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Packed signal cubes (criterion x n-gram x quarter) built by methods/signal_cube.py,
+# one per dataset version and model settings (the thresholds are applied when a cube is read)
+SIGNAL_CUBE_DIR = os.path.join(CACHE_DIR, "signal_cubes")
+
+# Hotness leaderboards built by methods/leaderboard.py, one per dataset version and criteria settings
+LEADERBOARD_DIR = os.path.join(CACHE_DIR, "leaderboards")
+
+# Out-of-core PCA (methods/dimensionality.py): datasets whose dense float64 matrix exceeds this
+# size are fitted with IncrementalPCA over row chunks instead of being loaded at once, and the
+# embedding and fitted components are persisted under PCA_DIR, one per dataset version
+PCA_IN_MEMORY_MAX_BYTES = 512 * 1024 * 1024
+PCA_CHUNK_SIZE = 65536
+PCA_DIR = os.path.join(CACHE_DIR, "pca")
+# Points drawn in the PCA scatter plot of an out-of-core embedding, sampled evenly over the rows
+PCA_PLOT_MAX_POINTS = 50000
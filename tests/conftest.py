@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+QUARTERS = [f"{2010 + i // 4}Q{i % 4 + 1}" for i in range(60)]
+
+
+@pytest.fixture
+def frequencies():
+    """
+    Counts of 200 n-grams over 60 quarters: seasonal growth with noise, plus
+    rows with zero runs, a burst, a constant row and an all-zero row, so the
+    kernels hit their NaN and infinity cases.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(len(QUARTERS))
+    level = rng.uniform(5, 500, (200, 1))
+    growth = rng.uniform(-0.02, 0.04, (200, 1))
+    season = 1 + rng.uniform(0, 0.3, (200, 1)) * np.sin(2 * np.pi * t / 4 + rng.uniform(0, 6, (200, 1)))
+    values = np.round(level * (1 + growth) ** t * season * np.exp(rng.normal(0, 0.1, (200, len(t)))))
+    values[:40, :12] = 0
+    values[40:60, rng.integers(0, len(t), 20)] = 0
+    values[60, 30:34] *= 20
+    values[61] = 7
+    values[62] = 0
+    return values
+
+
+@pytest.fixture
+def positive_series():
+    # Positive seasonal series with multiplicative growth and noise, for the multiplicative models
+    rng = np.random.default_rng(1)
+    t = np.arange(len(QUARTERS))
+    series = []
+    for i in range(8):
+        level = rng.uniform(20, 200)
+        growth = rng.uniform(-0.01, 0.03)
+        season = 1 + rng.uniform(0.05, 0.4) * np.sin(2 * np.pi * t / 4 + rng.uniform(0, 6))
+        noise = np.exp(rng.normal(0, rng.uniform(0.02, 0.2), len(t)))
+        series.append(pd.Series(level * (1 + growth) ** t * season * noise, index=QUARTERS, name=f"series{i}"))
+    return series
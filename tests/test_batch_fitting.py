@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+from methods import batch_fitting
+from utils.ngram_dataset import NgramDataset
+from tests.conftest import QUARTERS
+
+
+def test_failing_series_do_not_stop_the_chunk(positive_series, monkeypatch):
+    df = pd.DataFrame([series.to_numpy() for series in positive_series[:4]], index=["a", "b", "c", "d"], columns=QUARTERS)
+    df.iloc[2, 10] = 0
+    monkeypatch.setattr("methods.batch_fitting._worker_dataset", NgramDataset.from_frame(df))
+    rows = np.arange(4)
+
+    _, cold, cold_sse, failures = batch_fitting.fit_chunk(rows, "add", "mul", 4)
+    assert list(failures) == [2]
+    assert np.isfinite(cold_sse[[0, 1, 3]]).all() and np.isnan(cold[2]).all()
+
+    # Warm starts from the previous run, the failed row falls back to the native start
+    _, warm, warm_sse, failures = batch_fitting.fit_chunk(rows, "add", "mul", 4, warm_starts=cold)
+    assert list(failures) == [2]
+    assert np.isnan(warm_sse[2])
+    np.testing.assert_allclose(warm_sse[[0, 1, 3]], cold_sse[[0, 1, 3]], rtol=1e-2)
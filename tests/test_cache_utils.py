@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from utils import cache_utils
+from tests.conftest import QUARTERS
+
+
+@pytest.fixture
+def fit_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.cache_utils.FIT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr("utils.cache_utils.fit_cache_bytes", {})
+    return tmp_path
+
+
+def fitted(series, success=True):
+    def fit():
+        fit.calls += 1
+        return {
+            'success': success,
+            'error': None if success else "did not converge",
+            'components': {'level': series * 2} if success else {},
+            'forecast': None,
+        }
+    fit.calls = 0
+    return fit
+
+
+def test_fits_are_cached_per_store_version(fit_cache):
+    series = pd.Series(np.arange(len(QUARTERS), dtype=float), index=QUARTERS, name="ngram")
+    fit = fitted(series)
+    for version in ("unigrams", "unigrams", "shard-a", "shard-b"):
+        result = cache_utils.cached_fit(version, series, "exp_smoothing", {'trend': 'add'}, fit)
+        pd.testing.assert_series_equal(result['components']['level'], series * 2, check_names=False)
+    assert fit.calls == 3
+
+
+def test_failed_fits_are_not_cached(fit_cache):
+    series = pd.Series(np.ones(len(QUARTERS)), index=QUARTERS, name="ngram")
+    fit = fitted(series, success=False)
+    for _ in range(2):
+        assert not cache_utils.cached_fit("unigrams", series, "exp_smoothing", {}, fit)['success']
+    assert fit.calls == 2
+    assert os.listdir(fit_cache) == []
+
+
+def test_size_is_tracked_without_scans(fit_cache, monkeypatch):
+    series = pd.Series(np.arange(len(QUARTERS), dtype=float), index=QUARTERS, name="ngram")
+    scans = []
+    scan_fits = cache_utils.scan_fits
+    monkeypatch.setattr("utils.cache_utils.scan_fits", lambda: scans.append(1) or scan_fits())
+
+    for i in range(10):
+        cache_utils.cached_fit("unigrams", series, "exp_smoothing", {'i': i}, fitted(series))
+    size = os.path.getsize(cache_utils.get_fit_path(cache_utils.fit_cache_key("unigrams", "ngram", "exp_smoothing", {'i': 0})))
+    assert len(scans) == 1
+    assert cache_utils.fit_cache_bytes[str(fit_cache)] == 10 * size
+
+    # Going over the limit evicts the oldest fits down to the eviction fraction
+    monkeypatch.setattr("utils.cache_utils.FIT_CACHE_EVICT_FRACTION", 0.6)
+    cache_utils.track_fit_bytes(0, max_bytes=10 * size - 1)
+    assert len(scans) == 2
+    assert len(os.listdir(fit_cache)) == 5
+    assert cache_utils.fit_cache_bytes[str(fit_cache)] == 5 * size
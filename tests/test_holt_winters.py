@@ -0,0 +1,45 @@
+import warnings
+import numpy as np
+import pytest
+from methods.criteria_functions.exponential_smoothing import compare_engines
+from methods.criteria_functions.holt_winters import fit_holt_winters_matrix
+
+CONFIGURATIONS = [
+    ("add", "add"), ("add", None), (None, "add"), (None, None),
+    ("add", "mul"), ("mul", "mul"), ("mul", None), ("mul", "add"), (None, "mul"),
+]
+
+
+@pytest.mark.parametrize("trend, seasonal", CONFIGURATIONS)
+def test_native_engine_matches_statsmodels(positive_series, trend, seasonal):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        results = [compare_engines(series, trend, seasonal, 4) for series in positive_series]
+    for series, result in zip(positive_series, results):
+        assert result['passed'], (series.name, result)
+
+
+@pytest.mark.parametrize("trend, seasonal", [("add", "add"), ("mul", "mul")])
+def test_rows_are_fitted_independently(positive_series, trend, seasonal):
+    values = np.vstack([series.to_numpy() for series in positive_series])
+    batch = fit_holt_winters_matrix(values, trend, seasonal, 4)
+    single = fit_holt_winters_matrix(values[3:4], trend, seasonal, 4)
+    np.testing.assert_allclose(batch['fitted'][3], single['fitted'][0], rtol=1e-9)
+
+
+def test_multiplicative_model_rejects_non_positive_rows(positive_series):
+    values = np.vstack([series.to_numpy() for series in positive_series[:2]])
+    values[1, 5] = 0
+    fit = fit_holt_winters_matrix(values, "add", "mul", 4)
+    assert fit['valid'].tolist() == [True, False]
+    assert np.isnan(fit['residuals'][1]).all()
+
+
+def test_groups_within_the_memory_budget(positive_series, monkeypatch):
+    values = np.vstack([series.to_numpy() for series in positive_series])
+    values[2, 5] = np.nan
+    whole = fit_holt_winters_matrix(values, "add", "add", 4)
+    monkeypatch.setattr("methods.criteria_functions.holt_winters.fit_group_rows", lambda *args: 3)
+    grouped = fit_holt_winters_matrix(values, "add", "add", 4)
+    for key in ("fitted", "params", "initial_seasonals", "forecast"):
+        np.testing.assert_allclose(grouped[key], whole[key], rtol=1e-9)
@@ -0,0 +1,45 @@
+import os
+import pandas as pd
+import pytest
+from methods.leaderboard import leaderboard_config, leaderboard_path, build_leaderboard, save_leaderboard, open_leaderboard
+from methods.signal_state import SIGNAL_STATE_FILE
+from utils.ingest import ingest_quarter
+from utils.ngram_dataset import NgramDataset
+from utils.ngram_store import write_ngram_store
+from tests.conftest import QUARTERS
+from tests.test_trend_detection import with_thresholds
+
+
+@pytest.fixture
+def store(frequencies, tmp_path, monkeypatch):
+    # Every quarter but the last, which is ingested by the tests
+    monkeypatch.setattr("methods.leaderboard.LEADERBOARD_DIR", str(tmp_path / "leaderboards"))
+    monkeypatch.setattr("methods.signal_cube.SIGNAL_CUBE_DIR", str(tmp_path / "cubes"))
+    df = pd.DataFrame(frequencies[:, :-1], index=[f"ngram{i}" for i in range(len(frequencies))], columns=QUARTERS[:-1])
+    path = str(tmp_path / "store")
+    write_ngram_store(df, path, mode="float32", leading_empty_quarters=0)
+    return path
+
+
+def save_board(path, threshold):
+    dataset = NgramDataset.open(path)
+    config = leaderboard_config(dict(with_thresholds(threshold), zone_threshold=0.5))
+    board_path = leaderboard_path(dataset.version, config)
+    save_leaderboard(board_path, build_leaderboard(dataset, config))
+    return config, board_path
+
+
+def test_failed_refresh_is_reported(store, frequencies):
+    config, refreshed = save_board(store, 2.0)
+    _, broken = save_board(store, 1.0)
+    os.remove(os.path.join(broken, SIGNAL_STATE_FILE))
+
+    counts = pd.Series(frequencies[:, -1], index=[f"ngram{i}" for i in range(len(frequencies))])
+    result = ingest_quarter(store, QUARTERS[-1], counts)
+    assert result['refreshed_leaderboards'] == 1
+    assert list(result['leaderboard_errors']) == [broken]
+    # The leaderboards of the previous version are superseded
+    assert not os.path.exists(refreshed) and not os.path.exists(broken)
+    board = open_leaderboard(leaderboard_path(result['version'], config))
+    assert board['quarters'] == QUARTERS
+    assert board['approximate_since'] == QUARTERS[-1]
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from methods.criteria_functions.macd import calculate_macd, calculate_macd_matrix, macd_signals
+from utils.helper_functions import zs
+from tests.conftest import QUARTERS
+
+PERIODS = [(4, 8, 3), (3, 6, 2), (12, 26, 9)]
+
+
+@pytest.mark.parametrize("fast_period, slow_period, signal_period", PERIODS)
+def test_matrix_matches_calculate_macd(frequencies, fast_period, slow_period, signal_period):
+    lines = calculate_macd_matrix(frequencies, fast_period, slow_period, signal_period)
+    for i, row in enumerate(frequencies):
+        expected = calculate_macd(pd.Series(row, index=QUARTERS), fast_period, slow_period, signal_period)
+        for line, reference in zip(lines, expected):
+            np.testing.assert_allclose(line[i], reference.to_numpy(), rtol=1e-9, atol=1e-9 * max(row.max(), 1))
+
+
+@pytest.mark.parametrize("fast_period, slow_period, signal_period", PERIODS)
+def test_signals_match_per_series_analysis(frequencies, fast_period, slow_period, signal_period):
+    expected = np.zeros(frequencies.shape, dtype=bool)
+    for i, row in enumerate(frequencies):
+        histogram = calculate_macd(pd.Series(row, index=QUARTERS), fast_period, slow_period, signal_period)[2]
+        z = zs(histogram)
+        expected[i] = ((z > 2.0) & ~pd.isna(z)).reindex(QUARTERS, fill_value=False).to_numpy()
+    signals, _ = macd_signals(sparse.csr_matrix(frequencies), fast_period, slow_period, signal_period, 2.0, chunk_size=64)
+    np.testing.assert_array_equal(signals, expected)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.ngram_dataset import NgramDataset
+from utils.ngram_store import write_ngram_store, write_store_chunks
+from tests.conftest import QUARTERS
+
+LEADING = 4
+
+
+@pytest.fixture(params=["dense", "sparse"])
+def dataset(request, frequencies):
+    df = pd.DataFrame(frequencies, index=[f"ngram{i}" for i in range(len(frequencies))], columns=QUARTERS)
+    if request.param == "sparse":
+        df = df.astype(pd.SparseDtype(np.float32, 0.0))
+    return NgramDataset.from_frame(df, leading_empty_quarters=LEADING)
+
+
+def test_row_totals_skip_leading_quarters(dataset, frequencies):
+    expected = np.array([dataset.get_row(row).sum() for row in range(len(dataset))])
+    np.testing.assert_allclose(dataset.row_totals(chunk_size=64), expected, rtol=1e-12)
+    np.testing.assert_allclose(expected, frequencies[:, LEADING:].sum(axis=1), rtol=1e-6)
+
+
+def test_row_chunks_match_rows(dataset):
+    for start, stop, block in dataset.row_chunks(chunk_size=64):
+        np.testing.assert_array_equal(block, np.vstack([dataset.get_row(row) for row in range(start, stop)]))
+
+
+def test_rows_are_read_at_once(dataset):
+    rows = np.array([0, 3, 4, 60, len(dataset) - 1])
+    np.testing.assert_array_equal(dataset.get_rows(rows), np.vstack([dataset.get_row(row) for row in rows]))
+
+
+def test_frame_matches_rows(dataset):
+    df = dataset.to_frame()
+    assert list(df.columns) == QUARTERS[LEADING:]
+    assert not any(isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes)
+    np.testing.assert_array_equal(df.loc["ngram60"].to_numpy(dtype=np.float64), dataset.get_row(60))
+
+
+def mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+@pytest.mark.parametrize("mode", ["float32", "sparse"])
+def test_store_stays_mapped(frequencies, tmp_path, mode):
+    df = pd.DataFrame(frequencies, index=[f"ngram{i}" for i in range(len(frequencies))], columns=QUARTERS)
+    write_ngram_store(df, str(tmp_path), mode=mode, leading_empty_quarters=LEADING)
+    dataset = NgramDataset.open(str(tmp_path))
+    # The row pointers may be cast to the index dtype, the values and indices stay mapped
+    arrays = [dataset.matrix.data, dataset.matrix.indices] if mode == "sparse" else [dataset.matrix]
+    assert all(mapped(array) for array in arrays)
+
+    np.testing.assert_allclose(dataset.to_frame().to_numpy(), frequencies[:, LEADING:], rtol=1e-6)
+
+
+def test_vocabulary_is_written_chunk_by_chunk(tmp_path):
+    words = ["straße", "日本語", "data science", "é", "x" * 40] + [f"w{i}" for i in range(300)]
+    values = np.ones((len(words), len(QUARTERS)))
+    chunks = [(words[i:i + 64], values[i:i + 64]) for i in range(0, len(words), 64)]
+    write_store_chunks(str(tmp_path), chunks, n_rows=len(words), quarters=QUARTERS, mode="sparse")
+
+    dataset = NgramDataset.open(str(tmp_path))
+    assert dataset.vocab.dtype == np.dtype("<U40")
+    assert dataset.vocab.tolist() == words
+    assert all(dataset.row_offset(word) == row for row, word in enumerate(words))
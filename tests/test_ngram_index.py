@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from utils.ngram_index import build_substring_index, search_substring, build_fuzzy_index, search_fuzzy
+from utils.ngram_shards import ngram_key
+
+
+def brute_force_substring(vocab, totals, query, k):
+    # Keys in rank order, the way search_substring used to scan short queries
+    query = ngram_key(query)
+    matches = []
+    for row in np.argsort(-totals, kind="stable").tolist():
+        key = ngram_key(vocab[row])
+        if query in key and key != query:
+            matches.append(row)
+    return matches[:k]
+
+
+@pytest.fixture
+def vocabulary():
+    rng = np.random.default_rng(2)
+    alphabet = list("abcdeé ßΣ")
+    words = {"".join(rng.choice(alphabet, rng.integers(1, 9))) for _ in range(3000)}
+    words |= {"aaaa", "Aaaa", "xyz", "data science", "Straße", "ab"}
+    vocab = np.array(sorted(words), dtype=str)
+    return vocab, rng.integers(0, 50, len(vocab)).astype(np.float64)
+
+
+def test_matches_brute_force(vocabulary, monkeypatch):
+    vocab, totals = vocabulary
+    # Several chunks, so ranks are offset across chunk boundaries
+    monkeypatch.setattr("utils.ngram_index.TRIGRAM_CHUNK_SIZE", 500)
+    index = build_substring_index(vocab, totals)
+    assert index['postings'].dtype == np.int32
+    for query in ["aaa", "AAA", "abc", "bcd", "e a", "ééé", "strasse", "ssΣ", "xyz", "zzz", "data sci"]:
+        for k in (1, 5, 1000):
+            assert search_substring(index, query, k) == brute_force_substring(vocab, totals, query, k)
+
+
+def test_short_queries_are_left_to_the_prefix_index(vocabulary):
+    vocab, totals = vocabulary
+    index = build_substring_index(vocab, totals)
+    assert search_substring(index, "ab") == []
+    assert search_substring(index, "") == []
+
+
+def test_fuzzy_index_is_built_chunk_by_chunk(vocabulary, monkeypatch):
+    vocab, totals = vocabulary
+    whole = build_fuzzy_index(vocab, totals)
+    monkeypatch.setattr("utils.ngram_index.FUZZY_CHUNK_SIZE", 500)
+    index = build_fuzzy_index(vocab, totals)
+    assert index['ranks'].dtype == np.int32
+    np.testing.assert_array_equal(index['hashes'], whole['hashes'])
+    np.testing.assert_array_equal(index['ranks'], whole['ranks'])
+
+    row = int(np.flatnonzero(vocab == "data science")[0])
+    assert row in search_fuzzy(index, "dta sciense")
+    assert int(np.flatnonzero(vocab == "Straße")[0]) in search_fuzzy(index, "strase")
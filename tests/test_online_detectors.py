@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from methods.online_detectors import run_detectors, update_detectors, save_detectors, load_detectors
+from methods.criteria_functions.percent_change import pct_change_signals
+from methods.criteria_functions.macd import macd_signals
+from methods.criteria_functions.holt_winters import initial_state, holt_winters_filter
+from utils.helper_functions import zscore_rows
+
+SMOOTHING = {'alpha': 0.4, 'beta': 0.2, 'gamma': 0.3}
+
+CONFIG = {
+    'pct_change': {'periods': 4, 'threshold': 1.0},
+    'macd_hist': {'fast_period': 4, 'slow_period': 8, 'signal_period': 3, 'threshold': 1.0},
+    'exp_smooth': dict(SMOOTHING, trend_type='add', seasonal_type='add', seasonal_periods=4, threshold=1.0),
+}
+
+
+@pytest.fixture
+def positive_rows(frequencies):
+    # Rows without zeros, an infinite percent change would poison the batch z-scores of its row
+    return frequencies[(frequencies > 0).all(axis=1)]
+
+
+def holt_winters_signals(values, threshold):
+    # Batch residual z-scores of the fixed-parameter model, heuristic initial state
+    level, trend, seasonals = initial_state(values, "add", "add", 4)
+    fit = holt_winters_filter(values, *(np.full((len(values), 1), SMOOTHING[key]) for key in ('alpha', 'beta', 'gamma')),
+                              "add", "add", 4, initial=(level[:, None], trend[:, None], seasonals[:, None, :]), keep_components=True)
+    return zscore_rows(values - fit['fitted'][:, 0]) > threshold
+
+
+@pytest.mark.parametrize("n_obs", [12, 30, 60])
+def test_latest_signals_match_batch_kernels(positive_rows, n_obs):
+    # The online z-score of the latest observation uses the moments of the whole history so far,
+    # so it matches the batch kernels on the last column of the same prefix
+    values = positive_rows[:, :n_obs]
+    _, history = run_detectors(values, CONFIG)
+    np.testing.assert_array_equal(history['pct_change'][:, -1], pct_change_signals(values, 4, 1.0)[0][:, -1])
+    np.testing.assert_array_equal(history['macd_hist'][:, -1], macd_signals(values, 4, 8, 3, 1.0)[0][:, -1])
+    np.testing.assert_array_equal(history['exp_smooth'][:, -1], holt_winters_signals(values, 1.0)[:, -1])
+    assert history['pct_change'][:, -1].any() and history['exp_smooth'][:, -1].any()
+
+
+def test_saved_state_continues_the_feed(positive_rows, tmp_path):
+    state, _ = run_detectors(positive_rows[:, :30], CONFIG)
+    path = str(tmp_path / "detectors.npz")
+    save_detectors(path, state)
+    loaded = load_detectors(path)
+    assert loaded['config'] == state['config'] and loaded['n_obs'] == 30
+
+    _, expected = run_detectors(positive_rows, CONFIG)
+    for t in range(30, positive_rows.shape[1]):
+        signals = update_detectors(loaded, positive_rows[:, t])
+        for name in ('pct_change', 'macd_hist', 'exp_smooth', 'consensus'):
+            np.testing.assert_array_equal(signals[name], expected[name][:, t])
+    assert load_detectors(str(tmp_path / "missing.npz")) is None
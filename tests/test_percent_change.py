@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from methods.criteria_functions.percent_change import calculate_pct, calculate_pct_matrix, pct_change_signals
+from utils.helper_functions import zs
+from tests.conftest import QUARTERS
+
+
+def reference_signals(values, periods, threshold):
+    # Percent-change branch of analyze_trends, one series at a time
+    signals = np.zeros(values.shape, dtype=bool)
+    for i, row in enumerate(values):
+        z = zs(calculate_pct(pd.Series(row, index=QUARTERS), periods).dropna())
+        signals[i] = ((z > threshold) & ~pd.isna(z)).reindex(QUARTERS, fill_value=False).to_numpy()
+    return signals
+
+
+@pytest.mark.parametrize("periods", [1, 4, 8])
+def test_matrix_matches_series_pct_change(frequencies, periods):
+    expected = np.vstack([pd.Series(row).pct_change(periods=periods).to_numpy() for row in frequencies])
+    np.testing.assert_array_equal(calculate_pct_matrix(frequencies, periods), expected)
+
+
+@pytest.mark.parametrize("periods, threshold", [(4, 2.0), (1, 1.5), (8, 0.5)])
+def test_signals_match_per_series_analysis(frequencies, periods, threshold):
+    expected = reference_signals(frequencies, periods, threshold)
+    signals, z = pct_change_signals(frequencies, periods, threshold, chunk_size=37)
+    np.testing.assert_array_equal(signals, expected)
+    np.testing.assert_array_equal(z > threshold, signals)
+    np.testing.assert_array_equal(pct_change_signals(sparse.csr_matrix(frequencies), periods, threshold, chunk_size=64)[0], expected)
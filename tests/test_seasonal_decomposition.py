@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.tsa.seasonal import seasonal_decompose
+from methods.criteria_functions.seasonal_decomposition import decompose_matrix, seasonal_signals
+from utils.helper_functions import zs
+from tests.conftest import QUARTERS
+
+
+@pytest.mark.parametrize("model", ["additive", "multiplicative"])
+@pytest.mark.parametrize("period", [2, 3, 4, 5, 12])
+def test_matrix_matches_statsmodels(frequencies, model, period):
+    result = decompose_matrix(frequencies, model, period)
+    for i, row in enumerate(frequencies):
+        if model == "multiplicative" and (row <= 0).any():
+            assert not result['valid'][i]
+            assert np.isnan(result['residual'][i]).all()
+            continue
+        expected = seasonal_decompose(pd.Series(row), model=model, period=period)
+        assert result['valid'][i]
+        for name in ("trend", "seasonal", "resid"):
+            key = "residual" if name == "resid" else name
+            np.testing.assert_allclose(result[key][i], getattr(expected, name).to_numpy(), rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize("model", ["additive", "multiplicative"])
+def test_signals_match_per_series_analysis(frequencies, model):
+    values = frequencies if model == "additive" else frequencies + 1
+    expected = np.zeros(values.shape, dtype=bool)
+    for i, row in enumerate(values):
+        z = zs(seasonal_decompose(pd.Series(row, index=QUARTERS), model=model, period=4).resid)
+        expected[i] = (z > 2.0).reindex(QUARTERS, fill_value=False).to_numpy()
+    signals, _ = seasonal_signals(values, model, 4, 2.0, chunk_size=64)
+    np.testing.assert_array_equal(signals, expected)
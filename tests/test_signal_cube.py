@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from components.trend_detection_overview import analyze_trends
+from methods.signal_cube import cube_config, cube_key, cube_path, build_signal_cube, open_signal_cube, cube_trends
+from utils.ngram_dataset import NgramDataset
+from tests.conftest import QUARTERS
+from tests.test_trend_detection import CRITERIA, THRESHOLDS, with_thresholds
+
+ROWS = (0, 45, 60, 61, 62, 100, 150)
+
+
+@pytest.fixture
+def cube(frequencies, tmp_path, monkeypatch):
+    monkeypatch.setattr("methods.signal_cube.SIGNAL_CUBE_DIR", str(tmp_path))
+    df = pd.DataFrame(frequencies, index=[f"ngram{i}" for i in range(len(frequencies))], columns=QUARTERS)
+    dataset = NgramDataset.from_frame(df)
+    config = cube_config(with_thresholds(THRESHOLDS[0]))
+    return dataset, build_signal_cube(dataset, config, cube_path(dataset.version, config), chunk_size=64)
+
+
+def test_thresholds_are_not_part_of_the_key():
+    keys = {cube_key("test-version", cube_config(with_thresholds(threshold))) for threshold in THRESHOLDS}
+    assert len(keys) == 1
+    criteria = dict(with_thresholds(THRESHOLDS[0]), exp_trend='mul')
+    assert cube_key("test-version", cube_config(criteria)) not in keys
+
+
+def test_cube_is_saved(cube):
+    dataset, built = cube
+    opened = open_signal_cube(cube_path(dataset.version, built['config']))
+    assert opened['criteria'] == built['criteria']
+    assert opened['zscores'].shape == (4, *dataset.shape)
+    np.testing.assert_array_equal(opened['consensus_count'], built['consensus_count'])
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_cube_slice_matches_analysis(cube, frequencies, threshold):
+    dataset, built = cube
+    criteria = with_thresholds(threshold)
+    for row in ROWS:
+        series = pd.Series(frequencies[row], index=QUARTERS, name=f"ngram{row}")
+        expected = analyze_trends(series, criteria)['consensus']
+        result = analyze_trends(series, criteria, dataset.version, built, row)['consensus']
+        pd.testing.assert_frame_equal(result['signals'], expected['signals'].astype(bool))
+        assert result['points'] == expected['points']
+
+
+def test_build_thresholds_read_the_bits(cube):
+    dataset, built = cube
+    for row in ROWS:
+        default = cube_trends(built, row)['consensus']
+        explicit = cube_trends(built, row, cube_config(with_thresholds(THRESHOLDS[0])))['consensus']
+        pd.testing.assert_frame_equal(default['signals'], explicit['signals'])
+        assert default['points'] == explicit['points']
+        assert len(default['points']) == np.unpackbits(built['consensus'][row]).sum()
+
+
+def test_cube_answers_for_any_session_engine(cube, frequencies, monkeypatch):
+    dataset, built = cube
+    monkeypatch.setattr("components.trend_detection_overview.cached_criterion_zscores", None)
+    criteria = dict(with_thresholds(THRESHOLDS[0]), exp_engine='statsmodels')
+    series = pd.Series(frequencies[60], index=QUARTERS, name="ngram60")
+    result = analyze_trends(series, criteria, dataset.version, built, 60)['consensus']
+    assert result['points'] == cube_trends(built, 60)['consensus']['points']
+    assert cube_config(criteria)['exp_smooth']['engine'] == 'statsmodels'
@@ -0,0 +1,59 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+from components.trend_detection_overview import analyze_trends
+from methods.criteria_functions.macd import calculate_macd
+from methods.criteria_functions.exponential_smoothing import calculate_exponential_smoothing
+from methods.criteria_functions.seasonal_decomposition import calculate_seasonal_decomposition
+from utils.helper_functions import zs
+from tests.conftest import QUARTERS
+
+CRITERIA = {
+    'pct_change': True, 'pct_change_period': 4,
+    'macd': True, 'short_period': 4, 'long_period': 8, 'signal_period': 3,
+    'exp_smoothing': True, 'exp_trend': 'add', 'exp_seasonal': 'add', 'exp_seasonal_period': 4, 'exp_engine': 'native',
+    'seasonal': True, 'seasonal_model': 'additive', 'seasonal_period': 4,
+}
+THRESHOLDS = [2.0, 1.0, 0.5]
+
+
+def single_pass_trends(series, criteria):
+    # analyze_trends before it was split into a z-score and a threshold stage
+    signals = pd.DataFrame(index=series.index)
+    z = zs(series.pct_change(periods=criteria['pct_change_period']).dropna())
+    signals['pct_change'] = (z > criteria['pct_change_threshold']) & ~pd.isna(z)
+    z = zs(calculate_macd(series, criteria['short_period'], criteria['long_period'], criteria['signal_period'])[2])
+    signals['macd_hist'] = (z > criteria['macd_threshold']) & ~pd.isna(z)
+    fit = calculate_exponential_smoothing(series, criteria['exp_trend'], criteria['exp_seasonal'], criteria['exp_seasonal_period'], 'native')
+    signals['exp_smooth'] = zs(fit['components']['residuals']) > criteria['exp_smoothing_threshold']
+    decomposition = calculate_seasonal_decomposition(series, criteria['seasonal_model'], criteria['seasonal_period'])
+    signals['seasonal'] = zs(decomposition['components']['residual']) > criteria['seasonal_threshold']
+
+    signals = signals.fillna(False)
+    signal_count = signals.sum(axis=1)
+    return signals, signal_count[signal_count > math.ceil(4 / 2.0)].index.tolist()
+
+
+def with_thresholds(threshold):
+    criteria = dict(CRITERIA)
+    for key in ('pct_change_threshold', 'macd_threshold', 'exp_smoothing_threshold', 'seasonal_threshold'):
+        criteria[key] = threshold
+    return criteria
+
+
+@pytest.fixture
+def fit_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.cache_utils.FIT_CACHE_DIR", str(tmp_path))
+
+
+@pytest.mark.parametrize("dataset_version", [None, "test-version"])
+def test_two_stages_match_single_pass(frequencies, fit_cache, dataset_version):
+    for row in (0, 45, 60, 100, 150):
+        series = pd.Series(frequencies[row], index=QUARTERS, name=f"ngram{row}")
+        for threshold in THRESHOLDS:
+            criteria = with_thresholds(threshold)
+            result = analyze_trends(series, criteria, dataset_version)
+            signals, points = single_pass_trends(series, criteria)
+            pd.testing.assert_frame_equal(result['consensus']['signals'], signals)
+            assert result['consensus']['points'] == points
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from methods.trend_zones import trend_zones, trend_zone_matrix, trend_line_matrix, z_trend_line
+from utils.helper_functions import zscore_rows
+from tests.conftest import QUARTERS
+
+
+def greedy_zones(z_trend, consensus_points, threshold):
+    # Zone expansion one consensus point at a time, as trend_zones worked before the run-length scans
+    used = set()
+    zones = []
+    labels = z_trend.index.tolist()
+    for point in consensus_points:
+        if point not in z_trend.index or point in used:
+            continue
+        position = labels.index(point)
+        zone = [point]
+        left = position - 1
+        while left >= 0 and z_trend[labels[left]] >= threshold and labels[left] not in used:
+            zone.insert(0, labels[left])
+            left -= 1
+        right = position + 1
+        while right < len(labels) and z_trend[labels[right]] >= threshold and labels[right] not in used:
+            zone.append(labels[right])
+            right += 1
+        zones.append(zone)
+        used.update(zone)
+    return zones
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_zones_match_greedy_expansion(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(200):
+        n_quarters = int(rng.integers(1, 40))
+        z_trend = pd.Series(rng.normal(0, 1, n_quarters), index=QUARTERS[:n_quarters])
+        z_trend[rng.random(n_quarters) < 0.05] = np.nan
+        consensus = sorted(rng.choice(n_quarters, int(rng.integers(0, n_quarters + 1)), replace=False))
+        points = [QUARTERS[i] for i in consensus]
+        threshold = float(rng.choice([-0.5, 0.0, 0.5, 1.0]))
+        assert trend_zones(z_trend, points, threshold) == greedy_zones(z_trend, points, threshold)
+
+
+def test_matrix_matches_zones_per_series(frequencies):
+    rng = np.random.default_rng(0)
+    consensus = rng.random(frequencies.shape) < 0.1
+    z_trend = zscore_rows(trend_line_matrix(frequencies))
+    mask = trend_zone_matrix(z_trend, consensus, 0.5)
+    for i, row in enumerate(frequencies):
+        series_z = z_trend_line(pd.Series(row, index=QUARTERS))
+        points = [QUARTERS[t] for t in np.flatnonzero(consensus[i])]
+        expected = {quarter for zone in trend_zones(series_z, points, 0.5) for quarter in zone}
+        assert {QUARTERS[t] for t in np.flatnonzero(mask[i])} == expected
+
+
+def test_trend_line_matrix_matches_z_trend_line(frequencies):
+    z_trend = zscore_rows(trend_line_matrix(frequencies))
+    for i, row in enumerate(frequencies):
+        expected = z_trend_line(pd.Series(row, index=QUARTERS)).reindex(QUARTERS)
+        np.testing.assert_allclose(z_trend[i], expected.to_numpy(), rtol=1e-9, atol=1e-9)
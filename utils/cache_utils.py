@@ -1,7 +1,19 @@
 import os
+import json
 import pickle
+import hashlib
+import numpy as np
+import pandas as pd
 import streamlit as st
-from settings import CACHE_DIR
+from settings import CACHE_DIR, FIT_CACHE_DIR, FIT_CACHE_MAX_BYTES
+
+# An eviction frees space down to this fraction of the limit, so the
+# directory is only scanned again after a batch of new fits
+FIT_CACHE_EVICT_FRACTION = 0.9
+
+# Running size in bytes of each fit cache directory, measured on the first
+# save of the process and re-measured by every eviction
+fit_cache_bytes = {}
 
 def get_cache_path(key):
     os.makedirs(CACHE_DIR, exist_ok=True)
@@ -29,4 +41,173 @@ def save_cached_result(key, result):
         with open(cache_path, "wb") as f:
             pickle.dump(result, f)
     except Exception as e:
-        st.warning(f"Error saving cache: {e}")
\ No newline at end of file
+        st.warning(f"Error saving cache: {e}")
+
+def fit_cache_key(dataset_version, ngram, criterion, params):
+    """
+    Key of a fitted criterion result.
+
+    Args:
+        dataset_version (str): Content fingerprint of the store the series was read from
+        ngram (str): N-gram the series belongs to
+        criterion (str): Criterion name, e.g. "exp_smoothing"
+        params (dict): Parameters of the fit
+
+    Returns:
+        str: Hex digest
+    """
+    payload = json.dumps([dataset_version, str(ngram), criterion, params], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+def get_fit_path(key):
+    os.makedirs(FIT_CACHE_DIR, exist_ok=True)
+    return os.path.join(FIT_CACHE_DIR, f"{key}.npz")
+
+def get_cached_fit(key):
+    """
+    Load a fitted result dict ('success', 'error', 'components', 'forecast').
+
+    Returns:
+        dict or None: Cached result, or None on a miss
+    """
+    fit_path = get_fit_path(key)
+    if not os.path.exists(fit_path):
+        return None
+    try:
+        with np.load(fit_path) as data:
+            header = json.loads(str(data['header']))
+            components = data['components']
+            forecast = data['forecast']
+        # Mark as recently used for the eviction
+        os.utime(fit_path)
+    except Exception as e:
+        st.warning(f"Error loading cache: {e}")
+        return None
+
+    result = {
+        'success': header['success'],
+        'error': header['error'],
+        'components': {
+            name: pd.Series(components[i], index=header['index'], name=header['series_names'][i])
+            for i, name in enumerate(header['components'])
+        },
+        'forecast': None
+    }
+    if header['forecast_index'] is not None:
+        result['forecast'] = {
+            'values': pd.Series(forecast, index=header['forecast_index']),
+            'index': header['forecast_index']
+        }
+    return result
+
+def save_cached_fit(key, result):
+    """
+    Store a fitted result dict compactly: the component Series share one
+    quarter index and are saved as the rows of a single array.
+    """
+    components = result['components']
+    names = list(components)
+    index = [str(i) for i in next(iter(components.values())).index] if names else []
+    forecast = result.get('forecast')
+    header = {
+        'success': result['success'],
+        'error': result['error'],
+        'components': names,
+        'index': index,
+        'series_names': [components[name].name for name in names],
+        'forecast_index': forecast['index'] if forecast is not None else None,
+    }
+
+    fit_path = get_fit_path(key)
+    tmp_path = f"{fit_path}.tmp"
+    try:
+        replaced = os.path.getsize(fit_path) if os.path.exists(fit_path) else 0
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                header=np.array(json.dumps(header, default=str)),
+                components=np.array([np.asarray(components[name], dtype=np.float64) for name in names]).reshape(len(names), len(index)),
+                forecast=np.asarray(forecast['values'], dtype=np.float64) if forecast is not None else np.zeros(0),
+            )
+        os.replace(tmp_path, fit_path)
+        added = os.path.getsize(fit_path) - replaced
+    except Exception as e:
+        st.warning(f"Error saving cache: {e}")
+        return
+    track_fit_bytes(added)
+
+def scan_fits():
+    # (modification time, size, path) of every cached fit
+    entries = []
+    with os.scandir(FIT_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+def track_fit_bytes(added, max_bytes=FIT_CACHE_MAX_BYTES):
+    """
+    Add a saved fit to the running size of the cache, evicting when it goes
+    over max_bytes. Only the first save of the process and the evictions
+    scan the directory.
+
+    Args:
+        added (int): Bytes added by the save, net of the file it replaced
+        max_bytes (int): Size limit of the cache
+    """
+    total = fit_cache_bytes.get(FIT_CACHE_DIR)
+    if total is None:
+        # The first measurement already includes the saved fit
+        total = sum(size for _, size, _ in scan_fits())
+    else:
+        total += added
+    if total > max_bytes:
+        total = evict_fits(int(max_bytes * FIT_CACHE_EVICT_FRACTION))
+    fit_cache_bytes[FIT_CACHE_DIR] = total
+
+def evict_fits(max_bytes=FIT_CACHE_MAX_BYTES):
+    """
+    Remove the least recently used fits until the cache fits in max_bytes.
+
+    Returns:
+        int: Size of the remaining fits in bytes
+    """
+    entries = scan_fits()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+def cached_fit(dataset_version, series, criterion, params, fit):
+    """
+    Return the cached result of a criterion fit, fitting and caching it on a miss.
+
+    Args:
+        dataset_version (str): Content fingerprint of the store the series was read from
+            (the dataset or a shard), None disables the cache
+        series (pd.Series): Time series, named by its n-gram
+        criterion (str): Criterion name
+        params (dict): Parameters of the fit
+        fit (callable): Computes the result dict on a miss
+
+    Returns:
+        dict: Result dict of the criterion
+    """
+    if dataset_version is None or series.name is None:
+        return fit()
+
+    key = fit_cache_key(dataset_version, series.name, criterion, params)
+    result = get_cached_fit(key)
+    if result is None:
+        result = fit()
+        # Failed fits are not cached, a later attempt may succeed
+        if result['success']:
+            save_cached_fit(key, result)
+    return result
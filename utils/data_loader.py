@@ -1,15 +1,179 @@
 import pandas as pd
 import streamlit as st
 import os
+import json
+import threading
+from utils.ngram_store import apply_storage_mode, read_store_fingerprint
+from utils.ngram_dataset import NgramDataset
+from utils.ngram_index import build_exact_index, build_substring_index, build_fuzzy_index, build_prefix_index
+from utils.ngram_shards import SHARD_DIRECTORY_FILE, read_shard_directory, open_shard, find_ngram, shard_entry, ngram_order, sharded_store_path
+from methods.signal_cube import cube_config, native_config, model_config, cube_path, open_signal_cube
+from methods.leaderboard import leaderboard_path, open_leaderboard, run_leaderboard_job
+from settings import LEADING_EMPTY_QUARTERS, FUZZY_INDEX_LIMIT, PARTIAL_MATCH_LIMIT
+
+# Cached as a resource so the memory-mapped dataset is shared, not pickled per call.
+# The version token is part of the key, so a rewritten or appended store gets a new handle.
+@st.cache_resource
+def open_dataset(path, version):
+    try:
+        if os.path.isdir(path):
+            return NgramDataset.open(path)
+        # odrezemo prve 4 quartile, ker so prazni
+        df = apply_storage_mode(pd.read_pickle(path))
+        return NgramDataset.from_frame(df, leading_empty_quarters=LEADING_EMPTY_QUARTERS)
+    except Exception as e:
+        print(f"Error loading data: {e}")
+        return None
 
-@st.cache_data
 def load_data(path):
+    """
+    Load the n-gram dataset as a lazy handle. Stores are memory-mapped and
+    only read row by row; the pickle fallback is loaded into memory.
+
+    Only the store metadata is read on every run, the handle itself is cached
+    per content fingerprint (pickles are keyed by modification time and size).
+
+    Args:
+        path (str): Store directory or pickled DataFrame
+
+    Returns:
+        NgramDataset: Dataset handle, or None if it could not be loaded
+    """
     try:
-        if (os.path.exists(path)):
-            df = pd.read_pickle(path)
-            # odrezemo prve 4 quartile, ker so prazni
-            df = df.iloc[:, 4:]
-            return df
+        if os.path.isdir(path):
+            version = read_store_fingerprint(path)
+        elif os.path.exists(path):
+            stat = os.stat(path)
+            version = f"{stat.st_mtime_ns}-{stat.st_size}"
+        else:
+            return None
     except Exception as e:
         print(f"Error loading data: {e}")
-        return None
\ No newline at end of file
+        return None
+    return open_dataset(path, version)
+
+# Built once per dataset version and shared by all sessions
+@st.cache_resource
+def load_exact_index(_dataset, dataset_version):
+    return build_exact_index(_dataset.vocab)
+
+@st.cache_resource
+def load_substring_index(_dataset, dataset_version):
+    return build_substring_index(_dataset.vocab, _dataset.row_totals())
+
+@st.cache_resource
+def load_fuzzy_index(_dataset, dataset_version):
+    return build_fuzzy_index(_dataset.vocab, _dataset.row_totals(), limit=FUZZY_INDEX_LIMIT)
+
+@st.cache_resource
+def load_prefix_index(_dataset, dataset_version):
+    return build_prefix_index(_dataset.vocab, _dataset.row_totals(), k=PARTIAL_MATCH_LIMIT)
+
+# Opened once per dataset version and model settings (thresholds are applied on read),
+# the config is passed as a JSON string so it can be hashed
+@st.cache_resource
+def load_signal_cube(dataset_version, config_json):
+    return open_signal_cube(cube_path(dataset_version, json.loads(config_json)))
+
+def find_signal_cube(dataset, selected_criteria):
+    """
+    Signal cube of the current model settings, only if it has already been built.
+
+    Args:
+        dataset (NgramDataset): Dataset handle
+        selected_criteria (dict): Criteria settings from the session state
+
+    Returns:
+        dict or None: Memory-mapped cube, None if there is none for these settings
+    """
+    config = native_config(cube_config(selected_criteria))
+    if not config or not os.path.isdir(cube_path(dataset.version, config)):
+        return None
+    return load_signal_cube(dataset.version, json.dumps(model_config(config), sort_keys=True))
+
+# Keyed by the modification time of the directory as well, a full build replaces
+# a refreshed (approximate) leaderboard of the same version in place
+@st.cache_resource
+def load_leaderboard(dataset_version, config_json, mtime):
+    return open_leaderboard(leaderboard_path(dataset_version, json.loads(config_json)))
+
+def find_leaderboard(dataset, config):
+    """
+    Leaderboard of the given settings, only if it has already been built.
+
+    Returns:
+        dict or None: Memory-mapped leaderboard, None if there is none for these settings
+    """
+    try:
+        mtime = os.stat(leaderboard_path(dataset.version, config)).st_mtime_ns
+    except OSError:
+        return None
+    return load_leaderboard(dataset.version, json.dumps(config, sort_keys=True), mtime)
+
+# Background scoring jobs shared by all sessions, one per leaderboard path
+@st.cache_resource
+def leaderboard_jobs():
+    return {}
+
+def start_leaderboard_job(dataset, config):
+    """
+    Start scoring the vocabulary in a background thread, unless a job for the
+    same dataset version and settings is already running.
+
+    Returns:
+        dict: Job status, 'thread' plus 'error' and 'seconds' once it has finished
+    """
+    jobs = leaderboard_jobs()
+    path = leaderboard_path(dataset.version, config)
+    job = jobs.get(path)
+    if job is None or (not job['thread'].is_alive() and 'error' in job):
+        job = {}
+        job['thread'] = threading.Thread(target=run_leaderboard_job, args=(dataset, config, job), daemon=True)
+        jobs[path] = job
+        job['thread'].start()
+    return job
+
+def leaderboard_job(dataset, config):
+    # Status of the job for these settings, None if none was started
+    return leaderboard_jobs().get(leaderboard_path(dataset.version, config))
+
+@st.cache_resource
+def cached_shard_directory(path, mtime):
+    return read_shard_directory(path)
+
+def load_shard_directory(path):
+    # Keyed by the modification time of the directory file, rewritten with every layout
+    try:
+        mtime = os.stat(os.path.join(path, SHARD_DIRECTORY_FILE)).st_mtime_ns
+    except OSError:
+        return None
+    return cached_shard_directory(path, mtime)
+
+@st.cache_resource
+def cached_shard(path, version):
+    return open_shard(path)
+
+def load_shard(path):
+    return cached_shard(path, read_store_fingerprint(path))
+
+def find_sharded_ngram(ngram):
+    """
+    Look up an n-gram with n>1 in its sharded store, loading only the shard
+    that can contain it. The fingerprint of that shard is the version every
+    cache of the series is keyed by, the unigram dataset version does not
+    change when a shard is rewritten.
+
+    Args:
+        ngram (str): N-gram to look up (case-insensitive)
+
+    Returns:
+        tuple: (original n-gram, pd.Series, shard fingerprint) or (None, None, None) if it is not found
+    """
+    path = sharded_store_path(ngram_order(ngram))
+    directory = load_shard_directory(path)
+    if directory is None:
+        return None, None, None
+    label, series = find_ngram(path, ngram, directory=directory, open_shard=load_shard)
+    if label is None:
+        return None, None, None
+    return label, series, shard_entry(directory, ngram)["fingerprint"]
@@ -1,9 +1,55 @@
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from scipy.stats import zscore
+from scipy import sparse
+from utils.startup_timing import lazy_import
+from settings import CHUNK_MAX_BYTES
 
-def zs(s): return pd.Series(zscore(s.dropna()), index=s.dropna().index)
+def zs(s): return pd.Series(lazy_import("scipy.stats").zscore(s.dropna()), index=s.dropna().index)
+
+def zscore_rows(values):
+    """
+    Row-wise z-scores of a 2D array, matching zs() on every row: NaNs are
+    ignored (and stay NaN), the standard deviation uses ddof=0, and rows that
+    contain an infinite value or have zero variance become all NaN.
+
+    Args:
+        values (np.ndarray): 2D float array, one series per row
+
+    Returns:
+        np.ndarray: Z-scores with the same shape
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, values, 0.0).sum(axis=1, keepdims=True) / count
+        deviation = np.where(valid, values - mean, 0.0)
+        std = np.sqrt((deviation ** 2).sum(axis=1, keepdims=True) / count)
+        z = (values - mean) / std
+    # An infinite value poisons the mean and the deviation of its row, as in scipy
+    z[np.isinf(values).any(axis=1)] = np.nan
+    return z
+
+def row_chunks(matrix, chunk_size=65536, first_column=0):
+    """
+    Iterate over a dense or CSR matrix in blocks of rows, densified to float64.
+    Columns before first_column are dropped block by block, so a memory-mapped
+    CSR matrix is never copied as a whole.
+
+    Yields:
+        tuple: (start row, stop row, 2D float64 array)
+    """
+    n_rows = matrix.shape[0]
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        block = matrix[start:stop]
+        block = block.toarray() if sparse.issparse(block) else block
+        yield start, stop, np.asarray(block[:, first_column:], dtype=np.float64)
+
+def budget_chunk_size(n_columns, arrays, max_bytes=CHUNK_MAX_BYTES):
+    # Rows per chunk so that `arrays` float64 arrays of n_columns values per row fit in max_bytes
+    return max(1, int(max_bytes // (arrays * max(n_columns, 1) * 8)))
 
 def plot_original_series(ngram, series):
     fig = go.Figure()
@@ -0,0 +1,99 @@
+import argparse
+import numpy as np
+import pandas as pd
+from utils.ngram_store import (
+    read_store_meta,
+    read_store_vocabulary,
+    read_store_matrix,
+    read_store_leading_quarters,
+    read_store_fingerprint,
+    append_quarter,
+)
+from methods.recursive_state import DEFAULT_STATE_PARAMS, load_state, save_state, update_state, build_state
+from methods.leaderboard import refresh_leaderboards
+from settings import NGRAM_DATASET_PATH
+
+def read_quarter_counts(source):
+    """
+    Read the frequencies of one quarter from a pickled Series or a two-column CSV (n-gram, frequency).
+
+    Args:
+        source (str): Path to a .pkl or .csv file
+
+    Returns:
+        pd.Series: Frequencies indexed by n-gram
+    """
+    if source.endswith(".csv"):
+        counts = pd.read_csv(source, index_col=0).iloc[:, 0]
+    else:
+        counts = pd.read_pickle(source)
+        if isinstance(counts, pd.DataFrame):
+            counts = counts.iloc[:, 0]
+    counts.index = counts.index.astype(str)
+    return counts
+
+def ingest_quarter(path, quarter, counts, params=DEFAULT_STATE_PARAMS):
+    """
+    Append a new quarter to the store and carry the per-n-gram state forward.
+
+    The saved state (EMAs, rolling window, running moments) is advanced by one
+    O(vocabulary) step when it matches the store, otherwise it is rebuilt from
+    the full matrix once. Saved leaderboards of the previous version are
+    refreshed from their own signal state in the same way and replaced by
+    the refreshed ones; a leaderboard that fails is reported, the store has
+    already been appended to at that point.
+
+    Args:
+        path (str): Store directory
+        quarter (str): Label of the new quarter, e.g. "2025Q1"
+        counts (pd.Series): Frequencies of the new quarter indexed by n-gram
+        params (dict): State parameters
+
+    Returns:
+        dict: New dataset version, number of n-grams not in the store vocabulary,
+            number of refreshed leaderboards and the errors of the ones that failed
+    """
+    vocab = pd.Index(read_store_vocabulary(path).astype(object))
+
+    # N-grams outside the vocabulary would need new rows, they are reported and skipped
+    known = counts.index.isin(vocab)
+    column = counts[known].reindex(vocab, fill_value=0.0).to_numpy(dtype=np.float64)
+
+    leading_empty_quarters = read_store_leading_quarters(path)
+    n_quarters = read_store_meta(path)["shape"][1] - leading_empty_quarters
+    previous_version = read_store_fingerprint(path)
+    meta = append_quarter(path, quarter, column)
+
+    # Advance the state by one quarter, or rebuild it if it is missing or stale
+    state = load_state(path)
+    if (
+        state is not None
+        and state['params'] == dict(params)
+        and state['n_quarters'] == n_quarters
+        and len(state['sum']) == len(vocab)
+    ):
+        update_state(state, column)
+    else:
+        state = build_state(read_store_matrix(path)[:, leading_empty_quarters:], params)
+    save_state(path, state)
+
+    refreshed, errors = refresh_leaderboards(previous_version, meta['fingerprint'], quarter, column)
+    return {
+        'version': meta['fingerprint'],
+        'unknown_ngrams': int((~known).sum()),
+        'refreshed_leaderboards': refreshed,
+        'leaderboard_errors': errors,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append one quarter of n-gram frequencies to the store.")
+    parser.add_argument("quarter", help="Quarter label, e.g. 2025Q1")
+    parser.add_argument("source", help="Frequencies of the quarter (.pkl Series or .csv)")
+    parser.add_argument("--target", default=NGRAM_DATASET_PATH, help="Store directory")
+    args = parser.parse_args()
+
+    result = ingest_quarter(args.target, args.quarter, read_quarter_counts(args.source))
+    print(f"Dataset version {result['version']}, skipped {result['unknown_ngrams']} unknown n-grams, "
+          f"refreshed {result['refreshed_leaderboards']} leaderboards")
+    for path, error in result['leaderboard_errors'].items():
+        print(f"Could not refresh the leaderboard in {path}: {error}")
@@ -0,0 +1,209 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from utils.ngram_store import (
+    read_store_meta,
+    read_store_matrix,
+    read_store_vocabulary,
+    read_store_vocabulary_order,
+    read_store_leading_quarters,
+    read_store_fingerprint,
+    fingerprint_arrays,
+    dense_frame,
+    QUARTERS_FILE,
+)
+from utils.helper_functions import row_chunks
+
+class NgramDataset:
+    """
+    Lazy handle over an n-gram frequency matrix.
+
+    Single n-grams are fetched through an n-gram -> row offset index (a binary
+    search over the sorted vocabulary), reading just one row of the matrix.
+    The full DataFrame is only built on request, for corpus-wide features
+    such as PCA.
+
+    `version` is a content fingerprint of the data, computed once when the
+    store is written, and is the token every cache is keyed by.
+    """
+
+    def __init__(self, vocab, matrix, quarters, vocab_order=None, leading_empty_quarters=0,
+                 index_name=None, version=None, path=None):
+        self.vocab = vocab
+        self.matrix = matrix
+        self.vocab_order = vocab_order if vocab_order is not None else np.argsort(vocab, kind="stable")
+        self.leading_empty_quarters = leading_empty_quarters
+        self.columns = pd.Index(list(quarters)[leading_empty_quarters:])
+        self.index_name = index_name
+        self.version = version or fingerprint_arrays(vocab, quarters, matrix)
+        self.path = path
+        self._index = None
+        self._frame = None
+        self._totals = None
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open an on-disk store. Only metadata is read, every array stays memory-mapped.
+
+        Args:
+            path (str): Store directory
+
+        Returns:
+            NgramDataset: Dataset handle
+        """
+        meta = read_store_meta(path)
+        return cls(
+            vocab=read_store_vocabulary(path),
+            matrix=read_store_matrix(path),
+            quarters=np.load(os.path.join(path, QUARTERS_FILE)).tolist(),
+            vocab_order=read_store_vocabulary_order(path),
+            leading_empty_quarters=read_store_leading_quarters(path),
+            index_name=meta.get("index_name"),
+            version=read_store_fingerprint(path),
+            path=path,
+        )
+
+    @classmethod
+    def from_frame(cls, df, leading_empty_quarters=0):
+        """
+        Wrap an in-memory DataFrame (n-grams as index, quarters as columns).
+
+        Args:
+            df (pd.DataFrame): DataFrame with dense or sparse columns
+            leading_empty_quarters (int): Number of leading empty quarters to trim
+
+        Returns:
+            NgramDataset: Dataset handle
+        """
+        if any(isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes):
+            matrix = df.sparse.to_coo().tocsr()
+        else:
+            matrix = df.values
+        return cls(
+            vocab=np.array([str(i) for i in df.index], dtype=str),
+            matrix=matrix,
+            quarters=[str(c) for c in df.columns],
+            leading_empty_quarters=leading_empty_quarters,
+            index_name=df.index.name,
+        )
+
+    @property
+    def shape(self):
+        return (len(self.vocab), len(self.columns))
+
+    @property
+    def empty(self):
+        return len(self.vocab) == 0 or len(self.columns) == 0
+
+    @property
+    def values(self):
+        # Matrix without the leading empty quarters, a view for dense storage
+        # (a copy for sparse storage, full passes use row_chunks instead)
+        return self.matrix[:, self.leading_empty_quarters:]
+
+    def row_chunks(self, chunk_size=65536):
+        # Dense float64 blocks of rows, leading empty quarters trimmed, read from the mapped matrix
+        return row_chunks(self.matrix, chunk_size, self.leading_empty_quarters)
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __contains__(self, ngram):
+        return self.row_offset(ngram) is not None
+
+    @property
+    def index(self):
+        # Built on first use only, the lookups below do not need it
+        if self._index is None:
+            self._index = pd.Index(self.vocab.astype(object), name=self.index_name)
+        return self._index
+
+    def row_offset(self, ngram):
+        """
+        Find the row of an n-gram (exact match) by binary search over the sorted vocabulary.
+
+        Args:
+            ngram (str): N-gram
+
+        Returns:
+            int or None: Row offset in the matrix, None if the n-gram is not in the vocabulary
+        """
+        ngram = str(ngram)
+        lo, hi = 0, len(self.vocab_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.vocab[self.vocab_order[mid]] < ngram:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.vocab_order) and self.vocab[self.vocab_order[lo]] == ngram:
+            return int(self.vocab_order[lo])
+        return None
+
+    def get_row(self, row):
+        # Dense float64 values of one row, leading empty quarters trimmed
+        values = self.matrix[row]
+        if sparse.issparse(values):
+            values = values.toarray().ravel()
+        return np.asarray(values[self.leading_empty_quarters:], dtype=np.float64)
+
+    def get_rows(self, rows):
+        # Dense float64 values of an array of rows in a single read, leading empty quarters trimmed
+        values = self.matrix[rows]
+        if sparse.issparse(values):
+            values = values.toarray()
+        return np.asarray(values[:, self.leading_empty_quarters:], dtype=np.float64)
+
+    def row_totals(self, chunk_size=65536):
+        """
+        Total frequency of every n-gram over the quarters of `columns` (leading
+        empty quarters skipped, as in `values`), summed in row chunks.
+
+        Returns:
+            np.ndarray: Float64 array with one total per row
+        """
+        if self._totals is None:
+            totals = np.zeros(len(self.vocab), dtype=np.float64)
+            for start in range(0, len(self.vocab), chunk_size):
+                # Rows are sliced first, so a sparse matrix only copies one chunk
+                block = self.matrix[start:start + chunk_size][:, self.leading_empty_quarters:]
+                if sparse.issparse(block):
+                    # Sparse sums accumulate in the stored dtype
+                    block = block.astype(np.float64)
+                totals[start:start + chunk_size] = np.asarray(block.sum(axis=1, dtype=np.float64)).ravel()
+            self._totals = totals
+        return self._totals
+
+    def get_series(self, ngram):
+        """
+        Read the time series of a single n-gram.
+
+        Args:
+            ngram (str): N-gram (exact match)
+
+        Returns:
+            pd.Series: Time series indexed by quarter
+        """
+        row = self.row_offset(ngram)
+        if row is None:
+            raise KeyError(ngram)
+        return pd.Series(self.get_row(row), index=self.columns, name=str(self.vocab[row]))
+
+    def to_frame(self):
+        """
+        Materialize the full DataFrame, for corpus-wide features only.
+
+        Dense matrices stay backed by the memory map. Sparse ones stay mapped
+        too and are densified into the frame a chunk of rows at a time.
+
+        Returns:
+            pd.DataFrame: DataFrame with n-grams as index and quarters as columns
+        """
+        if self._frame is None:
+            if sparse.issparse(self.matrix):
+                self._frame = dense_frame(self.matrix, self.index, self.columns.tolist(), self.leading_empty_quarters)
+            else:
+                self._frame = pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+        return self._frame
@@ -0,0 +1,349 @@
+import numpy as np
+from utils.ngram_shards import ngram_key
+
+def build_exact_index(vocab):
+    """
+    Build a case-insensitive exact-match index over the vocabulary.
+
+    Args:
+        vocab (np.ndarray): N-gram vocabulary, in row order
+
+    Returns:
+        dict: Case-folded n-gram -> row offset (the first row wins on collisions)
+    """
+    index = {}
+    for row, ngram in enumerate(vocab.tolist()):
+        index.setdefault(ngram_key(ngram), row)
+    return index
+
+def lookup_exact(index, vocab, ngram):
+    """
+    Case-insensitive exact lookup in constant time.
+
+    Args:
+        index (dict): Index built with build_exact_index
+        vocab (np.ndarray): N-gram vocabulary the index was built from
+        ngram (str): N-gram to look up
+
+    Returns:
+        tuple: (original n-gram, row offset) or (None, None) if it is not in the vocabulary
+    """
+    row = index.get(ngram_key(ngram))
+    if row is None:
+        return None, None
+    return str(vocab[row]), row
+
+# Keys are encoded a chunk of n-grams at a time while the index is built,
+# the chunk is padded to its longest key
+TRIGRAM_CHUNK_SIZE = 8192
+
+def character_trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+def trigram_code(gram):
+    # Code points are below 2**21, so three of them pack into one int64
+    return (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2])
+
+def trigram_codes(keys):
+    """
+    Distinct trigram codes of a chunk of keys, with the position of their key.
+
+    Args:
+        keys (list): Case-folded keys
+
+    Returns:
+        tuple: (int64 trigram codes, int64 key positions), sorted by position and code
+    """
+    chars = np.array(keys, dtype=str)
+    if chars.dtype.itemsize < 12:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    points = chars.view(np.uint32).reshape(len(keys), -1).astype(np.int64)
+    codes = (points[:, :-2] << 42) | (points[:, 1:-1] << 21) | points[:, 2:]
+    # Trigrams that run into the zero padding of shorter keys are dropped
+    valid = np.arange(codes.shape[1]) < (np.char.str_len(chars)[:, None] - 2)
+    positions = np.broadcast_to(np.arange(len(keys))[:, None], codes.shape)[valid]
+    codes = codes[valid]
+    sort = np.lexsort((codes, positions))
+    codes, positions = codes[sort], positions[sort]
+    # A trigram repeated within a key is posted once
+    first = np.ones(len(codes), dtype=bool)
+    first[1:] = (codes[1:] != codes[:-1]) | (positions[1:] != positions[:-1])
+    return codes[first], positions[first]
+
+def build_substring_index(vocab, totals):
+    """
+    Build a trigram inverted index for substring search.
+
+    Every posting list holds frequency ranks (0 = most frequent n-gram) in
+    ascending order, so intersections come out already ranked by total
+    frequency and a search can stop after the first k verified matches.
+    Trigrams are encoded as int64 codes and collected as numpy arrays a chunk
+    of keys at a time; the keys themselves are not kept, candidates are
+    verified against the vocabulary.
+
+    Args:
+        vocab (np.ndarray): N-gram vocabulary, in row order
+        totals (np.ndarray): Total frequency of every row
+
+    Returns:
+        dict: Sorted trigram codes, CSR posting lists, rank -> row order and the vocabulary
+    """
+    order = np.argsort(-np.asarray(totals), kind="stable")
+
+    codes, ranks = [], []
+    for start in range(0, len(order), TRIGRAM_CHUNK_SIZE):
+        chunk = order[start:start + TRIGRAM_CHUNK_SIZE]
+        chunk_codes, positions = trigram_codes([ngram_key(ngram) for ngram in vocab[chunk].tolist()])
+        codes.append(chunk_codes)
+        ranks.append((positions + start).astype(np.int32))
+
+    codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+    ranks = np.concatenate(ranks) if ranks else np.zeros(0, dtype=np.int32)
+    # Stable sort by trigram keeps every posting list in rank order
+    sort = np.argsort(codes, kind="stable")
+    grams, counts = np.unique(codes[sort], return_counts=True)
+    indptr = np.zeros(len(grams) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    return {
+        'grams': grams,
+        'indptr': indptr,
+        'postings': ranks[sort],
+        'order': order,
+        'vocab': vocab,
+    }
+
+def search_substring(index, query, k=20):
+    """
+    Find the k most frequent n-grams that contain the query (case-insensitive),
+    excluding the query itself.
+
+    The posting lists of the query trigrams are intersected and only the
+    surviving candidates are verified. Queries shorter than a trigram match
+    nothing here, their partial matches are the completions of the prefix
+    index (complete_prefix).
+
+    Args:
+        index (dict): Index built with build_substring_index
+        query (str): Substring to search for
+        k (int): Maximum number of matches
+
+    Returns:
+        list: Row offsets of the matches, most frequent first
+    """
+    query = ngram_key(query)
+    if len(query) < 3:
+        return []
+
+    lists = []
+    for gram in character_trigrams(query):
+        i = int(np.searchsorted(index['grams'], trigram_code(gram)))
+        if i >= len(index['grams']) or index['grams'][i] != trigram_code(gram):
+            return []
+        lists.append(index['postings'][index['indptr'][i]:index['indptr'][i + 1]])
+    lists.sort(key=len)
+    candidates = lists[0]
+    for postings in lists[1:]:
+        candidates = np.intersect1d(candidates, postings, assume_unique=True)
+
+    matches = []
+    for row in index['order'][candidates].tolist():
+        key = ngram_key(index['vocab'][row])
+        # Shared trigrams only select candidates, the substring check is exact
+        if query in key and key != query:
+            matches.append(int(row))
+            if len(matches) >= k:
+                break
+    return matches
+
+def deletes(key, max_distance):
+    # All strings reachable from key by deleting up to max_distance characters
+    result = {key}
+    frontier = {key}
+    for _ in range(max_distance):
+        frontier = {s[:i] + s[i + 1:] for s in frontier for i in range(len(s))}
+        result |= frontier
+    return result
+
+def edit_distance(a, b, max_distance):
+    """
+    Damerau-Levenshtein distance (optimal string alignment), with an early
+    exit once every alignment exceeds max_distance.
+
+    Returns:
+        int: Distance, or max_distance + 1 if it is larger than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+# Deletion hashes are collected as numpy arrays a chunk of keys at a time
+FUZZY_CHUNK_SIZE = 8192
+
+def build_fuzzy_index(vocab, totals, max_distance=2, prefix_length=7, limit=None):
+    """
+    Build a SymSpell-style deletion index for typo-tolerant lookups.
+
+    Every n-gram is indexed under all deletions of up to `max_distance`
+    characters of its prefix. Two strings within `max_distance` edits share
+    at least one such deletion, so a lookup only has to hash the deletions
+    of the query instead of comparing it with the whole vocabulary. The
+    deletion hashes are collected a chunk of keys at a time and kept in a
+    sorted array to stay compact.
+
+    Args:
+        vocab (np.ndarray): N-gram vocabulary, in row order
+        totals (np.ndarray): Total frequency of every row
+        max_distance (int): Maximum edit distance supported by the index
+        prefix_length (int): Number of leading characters that are indexed
+        limit (int): Only index the most frequent n-grams, None for all
+
+    Returns:
+        dict: Sorted deletion hashes, their frequency ranks, rank -> row order and keys
+    """
+    order = np.argsort(-np.asarray(totals), kind="stable")[:limit]
+    keys = [ngram_key(ngram) for ngram in vocab[order].tolist()]
+
+    hashes, ranks = [], []
+    for start in range(0, len(keys), FUZZY_CHUNK_SIZE):
+        chunk = [[hash(deletion) for deletion in deletes(key[:prefix_length], max_distance)]
+                 for key in keys[start:start + FUZZY_CHUNK_SIZE]]
+        counts = [len(key_hashes) for key_hashes in chunk]
+        hashes.append(np.fromiter((h for key_hashes in chunk for h in key_hashes), dtype=np.int64, count=sum(counts)))
+        ranks.append(np.repeat(np.arange(start, start + len(chunk), dtype=np.int32), counts))
+
+    hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.int64)
+    ranks = np.concatenate(ranks) if ranks else np.zeros(0, dtype=np.int32)
+    sort = np.argsort(hashes, kind="stable")
+    return {
+        'hashes': hashes[sort],
+        'ranks': ranks[sort],
+        'order': order,
+        'keys': keys,
+        'lengths': np.array([len(key) for key in keys], dtype=np.int32),
+        'max_distance': max_distance,
+        'prefix_length': prefix_length,
+    }
+
+def search_fuzzy(index, query, k=5, max_distance=2):
+    """
+    "Did you mean" candidates within `max_distance` edits of the query,
+    closest first and then most frequent first. The query itself is excluded.
+
+    Args:
+        index (dict): Index built with build_fuzzy_index
+        query (str): Possibly misspelled n-gram
+        k (int): Maximum number of candidates
+        max_distance (int): Maximum edit distance, at most the one of the index
+
+    Returns:
+        list: Row offsets of the candidates
+    """
+    query = ngram_key(query)
+    if not query:
+        return []
+    max_distance = min(max_distance, index['max_distance'])
+
+    # Candidates share at least one deletion of the prefix with the query
+    lookup = np.array([hash(deletion) for deletion in deletes(query[:index['prefix_length']], max_distance)], dtype=np.int64)
+    start = np.searchsorted(index['hashes'], lookup, side="left")
+    stop = np.searchsorted(index['hashes'], lookup, side="right")
+    candidates = np.unique(np.concatenate([index['ranks'][a:b] for a, b in zip(start, stop)]))
+    candidates = candidates[np.abs(index['lengths'][candidates] - len(query)) <= max_distance]
+
+    # Hash collisions and prefix-only matches are filtered by the exact distance
+    scored = []
+    closest = 0
+    for rank in candidates.tolist():
+        key = index['keys'][rank]
+        if key == query:
+            continue
+        distance = edit_distance(query, key, max_distance)
+        if distance <= max_distance:
+            scored.append((distance, rank))
+            closest += distance == 1
+            # Candidates come in rank order, k at one edit cannot be beaten
+            if closest >= k:
+                break
+    scored.sort()
+    return [int(index['order'][rank]) for _, rank in scored[:k]]
+
+def build_prefix_index(vocab, totals, k=10, precomputed_length=2):
+    """
+    Build a sorted-array prefix index for autocomplete.
+
+    The case-folded keys are sorted, so the completions of a prefix are one
+    contiguous range found by binary search. Short prefixes have the widest
+    ranges, their top-k completions are precomputed (the upper levels of a
+    trie, each storing its best completions).
+
+    Args:
+        vocab (np.ndarray): N-gram vocabulary, in row order
+        totals (np.ndarray): Total frequency of every row
+        k (int): Completions precomputed per short prefix
+        precomputed_length (int): Longest prefix with precomputed completions
+
+    Returns:
+        dict: Sorted keys, key -> row order, totals in key order and the precomputed completions
+    """
+    keys = np.array([ngram_key(ngram) for ngram in vocab.tolist()], dtype=str)
+    order = np.argsort(keys, kind="stable")
+    index = {
+        'keys': keys[order],
+        'order': order,
+        'totals': np.asarray(totals, dtype=np.float64)[order],
+        'top': {},
+        'k': k,
+    }
+    for length in range(1, precomputed_length + 1):
+        for prefix in np.unique(index['keys'].astype(f"<U{length}")).tolist():
+            if len(prefix) == length:
+                index['top'][prefix] = top_completions(index, prefix, k)
+    return index
+
+def top_completions(index, prefix, k):
+    # Most frequent keys in the range that starts with the prefix
+    keys = index['keys']
+    start = int(np.searchsorted(keys, prefix, side="left"))
+    stop = int(np.searchsorted(keys, prefix + "\U0010ffff", side="left"))
+    if start >= stop:
+        return []
+    totals = index['totals'][start:stop]
+    if stop - start > k:
+        best = np.argpartition(-totals, k - 1)[:k]
+    else:
+        best = np.arange(stop - start)
+    best = best[np.lexsort((best, -totals[best]))]
+    return [int(index['order'][start + i]) for i in best]
+
+def complete_prefix(index, prefix, k=10):
+    """
+    Autocomplete a prefix (case-insensitive) with the most frequent n-grams
+    that start with it.
+
+    Args:
+        index (dict): Index built with build_prefix_index
+        prefix (str): Typed prefix
+        k (int): Maximum number of completions
+
+    Returns:
+        list: Row offsets of the completions, most frequent first
+    """
+    prefix = ngram_key(prefix)
+    if not prefix:
+        return []
+    if prefix in index['top'] and k <= index['k']:
+        return index['top'][prefix][:k]
+    return top_completions(index, prefix, k)
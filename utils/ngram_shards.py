@@ -0,0 +1,282 @@
+import os
+import json
+import math
+import pickle
+import shutil
+import hashlib
+import argparse
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from utils.ngram_store import (
+    write_store_chunks,
+    read_store_matrix,
+    read_store_meta,
+    read_store_vocabulary,
+    read_store_fingerprint,
+    QUARTERS_FILE,
+)
+from settings import NGRAM_SHARDS_DIR, SHARD_TARGET_ROWS
+
+# Shard directory and per-shard lookup files
+SHARD_DIRECTORY_FILE = "shards.json"
+KEYS_FILE = "keys.npy"
+KEY_ROWS_FILE = "key_rows.npy"
+
+def ngram_key(ngram):
+    # Case-folded with normalized whitespace, so all spellings land in the same shard
+    return " ".join(str(ngram).split()).casefold()
+
+def ngram_order(ngram):
+    return len(str(ngram).split())
+
+def shard_of(key, n_shards):
+    # Stable across processes and runs, unlike the built-in hash()
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % n_shards
+
+def shard_name(shard_id):
+    return f"shard_{shard_id:05d}"
+
+def sharded_store_path(n, root=NGRAM_SHARDS_DIR):
+    return os.path.join(root, f"n{n}")
+
+def spool_rows(spool_dir, buffers):
+    # Append buffered rows to the per-shard spool files and clear the buffers
+    for shard_id, records in buffers.items():
+        with open(os.path.join(spool_dir, f"{shard_id}.spool"), "ab") as f:
+            pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+    buffers.clear()
+
+def read_spool(spool_dir, shard_id):
+    spool_path = os.path.join(spool_dir, f"{shard_id}.spool")
+    if not os.path.exists(spool_path):
+        return
+    with open(spool_path, "rb") as f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                return
+
+def write_sharded_store(
+    path,
+    chunks,
+    n_rows,
+    quarters,
+    n,
+    mode="float32",
+    index_name="n-gram",
+    leading_empty_quarters=0,
+    target_rows=SHARD_TARGET_ROWS,
+    spool_rows_limit=100000,
+):
+    """
+    Write n-grams to a sharded layout: one store per shard, partitioned by a
+    hash of the case-folded n-gram, plus a shard directory.
+
+    Rows are first spooled to per-shard files on disk, so only one shard is
+    held in memory while it is written. Every shard also gets a sorted key
+    array for binary-search lookups.
+
+    Args:
+        path (str): Target directory for this n (replaced atomically if it exists)
+        chunks (iterable): (ngrams, values) pairs, values is a 2D array with a row per n-gram
+        n_rows (int): Total number of rows over all chunks
+        quarters (list): Quarter labels
+        n (int): N-gram size
+        mode (str): One of "float64", "float32" or "sparse"
+        index_name (str): Name of the n-gram index
+        leading_empty_quarters (int): Number of leading empty quarters trimmed on load
+        target_rows (int): Target number of rows per shard
+        spool_rows_limit (int): Rows buffered in memory before spooling to disk
+    """
+    n_shards = max(1, math.ceil(n_rows / target_rows))
+    quarters = [str(q) for q in quarters]
+
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    spool_dir = os.path.join(tmp_path, "spool")
+    os.makedirs(spool_dir)
+
+    # Partition the rows by shard
+    buffers = defaultdict(list)
+    buffered = 0
+    for ngrams, values in chunks:
+        values = values.toarray() if sparse.issparse(values) else np.asarray(values)
+        for ngram, row in zip(ngrams, values):
+            buffers[shard_of(ngram_key(ngram), n_shards)].append((str(ngram), row))
+            buffered += 1
+        if buffered >= spool_rows_limit:
+            spool_rows(spool_dir, buffers)
+            buffered = 0
+    spool_rows(spool_dir, buffers)
+
+    # Write every shard as a regular store with its lookup keys
+    shards = []
+    for shard_id in range(n_shards):
+        records = list(read_spool(spool_dir, shard_id))
+        ngrams = [ngram for ngram, _ in records]
+        values = np.vstack([row for _, row in records]) if records else np.zeros((0, len(quarters)))
+        del records
+
+        shard_path = os.path.join(tmp_path, shard_name(shard_id))
+        write_store_chunks(
+            shard_path,
+            [(ngrams, values)],
+            n_rows=len(ngrams),
+            quarters=quarters,
+            mode=mode,
+            index_name=index_name,
+            leading_empty_quarters=leading_empty_quarters,
+        )
+
+        keys = np.array([ngram_key(ngram) for ngram in ngrams], dtype=str)
+        order = np.argsort(keys, kind="stable")
+        np.save(os.path.join(shard_path, KEYS_FILE), keys[order])
+        np.save(os.path.join(shard_path, KEY_ROWS_FILE), order.astype(np.int32))
+
+        shards.append({
+            "path": shard_name(shard_id),
+            "rows": len(ngrams),
+            "fingerprint": read_store_fingerprint(shard_path),
+        })
+
+    shutil.rmtree(spool_dir)
+
+    # Version of the whole layout, derived from the shard fingerprints
+    h = hashlib.blake2b(digest_size=16)
+    for shard in shards:
+        h.update(shard["fingerprint"].encode("utf-8"))
+
+    directory = {
+        "n": n,
+        "n_shards": n_shards,
+        "hash": "blake2b-64",
+        "rows": n_rows,
+        "quarters": quarters,
+        "leading_empty_quarters": leading_empty_quarters,
+        "shards": shards,
+        "fingerprint": h.hexdigest(),
+    }
+    with open(os.path.join(tmp_path, SHARD_DIRECTORY_FILE), "w") as f:
+        json.dump(directory, f, indent=2)
+
+    # Swap the finished layout into place
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+def read_shard_directory(path):
+    directory_path = os.path.join(path, SHARD_DIRECTORY_FILE)
+    if not os.path.exists(directory_path):
+        return None
+    with open(directory_path) as f:
+        return json.load(f)
+
+def open_shard(path):
+    """
+    Open one shard for lookups. Every array is memory-mapped, nothing is
+    read until a lookup touches it.
+
+    Args:
+        path (str): Shard store directory
+
+    Returns:
+        dict: Keys, key-to-row mapping, vocabulary, matrix and quarter labels
+    """
+    meta = read_store_meta(path)
+    return {
+        'keys': np.load(os.path.join(path, KEYS_FILE), mmap_mode="r"),
+        'key_rows': np.load(os.path.join(path, KEY_ROWS_FILE), mmap_mode="r"),
+        'vocab': read_store_vocabulary(path),
+        'matrix': read_store_matrix(path),
+        'quarters': np.load(os.path.join(path, QUARTERS_FILE)).tolist(),
+        'leading_empty_quarters': meta.get("leading_empty_quarters", 0),
+    }
+
+def lookup_shard(shard, ngram):
+    """
+    Binary-search an n-gram in a shard and read its row.
+
+    Args:
+        shard (dict): Shard opened with open_shard
+        ngram (str): N-gram to look up (case-insensitive)
+
+    Returns:
+        tuple: (original n-gram, pd.Series) or (None, None) if it is not in the shard
+    """
+    key = ngram_key(ngram)
+    keys = shard['keys']
+    i = int(np.searchsorted(keys, key))
+    if i >= len(keys) or keys[i] != key:
+        return None, None
+
+    row = int(shard['key_rows'][i])
+    values = shard['matrix'][row]
+    values = values.toarray().ravel() if sparse.issparse(values) else np.asarray(values, dtype=np.float64)
+
+    label = str(shard['vocab'][row])
+    leading = shard['leading_empty_quarters']
+    series = pd.Series(values[leading:].astype(np.float64), index=shard['quarters'][leading:], name=label)
+    return label, series
+
+def shard_entry(directory, ngram):
+    # Directory entry (path and fingerprint) of the shard that can hold an n-gram
+    return directory["shards"][shard_of(ngram_key(ngram), directory["n_shards"])]
+
+def find_ngram(path, ngram, directory=None, open_shard=open_shard):
+    """
+    Look up an n-gram in a sharded layout, opening only the shard that holds it.
+
+    Args:
+        path (str): Sharded layout directory for this n
+        ngram (str): N-gram to look up (case-insensitive)
+        directory (dict): Shard directory, read from disk if not given
+        open_shard (callable): Shard opener, e.g. a cached one
+
+    Returns:
+        tuple: (original n-gram, pd.Series) or (None, None) if it is not found
+    """
+    directory = directory or read_shard_directory(path)
+    if directory is None:
+        return None, None
+
+    shard_path = os.path.join(path, shard_entry(directory, ngram)["path"])
+    return lookup_shard(open_shard(shard_path), ngram)
+
+def shard_ngram_frame(df, path, n, mode="float32", leading_empty_quarters=0):
+    """
+    Write an in-memory DataFrame of n-grams to a sharded layout.
+
+    Args:
+        df (pd.DataFrame): DataFrame with n-grams as index and quarters as columns
+        path (str): Target directory for this n
+        n (int): N-gram size
+        mode (str): One of "float64", "float32" or "sparse"
+        leading_empty_quarters (int): Number of leading empty quarters trimmed on load
+    """
+    write_sharded_store(
+        path,
+        [(df.index, df.to_numpy(dtype=np.float64))],
+        n_rows=len(df),
+        quarters=df.columns,
+        n=n,
+        mode=mode,
+        index_name=df.index.name or "n-gram",
+        leading_empty_quarters=leading_empty_quarters,
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shard a pickled DataFrame of n-grams (n>1).")
+    parser.add_argument("source", help="Pickled DataFrame with n-grams as index and quarters as columns")
+    parser.add_argument("-n", type=int, required=True, help="N-gram size")
+    parser.add_argument("--target", default=None, help="Target directory (default: NGRAM_SHARDS_DIR/n<n>)")
+    parser.add_argument("--mode", default="float32", help="Storage mode: float64, float32 or sparse")
+    args = parser.parse_args()
+
+    target = args.target or sharded_store_path(args.n)
+    shard_ngram_frame(pd.read_pickle(args.source), target, args.n, mode=args.mode)
+    print(f"Wrote sharded {args.n}-gram store to {target}")
@@ -0,0 +1,498 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from settings import (
+    NGRAM_PICKLE_PATH,
+    NGRAM_DATASET_PATH,
+    NGRAM_STORAGE_MODE,
+    SPARSE_DENSITY_THRESHOLD,
+    QUARTER_CAPACITY_SLACK,
+    LEADING_EMPTY_QUARTERS,
+)
+
+# File names inside a store directory
+META_FILE = "meta.json"
+MATRIX_FILE = "matrix.npy"
+VOCAB_FILE = "vocab.npy"
+QUARTERS_FILE = "quarters.npy"
+
+# Argsort of the vocabulary, the n-gram -> row offset index
+VOCAB_ORDER_FILE = "vocab_order.npy"
+
+# Offset-encoded vocabulary (UTF-8 bytes back to back) spooled while the rows are written
+VOCAB_SPOOL_FILE = "vocab.spool"
+
+# CSR components for the sparse layout
+CSR_DATA_FILE = "csr_data.npy"
+CSR_INDICES_FILE = "csr_indices.npy"
+CSR_INDPTR_FILE = "csr_indptr.npy"
+
+FORMAT_VERSION = 1
+
+def resolve_storage_mode(values, mode):
+    """
+    Resolve the "auto" storage mode from the share of non-zero values.
+
+    Args:
+        values (np.ndarray): Frequency matrix
+        mode (str): One of "float64", "float32", "sparse" or "auto"
+
+    Returns:
+        str: Concrete storage mode
+    """
+    if mode not in ("float64", "float32", "sparse", "auto"):
+        raise ValueError(f"Unknown storage mode: {mode}")
+    if mode != "auto":
+        return mode
+
+    density = np.count_nonzero(values) / max(values.size, 1)
+    return "sparse" if density < SPARSE_DENSITY_THRESHOLD else "float32"
+
+def sparse_frame(csr, index, columns):
+    """
+    Build a DataFrame with sparse float32 columns (fill value 0) from CSR rows.
+
+    Args:
+        csr (scipy.sparse.csr_matrix): Frequency matrix, row per n-gram
+        index (pd.Index): N-gram labels
+        columns (list): Quarter labels
+
+    Returns:
+        pd.DataFrame: DataFrame with sparse columns
+    """
+    csc = csr.tocsc()
+    data = {
+        column: pd.arrays.SparseArray.from_spmatrix(csc[:, j])
+        for j, column in enumerate(columns)
+    }
+    return pd.DataFrame(data, index=index)
+
+def dense_frame(csr, index, columns, first_column=0, chunk_size=65536):
+    """
+    Build a dense DataFrame from CSR rows, densified a chunk of rows at a time
+    so the CSR arrays can stay memory-mapped and are never copied as a whole.
+
+    Args:
+        csr (scipy.sparse.csr_matrix): Frequency matrix, row per n-gram
+        index (pd.Index): N-gram labels
+        columns (list): Quarter labels, from first_column on
+        first_column (int): Number of leading matrix columns left out
+        chunk_size (int): Number of rows densified at a time
+
+    Returns:
+        pd.DataFrame: DataFrame with dense columns of the matrix dtype
+    """
+    values = np.empty((csr.shape[0], csr.shape[1] - first_column), dtype=csr.dtype)
+    for start in range(0, csr.shape[0], chunk_size):
+        values[start:start + chunk_size] = csr[start:start + chunk_size].toarray()[:, first_column:]
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+def apply_storage_mode(df, mode=NGRAM_STORAGE_MODE):
+    """
+    Convert an in-memory DataFrame to the given storage mode.
+
+    Args:
+        df (pd.DataFrame): DataFrame with n-grams as index and quarters as columns
+        mode (str): One of "float64", "float32", "sparse" or "auto"
+
+    Returns:
+        pd.DataFrame: DataFrame with dense float or sparse columns
+    """
+    mode = resolve_storage_mode(df.values, mode)
+    if mode == "sparse":
+        csr = sparse.csr_matrix(df.to_numpy(dtype=np.float32))
+        return sparse_frame(csr, df.index, df.columns.tolist())
+    return df.astype(np.dtype(mode))
+
+def write_ngram_store(df, path, mode=NGRAM_STORAGE_MODE, leading_empty_quarters=LEADING_EMPTY_QUARTERS):
+    """
+    Write a DataFrame (n-grams as index, quarters as columns) to an on-disk store.
+
+    The store is a directory holding the numeric matrix, the n-gram vocabulary
+    and the quarter labels as separate .npy files, so all of them can be
+    memory-mapped without unpickling. Dense modes store one C-contiguous matrix
+    with QUARTER_CAPACITY_SLACK spare columns for appending quarters in place,
+    the sparse mode stores the CSR rows as three arrays.
+
+    Args:
+        df (pd.DataFrame): DataFrame with n-grams as index and quarters as columns
+        path (str): Target store directory (replaced atomically if it exists)
+        mode (str): One of "float64", "float32", "sparse" or "auto"
+        leading_empty_quarters (int): Number of leading empty quarters trimmed on load
+    """
+    values = df.to_numpy(dtype=np.float64)
+    write_store_chunks(
+        path,
+        [(df.index, values)],
+        n_rows=values.shape[0],
+        quarters=df.columns,
+        mode=resolve_storage_mode(values, mode),
+        index_name=df.index.name,
+        leading_empty_quarters=leading_empty_quarters,
+    )
+
+def spool_vocabulary(spool, spooled, ngrams):
+    """
+    Append a chunk of n-grams to the offset-encoded vocabulary spool.
+
+    Args:
+        spool (file): Spool opened for binary writing
+        spooled (dict): 'lengths' (byte length arrays, one per chunk) and
+            'width' (longest n-gram in characters), updated in place
+        ngrams (iterable): N-grams of the chunk
+    """
+    ngrams = [str(ngram) for ngram in ngrams]
+    encoded = [ngram.encode("utf-8") for ngram in ngrams]
+    spool.write(b"".join(encoded))
+    spooled['lengths'].append(np.array([len(e) for e in encoded], dtype=np.int64))
+    spooled['width'] = max(spooled['width'], max(map(len, ngrams), default=0))
+
+def write_vocabulary(path, spool_path, lengths, width, chunk_size=65536):
+    """
+    Write the vocabulary .npy from the spool, a chunk of n-grams at a time,
+    straight into a memory-mapped fixed-width unicode array.
+
+    Args:
+        path (str): Output .npy file
+        spool_path (str): Spool written with spool_vocabulary
+        lengths (np.ndarray): Byte length of every n-gram, in row order
+        width (int): Longest n-gram in characters
+        chunk_size (int): Number of n-grams decoded at a time
+
+    Returns:
+        np.memmap: The written vocabulary
+    """
+    vocab = np.lib.format.open_memmap(path, mode="w+", dtype=f"<U{max(width, 1)}", shape=(len(lengths),))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    with open(spool_path, "rb") as f:
+        for start in range(0, len(lengths), chunk_size):
+            stop = min(start + chunk_size, len(lengths))
+            data = f.read(int(offsets[stop] - offsets[start]))
+            bounds = (offsets[start:stop + 1] - offsets[start]).tolist()
+            vocab[start:stop] = [data[a:b].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])]
+    vocab.flush()
+    return vocab
+
+def write_store_chunks(path, chunks, n_rows, quarters, mode, index_name=None, leading_empty_quarters=0):
+    """
+    Write a store from consecutive row chunks, so the full matrix never has to
+    be in memory at once.
+
+    Args:
+        path (str): Target store directory (replaced atomically if it exists)
+        chunks (iterable): (ngrams, values) pairs, values is a 2D array with a row per n-gram
+        n_rows (int): Total number of rows over all chunks
+        quarters (list): Quarter labels
+        mode (str): One of "float64", "float32" or "sparse"
+        index_name (str): Name of the n-gram index
+        leading_empty_quarters (int): Number of leading empty quarters trimmed on load
+    """
+    if mode not in ("float64", "float32", "sparse"):
+        raise ValueError(f"Unknown storage mode: {mode}")
+
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    n_quarters = len(quarters)
+    # The vocabulary is spooled chunk by chunk, the full list is never held in memory
+    spool_path = os.path.join(tmp_path, VOCAB_SPOOL_FILE)
+    spooled = {'lengths': [], 'width': 0}
+
+    with open(spool_path, "wb") as spool:
+        if mode == "sparse":
+            # Compressed rows, float32 values and int32 column indices
+            data, indices, indptr = [], [], [np.zeros(1, dtype=np.int64)]
+            for ngrams, values in chunks:
+                csr = sparse.csr_matrix(np.asarray(values, dtype=np.float32))
+                data.append(csr.data)
+                indices.append(csr.indices.astype(np.int32))
+                indptr.append(csr.indptr[1:].astype(np.int64) + indptr[-1][-1])
+                spool_vocabulary(spool, spooled, ngrams)
+            np.save(os.path.join(tmp_path, CSR_DATA_FILE), np.concatenate(data) if data else np.zeros(0, dtype=np.float32))
+            np.save(os.path.join(tmp_path, CSR_INDICES_FILE), np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32))
+            np.save(os.path.join(tmp_path, CSR_INDPTR_FILE), np.concatenate(indptr))
+            dtype = "float32"
+        else:
+            # Numeric matrix, row per n-gram, spare columns stay zero
+            capacity = n_quarters + QUARTER_CAPACITY_SLACK
+            matrix = np.lib.format.open_memmap(
+                os.path.join(tmp_path, MATRIX_FILE), mode="w+", dtype=np.dtype(mode), shape=(n_rows, capacity)
+            )
+            row = 0
+            for ngrams, values in chunks:
+                matrix[row:row + len(values), :n_quarters] = values
+                row += len(values)
+                spool_vocabulary(spool, spooled, ngrams)
+            matrix.flush()
+            del matrix
+            dtype = mode
+
+    lengths = np.concatenate(spooled['lengths']) if spooled['lengths'] else np.zeros(0, dtype=np.int64)
+    if len(lengths) != n_rows:
+        raise ValueError(f"Expected {n_rows} rows, got {len(lengths)}")
+
+    # Fixed-width unicode arrays can be loaded without pickle and memory-mapped
+    vocab = write_vocabulary(os.path.join(tmp_path, VOCAB_FILE), spool_path, lengths, spooled['width'])
+    os.remove(spool_path)
+    np.save(os.path.join(tmp_path, VOCAB_ORDER_FILE), np.argsort(vocab, kind="stable").astype(np.int64))
+    del vocab
+    np.save(os.path.join(tmp_path, QUARTERS_FILE), np.array([str(c) for c in quarters], dtype=str))
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "layout": "csr" if mode == "sparse" else "dense",
+        "shape": [n_rows, n_quarters],
+        "dtype": dtype,
+        "index_name": index_name,
+        "leading_empty_quarters": leading_empty_quarters,
+        "version": 1,
+    }
+    if mode != "sparse":
+        meta["capacity"] = capacity
+    write_store_meta(tmp_path, meta)
+
+    # Content fingerprint, used as the dataset version token by every cache
+    meta["fingerprint"] = compute_store_fingerprint(tmp_path)
+    write_store_meta(tmp_path, meta)
+
+    # Swap the finished store into place
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+def read_store_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+def write_store_meta(path, meta):
+    # Replace atomically so readers never see a partial file
+    tmp_file = os.path.join(path, f"{META_FILE}.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_file, os.path.join(path, META_FILE))
+
+def replace_store_array(path, name, array):
+    # Write next to the target and swap it in, so open memory maps stay valid
+    tmp_file = os.path.join(path, f"{name}.tmp")
+    with open(tmp_file, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_file, os.path.join(path, name))
+
+def fingerprint_arrays(vocab, quarters, matrix, chunk_size=65536):
+    """
+    Content fingerprint of a frequency matrix with its labels.
+
+    Args:
+        vocab (np.ndarray): N-gram vocabulary
+        quarters (list): Quarter labels
+        matrix (np.ndarray or scipy.sparse.csr_matrix): Frequency matrix, row per n-gram
+        chunk_size (int): Rows hashed at a time
+
+    Returns:
+        str: Hex digest
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update("\n".join(str(q) for q in quarters).encode("utf-8"))
+
+    for start in range(0, len(vocab), chunk_size):
+        h.update(np.ascontiguousarray(vocab[start:start + chunk_size]).tobytes())
+
+    if sparse.issparse(matrix):
+        h.update(np.ascontiguousarray(matrix.indptr).tobytes())
+        h.update(np.ascontiguousarray(matrix.indices).tobytes())
+        h.update(np.ascontiguousarray(matrix.data).tobytes())
+    else:
+        h.update(str(matrix.dtype).encode("utf-8"))
+        for start in range(0, matrix.shape[0], chunk_size):
+            h.update(np.ascontiguousarray(matrix[start:start + chunk_size]).tobytes())
+    return h.hexdigest()
+
+def compute_store_fingerprint(path):
+    return fingerprint_arrays(
+        read_store_vocabulary(path),
+        np.load(os.path.join(path, QUARTERS_FILE)).tolist(),
+        read_store_matrix(path),
+    )
+
+def read_store_fingerprint(path):
+    """
+    Read the content fingerprint of a store from its metadata. Stores written
+    before fingerprints existed get one computed once and saved.
+
+    Args:
+        path (str): Store directory
+
+    Returns:
+        str: Dataset version token
+    """
+    meta = read_store_meta(path)
+    if "fingerprint" not in meta:
+        meta["fingerprint"] = compute_store_fingerprint(path)
+        try:
+            write_store_meta(path, meta)
+        except OSError:
+            pass
+    return meta["fingerprint"]
+
+def read_store_leading_quarters(path):
+    # Stores converted from the original pickle start with empty quarters
+    return read_store_meta(path).get("leading_empty_quarters", LEADING_EMPTY_QUARTERS)
+
+def read_store_vocabulary(path):
+    return np.load(os.path.join(path, VOCAB_FILE), mmap_mode="r")
+
+def read_store_vocabulary_order(path):
+    """
+    Read the argsort of the store vocabulary, computing it for stores written
+    before it was saved.
+
+    Args:
+        path (str): Store directory
+
+    Returns:
+        np.ndarray: Row offsets in sorted n-gram order
+    """
+    order_path = os.path.join(path, VOCAB_ORDER_FILE)
+    if os.path.exists(order_path):
+        return np.load(order_path, mmap_mode="r")
+    return np.argsort(read_store_vocabulary(path), kind="stable")
+
+def read_store_matrix(path):
+    """
+    Read the logical frequency matrix of a store without densifying it.
+
+    Args:
+        path (str): Store directory written by write_ngram_store
+
+    Returns:
+        np.ndarray or scipy.sparse.csr_matrix: Read-only matrix, row per n-gram
+    """
+    meta = read_store_meta(path)
+    if meta.get("layout") == "csr":
+        return sparse.csr_matrix(
+            (
+                np.load(os.path.join(path, CSR_DATA_FILE), mmap_mode="r"),
+                np.load(os.path.join(path, CSR_INDICES_FILE), mmap_mode="r"),
+                np.load(os.path.join(path, CSR_INDPTR_FILE), mmap_mode="r"),
+            ),
+            shape=tuple(meta["shape"]),
+        )
+
+    # Spare capacity columns are sliced away as a view
+    matrix = np.load(os.path.join(path, MATRIX_FILE), mmap_mode="r")
+    return matrix[:, :meta["shape"][1]]
+
+def grow_store_capacity(path, meta, capacity):
+    """
+    Rewrite the dense matrix of a store with more spare quarter columns.
+
+    Readers that still map the old file keep seeing it until they reopen the store.
+
+    Args:
+        path (str): Store directory
+        meta (dict): Store metadata, updated in place
+        capacity (int): New number of allocated quarter columns
+    """
+    old = np.load(os.path.join(path, MATRIX_FILE), mmap_mode="r")
+    n_rows, n_quarters = meta["shape"]
+
+    tmp_file = os.path.join(path, f"{MATRIX_FILE}.tmp")
+    matrix = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=old.dtype, shape=(n_rows, capacity))
+
+    # Copy in row chunks to keep memory bounded
+    chunk = 65536
+    for start in range(0, n_rows, chunk):
+        matrix[start:start + chunk, :n_quarters] = old[start:start + chunk, :n_quarters]
+    matrix.flush()
+    del matrix, old
+
+    os.replace(tmp_file, os.path.join(path, MATRIX_FILE))
+    meta["capacity"] = capacity
+
+def append_quarter(path, quarter, values):
+    """
+    Append one quarter column to a store in place and bump its version.
+
+    Dense stores write into a spare column of the memory-mapped matrix and only
+    grow the file once the spare capacity is used up. Sparse stores rebuild the
+    CSR arrays, which is O(non-zero values).
+
+    Args:
+        path (str): Store directory
+        quarter (str): Label of the new quarter, e.g. "2025Q1"
+        values (np.ndarray): Frequencies of the new quarter, aligned to the store vocabulary
+
+    Returns:
+        dict: Updated store metadata
+    """
+    previous_fingerprint = read_store_fingerprint(path)
+    meta = read_store_meta(path)
+    n_rows, n_quarters = meta["shape"]
+
+    column = np.asarray(values, dtype=np.float64)
+    if column.shape != (n_rows,):
+        raise ValueError(f"Expected {n_rows} values for the new quarter, got {column.shape[0]}")
+
+    quarters = np.load(os.path.join(path, QUARTERS_FILE)).tolist()
+    if quarter in quarters:
+        raise ValueError(f"Quarter {quarter} is already in the store")
+
+    if meta.get("layout") == "csr":
+        # Add the column and rewrite the compressed rows
+        new_column = sparse.csr_matrix(column.astype(np.float32).reshape(-1, 1))
+        csr = sparse.hstack([read_store_matrix(path), new_column], format="csr")
+        replace_store_array(path, CSR_DATA_FILE, csr.data.astype(np.float32))
+        replace_store_array(path, CSR_INDICES_FILE, csr.indices.astype(np.int32))
+        replace_store_array(path, CSR_INDPTR_FILE, csr.indptr.astype(np.int64))
+    else:
+        if n_quarters >= meta.get("capacity", n_quarters):
+            grow_store_capacity(path, meta, n_quarters + max(QUARTER_CAPACITY_SLACK, 1))
+
+        matrix = np.load(os.path.join(path, MATRIX_FILE), mmap_mode="r+")
+        matrix[:, n_quarters] = column
+        matrix.flush()
+        del matrix
+
+    replace_store_array(path, QUARTERS_FILE, np.array(quarters + [quarter]))
+
+    # Chain the fingerprint with the new column instead of rehashing the whole matrix
+    h = hashlib.blake2b(digest_size=16)
+    h.update(previous_fingerprint.encode("utf-8"))
+    h.update(quarter.encode("utf-8"))
+    h.update(column.astype(np.dtype(meta["dtype"])).tobytes())
+
+    meta["shape"] = [n_rows, n_quarters + 1]
+    meta["version"] = meta.get("version", 1) + 1
+    meta["fingerprint"] = h.hexdigest()
+    write_store_meta(path, meta)
+    return meta
+
+def convert_pickle(pickle_path, path, mode=NGRAM_STORAGE_MODE):
+    """
+    Convert the pickled n-gram DataFrame into an on-disk store.
+
+    Args:
+        pickle_path (str): Path to the pickled DataFrame
+        path (str): Target store directory
+        mode (str): One of "float64", "float32", "sparse" or "auto"
+    """
+    df = pd.read_pickle(pickle_path)
+    write_ngram_store(df, path, mode=mode)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the pickled n-gram dataset to the memory-mapped store.")
+    parser.add_argument("--source", default=NGRAM_PICKLE_PATH, help="Pickled DataFrame to convert")
+    parser.add_argument("--target", default=NGRAM_DATASET_PATH, help="Store directory to write")
+    parser.add_argument("--mode", default=NGRAM_STORAGE_MODE, help="Storage mode: float64, float32, sparse or auto")
+    args = parser.parse_args()
+
+    convert_pickle(args.source, args.target, mode=args.mode)
+    print(f"Wrote n-gram store to {args.target}")
@@ -0,0 +1,312 @@
+import os
+import re
+import gzip
+import json
+import heapq
+import pickle
+import shutil
+import argparse
+import tempfile
+import itertools
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from utils.ngram_store import write_store_chunks
+from utils.ngram_shards import write_sharded_store, sharded_store_path
+from settings import RAW_CORPUS_DIR, NGRAM_DATASET_PATH
+
+TOKEN_PATTERN = re.compile(r"\w+(?:['-]\w+)*")
+
+def open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+def read_documents(paths):
+    """
+    Stream (timestamp, text) pairs from raw corpus files.
+
+    Supported formats are JSON lines with "timestamp" and "text" fields
+    (.jsonl) and tab-separated "timestamp<TAB>text" lines (.tsv), optionally
+    gzip-compressed.
+
+    Args:
+        paths (list): Corpus files
+
+    Yields:
+        tuple: (timestamp, text)
+    """
+    for path in paths:
+        is_json = ".jsonl" in os.path.basename(path)
+        with open_text(path) as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line:
+                    continue
+                if is_json:
+                    doc = json.loads(line)
+                    yield doc["timestamp"], doc["text"]
+                else:
+                    timestamp, _, text = line.partition("\t")
+                    yield timestamp, text
+
+def list_corpus_files(source):
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.endswith((".jsonl", ".tsv", ".jsonl.gz", ".tsv.gz"))
+        )
+    return [source]
+
+def quarter_of(timestamp):
+    # ISO dates and datetimes, e.g. "2021-05-03" or "2021-05-03T10:00:00"
+    year, month = int(timestamp[:4]), int(timestamp[5:7])
+    return f"{year}Q{(month - 1) // 3 + 1}"
+
+def quarter_range(first, last):
+    # All quarters between first and last, so the series are evenly spaced
+    year, quarter = int(first[:4]), int(first[5:])
+    quarters = []
+    while True:
+        label = f"{year}Q{quarter}"
+        quarters.append(label)
+        if label == last:
+            return quarters
+        quarter += 1
+        if quarter > 4:
+            quarter = 1
+            year += 1
+
+def extract_ngrams(text, n, lowercase=True):
+    tokens = TOKEN_PATTERN.findall(text.lower() if lowercase else text)
+    if n == 1:
+        return tokens
+    return [" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+
+def count_batch(batch, n, lowercase):
+    """
+    Map step: count the n-grams of a batch of documents per quarter.
+
+    Args:
+        batch (list): (timestamp, text) pairs
+        n (int): N-gram size
+        lowercase (bool): Whether to lowercase the text before tokenizing
+
+    Returns:
+        dict: Quarter -> Counter of n-grams
+    """
+    counts = defaultdict(Counter)
+    for timestamp, text in batch:
+        try:
+            quarter = quarter_of(timestamp)
+        except (ValueError, TypeError):
+            continue
+        counts[quarter].update(extract_ngrams(text, n, lowercase))
+    return counts
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def map_counts(documents, n, lowercase=True, processes=None, batch_size=1000, max_in_flight=None):
+    """
+    Tokenize a document stream in a process pool.
+
+    At most `max_in_flight` batches are queued at a time, so the stream is
+    consumed only as fast as the workers can keep up.
+
+    Yields:
+        dict: Partial counts of one batch, quarter -> Counter of n-grams
+    """
+    processes = processes or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * processes
+    batches = batched(documents, batch_size)
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = set()
+        for batch in batches:
+            pending.add(pool.submit(count_batch, batch, n, lowercase))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+def spill_run(counts, run_dir, block_size=10000):
+    """
+    Write accumulated counts to a sorted run file in blocks of records.
+
+    Args:
+        counts (dict): (n-gram, quarter) -> count
+        run_dir (str): Directory for run files
+        block_size (int): Records per pickled block
+
+    Returns:
+        str: Path of the run file
+    """
+    fd, run_path = tempfile.mkstemp(suffix=".run", dir=run_dir)
+    with os.fdopen(fd, "wb") as f:
+        for block in batched(sorted(counts.items()), block_size):
+            pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return run_path
+
+def read_run(run_path):
+    with open(run_path, "rb") as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+def reduce_counts(partials, run_dir, spill_size=1_000_000):
+    """
+    Reduce step: merge partial counts and spill them to sorted runs on disk
+    whenever `spill_size` distinct (n-gram, quarter) keys are held in memory.
+
+    Returns:
+        tuple: (run paths, total n-gram count per quarter)
+    """
+    runs = []
+    totals = Counter()
+    counts = Counter()
+
+    for partial in partials:
+        for quarter, quarter_counts in partial.items():
+            totals[quarter] += sum(quarter_counts.values())
+            for ngram, count in quarter_counts.items():
+                counts[(ngram, quarter)] += count
+        if len(counts) >= spill_size:
+            runs.append(spill_run(counts, run_dir))
+            counts = Counter()
+
+    if counts:
+        runs.append(spill_run(counts, run_dir))
+    return runs, totals
+
+def merge_runs(runs):
+    """
+    K-way merge of sorted runs, grouping the counts of each n-gram.
+
+    Yields:
+        tuple: (n-gram, dict of quarter -> count)
+    """
+    merged = heapq.merge(*(read_run(run) for run in runs))
+    for ngram, records in itertools.groupby(merged, key=lambda record: record[0][0]):
+        quarter_counts = Counter()
+        for (_, quarter), count in records:
+            quarter_counts[quarter] += count
+        yield ngram, quarter_counts
+
+def store_chunks(runs, quarters, totals, min_count, normalize, chunk_size=65536):
+    """
+    Turn the merged runs into (ngrams, values) row chunks for the store writer.
+
+    Yields:
+        tuple: (list of n-grams, 2D array with a row per n-gram)
+    """
+    column = {quarter: i for i, quarter in enumerate(quarters)}
+    scale = np.array([1.0 / totals[q] if normalize and totals[q] else 1.0 for q in quarters])
+
+    ngrams, rows = [], []
+    for ngram, quarter_counts in merge_runs(runs):
+        if sum(quarter_counts.values()) < min_count:
+            continue
+        row = np.zeros(len(quarters))
+        for quarter, count in quarter_counts.items():
+            row[column[quarter]] = count
+        ngrams.append(ngram)
+        rows.append(row * scale)
+        if len(rows) >= chunk_size:
+            yield ngrams, np.vstack(rows)
+            ngrams, rows = [], []
+    if rows:
+        yield ngrams, np.vstack(rows)
+
+def preprocess_corpus(
+    sources,
+    target,
+    n=1,
+    min_count=5,
+    lowercase=True,
+    normalize=True,
+    mode="float32",
+    processes=None,
+    batch_size=1000,
+    spill_size=1_000_000,
+):
+    """
+    Build an n-gram store from a raw timestamped corpus.
+
+    Documents are streamed, tokenized in a process pool, counted per quarter
+    and merged map-reduce style through sorted runs on disk, so memory stays
+    bounded by the batch queue and the spill size, not by the corpus size.
+    Unigrams are written as a single store, longer n-grams as a sharded layout.
+
+    Args:
+        sources (list): Corpus files (.jsonl / .tsv, optionally .gz)
+        target (str): Store directory to write
+        n (int): N-gram size
+        min_count (int): Minimum total count for an n-gram to be kept
+        lowercase (bool): Whether to lowercase the text before tokenizing
+        normalize (bool): Divide counts by the total n-gram count of each quarter
+        mode (str): One of "float64", "float32" or "sparse"
+        processes (int): Number of worker processes (default: CPU count)
+        batch_size (int): Documents per worker task
+        spill_size (int): Distinct (n-gram, quarter) keys held before spilling a run
+
+    Returns:
+        dict: Number of n-grams and quarters written
+    """
+    run_dir = tempfile.mkdtemp(prefix="ngram_runs_", dir=os.path.dirname(os.path.abspath(target)))
+    try:
+        partials = map_counts(read_documents(sources), n, lowercase, processes, batch_size)
+        runs, totals = reduce_counts(partials, run_dir, spill_size)
+        if not totals:
+            raise ValueError("No documents with a valid timestamp were found")
+
+        quarters = quarter_range(min(totals), max(totals))
+
+        # First pass over the runs only counts the rows that are kept
+        n_rows = sum(
+            1 for _, quarter_counts in merge_runs(runs)
+            if sum(quarter_counts.values()) >= min_count
+        )
+
+        chunks = store_chunks(runs, quarters, totals, min_count, normalize)
+        if n > 1:
+            write_sharded_store(target, chunks, n_rows=n_rows, quarters=quarters, n=n, mode=mode)
+        else:
+            write_store_chunks(target, chunks, n_rows=n_rows, quarters=quarters, mode=mode, index_name="n-gram")
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    return {'ngrams': n_rows, 'quarters': len(quarters)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the n-gram store from a raw timestamped corpus.")
+    parser.add_argument("--source", default=RAW_CORPUS_DIR, help="Corpus file or directory of .jsonl/.tsv files")
+    parser.add_argument("--target", default=None, help="Store directory to write (default depends on n)")
+    parser.add_argument("-n", type=int, default=1, help="N-gram size")
+    parser.add_argument("--min-count", type=int, default=5, help="Minimum total count to keep an n-gram")
+    parser.add_argument("--mode", default="float32", help="Storage mode: float64, float32 or sparse")
+    parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--keep-case", action="store_true", help="Do not lowercase the text")
+    args = parser.parse_args()
+
+    target = args.target or (NGRAM_DATASET_PATH if args.n == 1 else sharded_store_path(args.n))
+    result = preprocess_corpus(
+        list_corpus_files(args.source),
+        target,
+        n=args.n,
+        min_count=args.min_count,
+        lowercase=not args.keep_case,
+        mode=args.mode,
+        processes=args.processes,
+    )
+    print(f"Wrote {result['ngrams']} n-grams over {result['quarters']} quarters to {target}")
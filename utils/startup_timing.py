@@ -0,0 +1,61 @@
+import time
+import importlib
+from contextlib import contextmanager
+
+# Set when the app script is first imported in this process
+BOOT_TIME = time.perf_counter()
+
+# Phase name -> seconds, only the first (cold) measurement per process is kept
+TIMINGS = {}
+
+_reported = False
+
+@contextmanager
+def timed(phase):
+    """
+    Measure a startup phase, e.g. a block of imports or the data load.
+
+    Args:
+        phase (str): Name shown in the startup report
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIMINGS.setdefault(phase, time.perf_counter() - start)
+
+def lazy_import(name):
+    """
+    Import a heavy module on first use and record how long the cold import took.
+
+    Args:
+        name (str): Module name, e.g. "statsmodels.tsa.holtwinters"
+
+    Returns:
+        module: The imported module
+    """
+    phase = f"lazy import {name}"
+    if phase in TIMINGS:
+        return importlib.import_module(name)
+    with timed(phase):
+        return importlib.import_module(name)
+
+def startup_report():
+    """
+    Timings of all measured phases, in the order they were recorded.
+
+    Returns:
+        list: (phase, seconds) pairs
+    """
+    return list(TIMINGS.items())
+
+def log_startup_report():
+    # Printed once per process, so every boot shows up in the container logs
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    TIMINGS.setdefault("boot to first render", time.perf_counter() - BOOT_TIME)
+    print("Startup timing:")
+    for phase, seconds in startup_report():
+        print(f"  {phase:<45} {seconds * 1000:8.1f} ms")